@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.auth.hasher import hash_pool
+from app.auth.principal import principal_cache
+from app.config import db_settings
+from app.db import pool_statuses, run_db, get_db, get_sync_db
+from app.kpi.columnar import columnar_kpi
+from app.logs import partitions
+from app.metrics import slow_query_log
+from app.tasks.router import get_current_user
+from app.stream import stream_hub
+from app.jobs.runner import job_runner
+from app.traffic import traffic_recorder
+
+router = APIRouter()
+
+
+def require_admin(current_user=Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(403, "Admin only")
+    return current_user
+
+
+# ---------------------------
+# コネクションプール状況
+# ---------------------------
+@router.get("/db/pool")
+async def db_pool(current_user=Depends(require_admin)):
+    """
+    プール設定・使用中接続数・overflow・checkout 待ち時間ヒストグラム
+    """
+    return {"settings": db_settings.public(), "pools": pool_statuses()}
+
+
+# ---------------------------
+# activity_logs パーティション
+# ---------------------------
+@router.get("/db/partitions")
+async def log_partitions(db=Depends(get_db), current_user=Depends(require_admin)):
+    return await run_db(db, partitions.status)
+
+
+# ---------------------------
+# スロークエリ
+# ---------------------------
+@router.get("/db/slow-queries")
+async def slow_queries(current_user=Depends(require_admin)):
+    """
+    DB_SLOW_QUERY_MS を超えた SQL（テンプレート・ルート別）
+    """
+    return {"threshold_ms": db_settings.slow_query_ms, **slow_query_log.snapshot()}
+
+
+# ---------------------------
+# 認証キャッシュ
+# ---------------------------
+@router.get("/auth/principal-cache")
+async def principal_cache_stats(current_user=Depends(require_admin)):
+    return principal_cache.stats()
+
+
+@router.get("/auth/hash-pool")
+async def hash_pool_stats(current_user=Depends(require_admin)):
+    return hash_pool.stats()
+
+
+# ---------------------------
+# カラム型 KPI エンジン
+# ---------------------------
+@router.get("/kpi/engine")
+async def kpi_engine_stats(current_user=Depends(require_admin)):
+    return columnar_kpi.stats()
+
+
+@router.post("/kpi/engine/reload")
+def kpi_engine_reload(db=Depends(get_sync_db), current_user=Depends(require_admin)):
+    """
+    他プロセス（seed CLI・別ワーカー）の書き込みを取り込む
+    """
+    if not columnar_kpi.enabled:
+        raise HTTPException(409, "KPI_ENGINE is not columnar")
+    columnar_kpi.load(db)
+    return columnar_kpi.stats()
+
+
+# ---------------------------
+# トラフィック記録
+# ---------------------------
+@router.get("/traffic")
+async def traffic_stats(current_user=Depends(require_admin)):
+    return traffic_recorder.stats()
+
+
+# ---------------------------
+# ライブフィード
+# ---------------------------
+@router.get("/stream")
+async def stream_stats(current_user=Depends(require_admin)):
+    return stream_hub.stats()
+
+
+# ---------------------------
+# バックグラウンドジョブ（このワーカーのスレッドプール）
+# ---------------------------
+@router.get("/jobs")
+async def job_runner_stats(current_user=Depends(require_admin)):
+    return job_runner.stats()
@@ -0,0 +1,117 @@
+"""
+Bounded process pool for Argon2 hashing.
+
+Argon2 is deliberately slow and memory-hard. Run in the request
+threadpool, a burst of logins takes every thread and unrelated requests
+queue behind them. Instead, hashing runs in HASH_WORKERS worker
+processes, and at most HASH_MAX_PENDING hashes may be queued or running
+at once. Past that, submit() raises HashPoolBusy straight away, and the
+route answers 503 with a Retry-After of about the recent submit-to-result
+latency.
+
+HASH_WORKERS=0 disables the process pool: hashes then run in the
+threadpool as before, still under the same admission limit.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import service
+
+
+class HashPoolBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"hash pool full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class HashPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._avg_latency = 0.3  # 投入〜完了までの秒数（EWMA）
+
+        self.completed = 0
+        self.rejected = 0
+
+    # ---------------------------
+    # ライフサイクル
+    # ---------------------------
+    def start(self):
+        if self.workers <= 0 or self._executor is not None:
+            return
+        # spawn：ログバッファ等のスレッドを持つ親プロセスを fork しない
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # ワーカー起動（import）を最初のログインに払わせない
+        for f in [self._executor.submit(service.hash_password, "warm-up") for _ in range(self.workers)]:
+            f.result()
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    # ---------------------------
+    # 実行（受付制御つき）
+    # ---------------------------
+    def retry_after(self) -> int:
+        # 直近の待ち＋計算時間：その頃には満杯のキューが一巡している
+        return max(1, math.ceil(self._avg_latency))
+
+    async def submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HashPoolBusy(self.retry_after())
+            self._pending += 1
+
+        start = time.perf_counter()
+        try:
+            if self._executor is None:
+                return await run_in_threadpool(fn, *args)
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+                self._avg_latency = 0.8 * self._avg_latency + 0.2 * elapsed
+
+    async def hash_password(self, password: str) -> str:
+        return await self.submit(service.hash_password, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        return await self.submit(service.verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "mode": "process" if self._executor is not None else "thread",
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_latency": round(self._avg_latency, 4),
+            }
+
+
+_workers = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+
+hash_pool = HashPool(
+    workers=_workers,
+    max_pending=int(os.getenv("HASH_MAX_PENDING", str(max(_workers, 1) * 4))),
+)
@@ -0,0 +1,165 @@
+"""
+Authenticated-principal cache for get_current_user.
+
+A verified token maps to a small Principal (id, username, role). The
+token string is the key: it already embeds the user id, and a byte-equal
+token has already passed signature verification, so a hit skips both
+jwt.decode() and the users lookup. Entries live until the earlier of
+PRINCIPAL_CACHE_TTL seconds and the token's own exp.
+
+Entries are indexed by user id. When a flush changes a user's role or
+password_hash, that user's entries are dropped after the commit, and
+the user's generation moves on. A request that read the old row before
+the commit captured the older generation, so its set() is ignored and
+the stale role is not cached again. A rollback forgets the pending
+invalidation along with the change.
+
+Invalidation is per process. Other uvicorn workers keep their entries
+for that user, so a demoted admin keeps admin rights there for up to
+PRINCIPAL_CACHE_TTL. Keep the TTL short, or use PRINCIPAL_CACHE_SIZE=0
+where that matters. Writes that bypass the ORM (raw UPDATE users ...)
+are not seen either: call principal_cache.clear(), or wait out the TTL.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import User
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    role: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, username=user.username, role=user.role)
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._data: OrderedDict = OrderedDict()  # token -> (principal, expires_at)
+        self._by_user: dict[int, set[str]] = {}
+        # invalidate_user のたびに進む（KpiCache と同じ）。読み込み中に進んだら保存しない
+        self._generations: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Principal | None:
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._discard(token)
+                self.misses += 1
+                return None
+            self._data.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, user_id: int) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def set(self, token: str, principal: Principal, exp: float | None = None, generation: int | None = None):
+        """
+        Cache `principal`. If `generation` is given and the user was
+        invalidated since it was read, the principal may be stale and is
+        dropped.
+        """
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+
+        with self._lock:
+            if generation is not None and generation != self._generations.get(principal.id, 0):
+                return
+            self._discard(token)
+            self._data[token] = (principal, expires_at)
+            self._by_user.setdefault(principal.id, set()).add(token)
+            while len(self._data) > self.maxsize:
+                self._discard(next(iter(self._data)))
+
+    def _discard(self, token: str):
+        entry = self._data.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user.get(entry[0].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[entry[0].id]
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for token in list(self._by_user.get(user_id, ())):
+                self._discard(token)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "users": len(self._by_user),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60")),
+)
+
+
+# ---------------------------
+# 権限・パスワード変更で無効化
+# ---------------------------
+_PENDING = "principal_cache_invalidate"
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.password_hash.history.has_changes():
+        state.session.info.setdefault(_PENDING, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop(_PENDING, ()):
+        principal_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    # 変更は取り消された：次のコミットで無効化しない
+    session.info.pop(_PENDING, None)
+
@@ -1,45 +1,79 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from app.db import get_db
+from app.db import get_db, run_db
 from app.models import User
 from app.schemas import UserCreate
-from app.auth.service import hash_password, verify_password, create_access_token
+from app.auth.service import create_access_token
+from app.auth.hasher import hash_pool, HashPoolBusy
 from app.schemas import TokenResponse,LoginRequest
 
 router = APIRouter()
 
+
+async def run_hash(coro):
+    # 満杯なら待たせずに 503：他の API をハッシュ計算で止めない
+    try:
+        return await coro
+    except HashPoolBusy as e:
+        raise HTTPException(
+            503, "Too many logins in progress",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
 @router.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: Session = Depends(get_db)):
 
-    exists = db.query(User).filter(User.email == user.email).first()
+    exists = await run_db(db, lambda db: db.query(User).filter(User.email == user.email).first())
     if exists:
         raise HTTPException(400, "User already exists")
 
-    new_user = User(
-        username=user.username,
-        email=user.email,
-        password_hash=hash_password(user.password),
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # ハッシュ計算は専用のプロセスプールで行う
+    password_hash = await run_hash(hash_pool.hash_password(user.password))
+
+    def save(db: Session):
+        new_user = User(
+            username=user.username,
+            email=user.email,
+            password_hash=password_hash,
+        )
+        db.add(new_user)
+        db.commit()
+
+    await run_db(db, save)
     return {"message": "User created"}
 
 @router.post("/login", response_model=TokenResponse)
-def login(data: LoginRequest, db: Session = Depends(get_db)):
+async def login(data: LoginRequest, db: Session = Depends(get_db)):
 
     # username or email のどちらでログインしても OK
-    if data.username:
-        user = db.query(User).filter(User.username == data.username).first()
-    else:
-        user = db.query(User).filter(User.email == data.email).first()
+    def find(db: Session):
+        if data.username:
+            return db.query(User).filter(User.username == data.username).first()
+        return db.query(User).filter(User.email == data.email).first()
+
+    user = await run_db(db, find)
 
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    if not verify_password(data.password, user.password_hash):
+    ok, new_hash = await run_hash(hash_pool.verify_and_update(data.password, user.password_hash))
+    if not ok:
         raise HTTPException(status_code=400, detail="Incorrect password")
 
+    # Argon2 のコスト設定が変わっていたら新しい設定で保存し直す
+    if new_hash:
+        def rehash(db: Session):
+            db.execute(
+                update(User)
+                .where(User.id == user.id, User.password_hash == user.password_hash)
+                .values(password_hash=new_hash)
+            )
+            db.commit()
+
+        await run_db(db, rehash)
+
     token = create_access_token({"sub": user.username, "user_id": user.id})
 
     return {"access_token": token, "token_type": "bearer"}
@@ -6,9 +6,17 @@ import os
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = "HS256"
 
+# Argon2 コスト：変更するとログイン時に古いハッシュを再計算する
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
 pwd_context = CryptContext(
     schemes=["argon2"],
-    deprecated="auto"
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
 )
 
 # ---------------------------
@@ -23,6 +31,16 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return pwd_context.verify(password, hashed)
 
+# ---------------------------
+# 密碼驗證 + 必要なら再ハッシュ（verify and update）
+# ---------------------------
+def verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    """
+    (ok, new_hash): new_hash is set when `hashed` was made with other
+    Argon2 parameters than the current ones.
+    """
+    return pwd_context.verify_and_update(password, hashed)
+
 # ---------------------------
 # JWT access token 生成
 # ---------------------------
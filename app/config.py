@@ -0,0 +1,95 @@
+import os
+from dataclasses import dataclass, field
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# ---------------------------
+# DB 設定
+# ---------------------------
+@dataclass(frozen=True)
+class DatabaseSettings:
+    url: str | None = field(default=None, repr=False)
+    async_url: str | None = field(default=None, repr=False)
+
+    # sync  : Session（psycopg2）をスレッドプールで実行
+    # async : AsyncSession（asyncpg）をイベントループ上で実行
+    mode: str = "sync"
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800  # 秒。-1 で無効
+
+    # SQL ログ：off | slow | sample | all
+    log_mode: str = "slow"
+    log_sample_rate: float = 0.01
+    slow_query_ms: float = 200.0
+
+    # 起動（app/main.py の lifespan）
+    startup_timeout: float = 60.0  # DB への接続・マイグレーション待ちの上限（秒）
+    migrate: str = "check"         # check：head になるまで待つ | upgrade：自分で適用する
+    pool_warmup: int = 5           # 起動時に開いておく接続数（pool_size まで）
+    warmup_queries: bool = True    # よく使うクエリを一度流してコンパイル結果をキャッシュ
+
+    @classmethod
+    def from_env(cls) -> "DatabaseSettings":
+        settings = cls(
+            url=os.getenv("DATABASE_URL"),
+            async_url=os.getenv("ASYNC_DATABASE_URL"),
+            mode=os.getenv("DB_MODE", "sync"),
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_pre_ping=env_bool("DB_POOL_PRE_PING", True),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            log_mode=os.getenv("DB_LOG_MODE", "slow"),
+            log_sample_rate=float(os.getenv("DB_LOG_SAMPLE_RATE", "0.01")),
+            slow_query_ms=float(os.getenv("DB_SLOW_QUERY_MS", "200")),
+            startup_timeout=float(os.getenv("DB_STARTUP_TIMEOUT", "60")),
+            migrate=os.getenv("DB_MIGRATE", "check"),
+            pool_warmup=int(os.getenv("DB_POOL_WARMUP", os.getenv("DB_POOL_SIZE", "5"))),
+            warmup_queries=env_bool("DB_WARMUP_QUERIES", True),
+        )
+
+        if settings.mode not in ("sync", "async"):
+            raise RuntimeError(f"DB_MODE must be 'sync' or 'async', got {settings.mode!r}")
+        if settings.log_mode not in ("off", "slow", "sample", "all"):
+            raise RuntimeError(f"DB_LOG_MODE must be off/slow/sample/all, got {settings.log_mode!r}")
+        if settings.migrate not in ("check", "upgrade"):
+            raise RuntimeError(f"DB_MIGRATE must be 'check' or 'upgrade', got {settings.migrate!r}")
+        return settings
+
+    def pool_kwargs(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_pre_ping": self.pool_pre_ping,
+            "pool_recycle": self.pool_recycle,
+        }
+
+    def public(self) -> dict:
+        """
+        Settings without the connection URLs (they may contain passwords).
+        """
+        return {
+            "mode": self.mode,
+            **self.pool_kwargs(),
+            "log_mode": self.log_mode,
+            "log_sample_rate": self.log_sample_rate,
+            "slow_query_ms": self.slow_query_ms,
+            "startup_timeout": self.startup_timeout,
+            "migrate": self.migrate,
+            "pool_warmup": self.pool_warmup,
+            "warmup_queries": self.warmup_queries,
+        }
+
+
+db_settings = DatabaseSettings.from_env()
@@ -1,19 +1,129 @@
-import os
-from sqlalchemy import create_engine
+import logging
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
+
+from app.config import db_settings
+from app.db_instrumentation import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    install_statement_hooks,
+    instrument_pool,
+    pool_status,
+)
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = db_settings.url
+DB_MODE = db_settings.mode
+
+
+def _instrument(sync_engine):
+    instrument_pool(sync_engine)
+    install_statement_hooks(
+        sync_engine,
+        db_settings.log_mode,
+        db_settings.log_sample_rate,
+        db_settings.slow_query_ms,
+    )
 
-DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    **db_settings.pool_kwargs(),
+)
+_instrument(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
-def get_db():
+def async_database_url(url: str) -> str:
+    """
+    postgresql://... / postgresql+psycopg2://... -> postgresql+asyncpg://...
+    """
+    scheme, sep, rest = url.partition("://")
+    if scheme.split("+")[0] in ("postgres", "postgresql"):
+        return "postgresql+asyncpg" + sep + rest
+    return url
+
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        db_settings.async_url or async_database_url(DATABASE_URL),
+        poolclass=InstrumentedAsyncQueuePool,
+        **db_settings.pool_kwargs(),
+    )
+    _instrument(async_engine.sync_engine)
+
+    # commit 後に属性を再読込すると I/O が発生するため expire しない
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def get_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+else:
+    AsyncSession = None
+    async_engine = None
+    AsyncSessionLocal = None
+    get_db = get_sync_db
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    Run `fn(session, *args, **kwargs)` without blocking the event loop.
+
+    The query code is written once against the sync Session API. With an
+    AsyncSession it runs through run_sync(), whose I/O is awaited on the
+    event loop (asyncpg); with a plain Session it runs in the threadpool,
+    as a sync `def` route would.
+    """
+    if AsyncSession is not None and isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def pool_statuses() -> dict:
+    pools = {"sync": pool_status(engine)}
+    if async_engine is not None:
+        pools["async"] = pool_status(async_engine.sync_engine)
+    return pools
+
+
+def wait_for_database(timeout: float):
+    """
+    Retry until the database accepts a connection, for up to `timeout`
+    seconds. Postgres starting next to the app (docker compose) is then
+    no error.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while True:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return
+        except OperationalError as e:
+            if time.monotonic() + delay > deadline:
+                raise
+            logger.warning("database not reachable yet (%s); retrying in %.1fs", str(e.orig).strip().splitlines()[0], delay)
+            time.sleep(delay)
+            delay = min(delay * 2, 5.0)
@@ -0,0 +1,190 @@
+"""
+Connection pool metrics and statement logging.
+
+Each engine gets a PoolMetrics fed from SQLAlchemy pool events
+(connect / checkout / checkin / invalidate). Checkout wait time cannot be
+seen from events, so the engines use pool subclasses that time _do_get():
+that covers waiting for a free connection and, when the pool grows into
+overflow, opening a new one.
+
+The cursor hooks time every statement: the time is added to the current
+request's stats (app.metrics), statements slower than DB_SLOW_QUERY_MS
+go to the slow-query log, and DB_LOG_MODE decides what is written to the
+"app.sql" logger in place of echo=True: "all" every statement, "sample"
+a random DB_LOG_SAMPLE_RATE fraction, "slow" only slow ones, "off"
+nothing.
+"""
+import logging
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.metrics import Histogram, record_query, slow_query_log
+
+sql_logger = logging.getLogger("app.sql")
+
+# checkout 待ち時間のバケット上限（秒）
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# ---------------------------
+# プールメトリクス
+# ---------------------------
+class PoolMetrics:
+    def __init__(self):
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.max_checked_out = 0
+        self._lock = threading.Lock()
+
+    def on_connect(self, *args):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.checkouts += 1
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.checkins += 1
+
+    def on_invalidate(self, *args):
+        with self._lock:
+            self.invalidations += 1
+
+    def on_wait(self, seconds: float, checked_out: int):
+        self.wait.observe(seconds)
+        with self._lock:
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+
+    def on_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            counters = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "max_checked_out": self.max_checked_out,
+            }
+
+        return {
+            "pool": type(pool).__name__,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # overflow() は未接続分を負数で返す
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+            **counters,
+            "checkout_wait_seconds": self.wait.snapshot(),
+        }
+
+
+class _TimedCheckout:
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.on_timeout()
+            raise
+        if self.metrics is not None:
+            self.metrics.on_wait(time.perf_counter() - start, self.checkedout())
+        return conn
+
+    def recreate(self):
+        # engine.dispose() はプールを作り直す：メトリクスは引き継ぐ
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_pool(engine) -> PoolMetrics:
+    """
+    Attach a PoolMetrics to `engine` (sync Engine, or AsyncEngine.sync_engine).
+    """
+    metrics = PoolMetrics()
+    engine.pool.metrics = metrics
+
+    event.listen(engine, "connect", metrics.on_connect)
+    event.listen(engine, "checkout", metrics.on_checkout)
+    event.listen(engine, "checkin", metrics.on_checkin)
+    event.listen(engine, "invalidate", metrics.on_invalidate)
+    return metrics
+
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    metrics = getattr(pool, "metrics", None) or PoolMetrics()
+    return metrics.snapshot(pool)
+
+
+# ---------------------------
+# SQL 計測・ログ
+# ---------------------------
+def install_statement_hooks(engine, log_mode: str, sample_rate: float, slow_ms: float):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        # 開始時刻は文ごとの context に置く（失敗した文は after が呼ばれないので、
+        # 接続側に積むと残り続けて次の文の計測がずれる）
+        if context is not None:
+            context._query_start = time.perf_counter()
+        else:
+            conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            start = context._query_start
+        else:
+            start = conn.info.pop("query_start")
+        elapsed = time.perf_counter() - start
+        elapsed_ms = elapsed * 1000
+        record_query(elapsed)
+
+        slow = elapsed_ms >= slow_ms
+        route = slow_query_log.record(statement, elapsed_ms) if slow else None
+
+        if log_mode == "all":
+            log = True
+        elif log_mode == "sample":
+            log = random.random() < sample_rate
+        elif log_mode == "slow":
+            log = slow
+        else:
+            log = False
+
+        if log:
+            sql_logger.log(
+                logging.WARNING if slow else logging.INFO,
+                "%.1f ms%s%s %s",
+                elapsed_ms,
+                f" [{route}]" if route else "",
+                " (executemany)" if executemany else "",
+                " ".join(statement.split()),
+            )
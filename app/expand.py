@@ -0,0 +1,72 @@
+"""
+?expand= for the task and log endpoints.
+
+An expansion embeds a small, fixed view of a many-to-one relation in
+each row, e.g. "assignee": {"id": 3, "username": "alice"}, or null when
+the foreign key is NULL. It is a LEFT OUTER JOIN added to the page query
+itself, so a page costs one query whatever its size and whatever is
+expanded. Keyset pagination is unchanged, because a many-to-one join
+cannot duplicate rows. Only the listed fields are embedded, which bounds
+how much each row grows. Full records stay behind their own endpoints.
+"""
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Query
+from sqlalchemy.orm import aliased
+
+from app.responses import row_dicts
+
+
+@dataclass(frozen=True)
+class Relation:
+    target: type          # 結合先のモデル
+    foreign_key: object   # 例：Task.assignee_id
+    fields: tuple         # 埋め込む列（先頭は主キー）
+
+
+def expand_param(*names: str):
+    """
+    Dependency parsing ?expand=a,b into a tuple of allowed names.
+    """
+    def dependency(
+        expand: str | None = Query(None, description=f"Comma-separated: {', '.join(names)}"),
+    ) -> tuple[str, ...]:
+        if not expand:
+            return ()
+        requested = tuple(dict.fromkeys(p.strip() for p in expand.split(",") if p.strip()))
+        unknown = [p for p in requested if p not in names]
+        if unknown:
+            raise HTTPException(400, f"Unknown expand: {', '.join(unknown)} (allowed: {', '.join(names)})")
+        return requested
+
+    return dependency
+
+
+def expand_query(query, relations: dict[str, Relation], requested: tuple[str, ...]):
+    for name in requested:
+        rel = relations[name]
+        target = aliased(rel.target, name=f"expand_{name}")
+        query = query.outerjoin(target, rel.foreign_key == getattr(target, rel.fields[0]))
+        query = query.add_columns(*(getattr(target, f).label(f"{name}__{f}") for f in rel.fields))
+    return query
+
+
+def expand_rows(keys: tuple[str, ...], relations: dict[str, Relation], requested: tuple[str, ...], rows) -> list[dict]:
+    """
+    Rows of `keys` followed by each requested relation's fields, as dicts.
+    """
+    if not requested:
+        return row_dicts(keys, rows)
+
+    n = len(keys)
+    items = []
+    for row in rows:
+        item = dict(zip(keys, row[:n]))
+        i = n
+        for name in requested:
+            fields = relations[name].fields
+            values = row[i:i + len(fields)]
+            item[name] = dict(zip(fields, values)) if values[0] is not None else None
+            i += len(fields)
+        items.append(item)
+    return items
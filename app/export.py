@@ -0,0 +1,71 @@
+"""
+Streaming NDJSON / CSV export.
+
+Rows come from a server-side cursor (yield_per) and are written out one
+chunk at a time, so memory stays flat no matter how many rows match.
+The generator opens its own session: the request's get_db session may be
+closed before the response body has finished streaming.
+"""
+import csv
+import io
+from datetime import date, datetime
+from enum import Enum
+
+from fastapi.responses import StreamingResponse
+
+from app.db import SessionLocal
+from app.responses import dumps
+
+CHUNK_ROWS = 1000
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _ndjson_chunk(columns, rows) -> bytes:
+    return b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def _csv_chunk(rows) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerows(
+        [v.isoformat() if isinstance(v, (datetime, date)) else v for v in row]
+        for row in rows
+    )
+    return out.getvalue()
+
+
+def iter_export(stmt, fmt: ExportFormat):
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=CHUNK_ROWS))
+        columns = list(result.keys())
+
+        if fmt == ExportFormat.csv:
+            yield _csv_chunk([columns])
+
+        for rows in result.partitions():
+            if fmt == ExportFormat.csv:
+                yield _csv_chunk(rows)
+            else:
+                yield _ndjson_chunk(columns, rows)
+    finally:
+        db.close()
+
+
+def export_response(stmt, fmt: ExportFormat, name: str) -> StreamingResponse:
+    filename = f"{name}.{fmt.value}"
+    return StreamingResponse(
+        iter_export(stmt, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
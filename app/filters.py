@@ -0,0 +1,68 @@
+from datetime import date, datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, true
+
+
+# ---------------------------
+# 月の範囲（half-open）
+# ---------------------------
+def resolve_month(year: int | None = None, month: int | None = None) -> tuple[int, int]:
+    """
+    year/month が指定されない場合は「今月」を返す。
+    9999-12 は終わり（10000-01-01）が datetime で表せないので 422。
+    """
+    now = datetime.now()
+    year, month = year or now.year, month or now.month
+    if (year, month) == (datetime.max.year, 12):
+        raise HTTPException(422, "month must end before year 10000")
+    return year, month
+
+
+def month_range(year: int, month: int) -> tuple[datetime, datetime]:
+    """
+    [start, end) of the given month, e.g. 2025-02 -> (2025-02-01, 2025-03-01).
+
+    Filtering with `created_at >= start AND created_at < end` keeps the
+    column bare so Postgres can use the created_at indexes, unlike
+    EXTRACT(YEAR/MONTH FROM created_at).
+    """
+    start = datetime(year, month, 1)
+    if month == 12:
+        end = datetime(year + 1, 1, 1)
+    else:
+        end = datetime(year, month + 1, 1)
+    return start, end
+
+
+def date_range(column, start: datetime | None = None, end: datetime | None = None):
+    """
+    Half-open range predicate on `column`; either bound may be omitted.
+    """
+    clauses = []
+    if start is not None:
+        clauses.append(column >= start)
+    if end is not None:
+        clauses.append(column < end)
+    return and_(true(), *clauses)
+
+
+def in_month(column, year: int, month: int):
+    start, end = month_range(year, month)
+    return date_range(column, start, end)
+
+
+def month_start(dt: datetime) -> date:
+    """
+    First day of the month `dt` falls in (the rollup bucket key).
+    """
+    return date(dt.year, dt.month, 1)
+
+
+def month_params(year: int, month: int) -> dict:
+    """
+    Bind parameters for raw SQL written as
+    `created_at >= :start AND created_at < :end`.
+    """
+    start, end = month_range(year, month)
+    return {"start": start, "end": end}
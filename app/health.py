@@ -0,0 +1,58 @@
+"""
+Liveness and readiness probes (no auth).
+
+/health/live answers as long as the process serves HTTP and never
+touches the database. A restart is the only cure for a failing liveness
+probe. /health/ready is 200 only after startup has finished (schema at
+head, pools and queries warmed), before shutdown has begun, and while
+`SELECT 1` on the request engine succeeds within READY_TIMEOUT. A load
+balancer stops sending traffic while it fails, without restarting the
+process.
+"""
+import asyncio
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from app.db import async_engine, engine
+from app.metrics import startup_report
+
+router = APIRouter()
+
+READY_TIMEOUT = float(os.getenv("HEALTH_READY_TIMEOUT", "2"))
+
+
+def _ping_sync():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def ping_database():
+    if async_engine is None:
+        await run_in_threadpool(_ping_sync)
+        return
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+@router.get("/live")
+async def live():
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def ready():
+    report = startup_report.snapshot()
+    if startup_report.state != "ready":
+        return JSONResponse({"status": startup_report.state, "startup": report}, status_code=503)
+
+    try:
+        await asyncio.wait_for(ping_database(), READY_TIMEOUT)
+    except Exception as e:
+        detail = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e).strip().splitlines()[0]
+        return JSONResponse({"status": "database unavailable", "error": detail, "startup": report}, status_code=503)
+
+    return {"status": "ready", "startup": report}
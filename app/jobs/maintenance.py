@@ -0,0 +1,37 @@
+"""
+Maintenance jobs: KPI rollup rebuild and activity_logs retention.
+"""
+from app.db import SessionLocal, engine
+from app.jobs.runner import register
+from app.kpi import rollup
+from app.logs import partitions
+
+
+@register("rollup_rebuild", exclusive=True)
+def rollup_rebuild(job) -> dict:
+    # 1 トランザクション（task_month_stats の EXCLUSIVE ロック中に集計し直す）
+    job.progress(0, 1)
+    db = SessionLocal()
+    try:
+        buckets = rollup.rebuild(db)
+    finally:
+        db.close()
+    job.progress(1)
+    return {"buckets": buckets}
+
+
+@register("log_retention")
+def log_retention(job, months: int) -> dict:
+    # パーティション 1 つずつ（detach → アーカイブ → drop はそれぞれ別トランザクション）
+    with engine.connect() as conn:
+        if conn.dialect.name != "postgresql" or not partitions.is_partitioned(conn):
+            return {"retired": {}}
+        cutoff = partitions.retention_cutoff(months)
+        expired = partitions.expired_partitions(conn, cutoff)
+
+    retired = {}
+    job.progress(0, len(expired))
+    for name, month in expired:
+        retired[name] = partitions.retire_partition(name, month)
+        job.progress(len(retired))
+    return {"cutoff": cutoff.isoformat(), "retired": retired}
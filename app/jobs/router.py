@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+
+from app.admin.router import require_admin
+from app.auth.principal import Principal
+from app.jobs import maintenance  # noqa: F401  ジョブの種類を登録
+from app.jobs.runner import ACTIVE, FINISHED, job_runner, submit_job
+from app.logs.partitions import RETENTION_MONTHS
+from app.schemas import JobOut
+from app.tasks.router import get_current_user
+
+router = APIRouter()
+
+
+def _visible(job: dict | None, user: Principal) -> dict:
+    # 他人のジョブは存在しないものとして扱う（admin は全件）
+    if job is None or (user.role != "admin" and job["created_by"] != user.id):
+        raise HTTPException(404, "Job not found")
+    return job
+
+
+@router.get("/", response_model=list[JobOut])
+async def list_jobs(
+    status: str | None = Query(None, description=", ".join(ACTIVE + FINISHED)),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    新しい順。admin 以外は自分が投入したジョブだけ。
+    """
+    user_id = None if current_user.role == "admin" else current_user.id
+    return await run_in_threadpool(job_runner.list, user_id, status, limit)
+
+
+# ---------------------------
+# メンテナンス（admin）
+# ---------------------------
+@router.post("/rollup-rebuild", status_code=202, response_model=JobOut)
+async def rollup_rebuild(current_user=Depends(require_admin)):
+    """
+    task_month_stats を tasks から作り直す（python -m app.kpi.rollup rebuild と同じ）
+    """
+    return await submit_job("rollup_rebuild", {}, current_user.id)
+
+
+@router.post("/log-retention", status_code=202, response_model=JobOut)
+async def log_retention(
+    months: int | None = Query(None, ge=1, description="default: LOG_RETENTION_MONTHS"),
+    current_user=Depends(require_admin)
+):
+    """
+    months か月より古い activity_logs パーティションをアーカイブして drop する
+    """
+    months = months or RETENTION_MONTHS
+    if months <= 0:
+        raise HTTPException(400, "months is required (LOG_RETENTION_MONTHS is not set)")
+    return await submit_job("log_retention", {"months": months}, current_user.id)
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(job_id: int, current_user: Principal = Depends(get_current_user)):
+    return _visible(await run_in_threadpool(job_runner.get, job_id), current_user)
+
+
+@router.post("/{job_id}/cancel", status_code=202, response_model=JobOut)
+async def cancel_job(job_id: int, current_user: Principal = Depends(get_current_user)):
+    """
+    queued はその場で cancelled、running は次のチャンクの区切りで止まる。
+    確定済みのチャンクは戻さない。
+    """
+    _visible(await run_in_threadpool(job_runner.get, job_id), current_user)
+    return await run_in_threadpool(job_runner.cancel, job_id)
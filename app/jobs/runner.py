@@ -0,0 +1,424 @@
+"""
+Background jobs for long operations (seed, reset, KPI rollup rebuild,
+log retention).
+
+A route submits a job and answers 202 with the job's row at once. A
+thread pool of JOBS_WORKERS threads in the same process runs it. The
+request never holds a worker, a DB connection or a proxy timeout for
+the length of the operation.
+
+The state lives in the `jobs` table, not in memory. Every uvicorn worker
+sees the same status, progress and result (GET /jobs/{id}), and any
+worker can accept a cancel. A job works in chunks that commit on their
+own (seed: one transaction per batch). Between chunks it calls
+job.progress(), which records progress at most every
+JOBS_PROGRESS_INTERVAL seconds. It raises JobCancelled once a cancel has
+been requested. Chunks committed before the cancel stay committed.
+
+Kinds registered with exclusive=True (seed, reset, rollup rebuild) do
+not run alongside each other: submitting one while another is queued or
+running is refused (JobConflict -> 409).
+
+On shutdown, running jobs are cancelled at their next chunk and queued
+ones are marked cancelled. While a job is queued or running, a heartbeat
+thread in its process touches updated_at every JOBS_HEARTBEAT_INTERVAL
+seconds, whether or not the job calls progress() (the rollup rebuild
+is one statement). A job whose process died without a
+shutdown stops moving: once its updated_at is JOBS_STALE_AFTER seconds
+old it is marked failed, at startup and before an exclusive submit, so
+it no longer blocks the next seed or reset.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from fastapi import HTTPException
+from sqlalchemy import select, text, update
+from starlette.concurrency import run_in_threadpool
+
+from app.db import engine
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("queued", "running")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+JOB_COLUMNS = (
+    Job.id, Job.kind, Job.status, Job.params, Job.result, Job.error,
+    Job.done, Job.total, Job.cancel_requested, Job.created_by,
+    Job.created_at, Job.started_at, Job.finished_at, Job.updated_at,
+)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobConflict(Exception):
+    def __init__(self, job: dict):
+        super().__init__(f"job {job['id']} ({job['kind']}) is {job['status']}")
+        self.job = job
+
+
+# ---------------------------
+# ジョブの種類
+# ---------------------------
+@dataclass(frozen=True)
+class JobKind:
+    name: str
+    fn: Callable      # fn(job: JobContext, **params) -> JSON にできる結果
+    exclusive: bool   # True：他の exclusive ジョブと同時に動かさない
+
+
+_kinds: dict[str, JobKind] = {}
+
+
+def register(name: str, exclusive: bool = False):
+    def decorator(fn):
+        _kinds[name] = JobKind(name, fn, exclusive)
+        return fn
+    return decorator
+
+
+def job_dict(row) -> dict:
+    job = dict(row._mapping)
+    total = job["total"]
+    job["progress"] = round(job["done"] / total, 4) if total else None
+    return job
+
+
+# ---------------------------
+# 実行中ジョブから見える口
+# ---------------------------
+class JobContext:
+    def __init__(self, runner: "JobRunner", id: int):
+        self.runner = runner
+        self.id = id
+        self.done = 0
+        self.total = None
+        self._written = 0.0
+        self._cancel_requested = False
+
+    def cancelled(self) -> bool:
+        return self._cancel_requested or self.id in self.runner._cancelled
+
+    def check(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+    def progress(self, done: int, total: int | None = None):
+        """
+        Record progress (throttled) and raise JobCancelled if a cancel was
+        requested. Call it between chunks, after each commit.
+        """
+        self.done = done
+        if total is not None:
+            self.total = total
+
+        now = time.monotonic()
+        if now - self._written >= self.runner.progress_interval or done == self.total:
+            self._written = now
+            with engine.begin() as conn:
+                # 書き込みついでに他ワーカーからの cancel を拾う
+                self._cancel_requested = conn.execute(
+                    update(Job)
+                    .where(Job.id == self.id)
+                    .values(done=self.done, total=self.total, updated_at=datetime.utcnow())
+                    .returning(Job.cancel_requested)
+                ).scalar()
+        self.check()
+
+
+# ---------------------------
+# 実行
+# ---------------------------
+class JobRunner:
+    def __init__(
+        self,
+        workers: int = 2,
+        progress_interval: float = 0.5,
+        heartbeat_interval: float = 10.0,
+        stale_after: float = 60.0,
+    ):
+        if stale_after <= heartbeat_interval:
+            raise RuntimeError(
+                f"JOBS_STALE_AFTER ({stale_after}) must be longer than JOBS_HEARTBEAT_INTERVAL ({heartbeat_interval})"
+            )
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stopping = False
+        self._local: set[int] = set()      # このプロセスで未完了のジョブ
+        self._cancelled: set[int] = set()  # このプロセスで cancel 済み
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat = None
+
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.reaped = 0
+
+    # ---------------------------
+    # 投入・取り消し
+    # ---------------------------
+    def submit(self, kind: str, params: dict | None = None, user_id: int | None = None) -> dict:
+        job_kind = _kinds[kind]
+        with engine.begin() as conn:
+            if job_kind.exclusive:
+                if conn.dialect.name == "postgresql":
+                    # 別ワーカーの同時 submit と直列化（トランザクション終了で解放）
+                    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('jobs.exclusive'))"))
+                # 落ちたプロセスのジョブはもう動いていない：待たせない
+                self._reap(conn)
+                exclusive = [name for name, k in _kinds.items() if k.exclusive]
+                active = conn.execute(
+                    select(*JOB_COLUMNS)
+                    .where(Job.status.in_(ACTIVE), Job.kind.in_(exclusive))
+                    .order_by(Job.id)
+                    .limit(1)
+                ).first()
+                if active is not None:
+                    raise JobConflict(job_dict(active))
+
+            now = datetime.utcnow()
+            row = conn.execute(
+                Job.__table__.insert()
+                .values(kind=kind, status="queued", params=params or {}, created_by=user_id,
+                        created_at=now, updated_at=now, done=0, cancel_requested=False)
+                .returning(*JOB_COLUMNS)
+            ).first()
+
+        job = job_dict(row)
+        with self._lock:
+            stopping = self._stopping
+            if not stopping:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="jobs")
+                self._local.add(job["id"])
+                self._executor.submit(self._run, job["id"])
+                self.submitted += 1
+        if stopping:
+            self.cancel(job["id"])
+            raise RuntimeError("job runner is stopping")
+        return job
+
+    def cancel(self, job_id: int) -> dict | None:
+        """
+        Cancel a queued job at once, or ask a running one to stop at its
+        next chunk. Finished jobs are returned unchanged.
+        """
+        now = datetime.utcnow()
+        with engine.begin() as conn:
+            conn.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued")
+                .values(status="cancelled", cancel_requested=True, finished_at=now, updated_at=now)
+            )
+            conn.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "running")
+                .values(cancel_requested=True, updated_at=now)
+            )
+            row = conn.execute(select(*JOB_COLUMNS).where(Job.id == job_id)).first()
+
+        with self._lock:
+            if job_id in self._local:
+                self._cancelled.add(job_id)
+        return job_dict(row) if row else None
+
+    def get(self, job_id: int) -> dict | None:
+        with engine.connect() as conn:
+            row = conn.execute(select(*JOB_COLUMNS).where(Job.id == job_id)).first()
+        return job_dict(row) if row else None
+
+    def list(self, user_id: int | None = None, status: str | None = None, limit: int = 50) -> list[dict]:
+        query = select(*JOB_COLUMNS).order_by(Job.id.desc()).limit(limit)
+        if user_id is not None:
+            query = query.where(Job.created_by == user_id)
+        if status is not None:
+            query = query.where(Job.status == status)
+        with engine.connect() as conn:
+            return [job_dict(row) for row in conn.execute(query)]
+
+    # ---------------------------
+    # heartbeat
+    # ---------------------------
+    def _beat(self):
+        with self._lock:
+            local = list(self._local)
+        if not local:
+            return
+        with engine.begin() as conn:
+            # 書き込みついでに他ワーカーからの cancel を拾う（progress() を呼ばないジョブ向け）
+            cancelled = conn.execute(
+                update(Job)
+                .where(Job.id.in_(local), Job.status.in_(ACTIVE))
+                .values(updated_at=datetime.utcnow())
+                .returning(Job.id, Job.cancel_requested)
+            ).all()
+        with self._lock:
+            self._cancelled.update(id for id, requested in cancelled if requested and id in self._local)
+
+    def _heartbeat_loop(self):
+        while not self._heartbeat_stop.wait(self.heartbeat_interval):
+            try:
+                self._beat()
+            except Exception:
+                logger.exception("job heartbeat failed")
+
+    def _reap(self, conn) -> int:
+        """
+        Mark failed the active jobs whose heartbeat stopped: their process
+        died without a shutdown.
+        """
+        now = datetime.utcnow()
+        reaped = conn.execute(
+            update(Job)
+            .where(Job.status.in_(ACTIVE), Job.updated_at < now - timedelta(seconds=self.stale_after))
+            .values(
+                status="failed",
+                error=f"worker lost: no heartbeat for {self.stale_after:g}s",
+                finished_at=now,
+                updated_at=now,
+            )
+            .returning(Job.id, Job.kind)
+        ).all()
+        for id, kind in reaped:
+            logger.warning("job %d (%s) lost its worker; marked failed", id, kind)
+        self.reaped += len(reaped)
+        return len(reaped)
+
+    # ---------------------------
+    # ワーカースレッド
+    # ---------------------------
+    def _finish(self, job: JobContext, **values):
+        now = datetime.utcnow()
+        with engine.begin() as conn:
+            conn.execute(
+                update(Job)
+                .where(Job.id == job.id)
+                .values(done=job.done, total=job.total, finished_at=now, updated_at=now, **values)
+            )
+
+    def _run(self, job_id: int):
+        try:
+            now = datetime.utcnow()
+            with engine.begin() as conn:
+                # queued のまま cancel されていたら何もしない
+                row = conn.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == "queued")
+                    .values(status="running", started_at=now, updated_at=now)
+                    .returning(Job.kind, Job.params)
+                ).first()
+            if row is None:
+                return
+
+            job = JobContext(self, job_id)
+            try:
+                job.check()
+                result = _kinds[row.kind].fn(job, **(row.params or {}))
+            except JobCancelled:
+                self._finish(job, status="cancelled")
+                self.cancelled += 1
+                logger.info("job %d (%s) cancelled after %d", job_id, row.kind, job.done)
+            except Exception as e:
+                logger.exception("job %d (%s) failed", job_id, row.kind)
+                self._finish(job, status="failed", error=f"{type(e).__name__}: {e}")
+                self.failed += 1
+            else:
+                self._finish(job, status="succeeded", result=result)
+                self.succeeded += 1
+        except Exception:
+            logger.exception("job %d: could not record its state", job_id)
+        finally:
+            with self._lock:
+                self._local.discard(job_id)
+                self._cancelled.discard(job_id)
+
+    # ---------------------------
+    # 起動・停止
+    # ---------------------------
+    def start(self):
+        with self._lock:
+            self._stopping = False
+            if self._heartbeat is None:
+                self._heartbeat_stop.clear()
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="jobs-heartbeat", daemon=True)
+                self._heartbeat.start()
+        # 前回落ちたプロセスのジョブを片付ける
+        try:
+            with engine.begin() as conn:
+                self._reap(conn)
+        except Exception:
+            logger.exception("could not reap stale jobs")
+
+    def stop(self):
+        """
+        Cancel this process's jobs: running ones stop at their next chunk,
+        queued ones never start.
+        """
+        with self._lock:
+            self._stopping = True
+            executor, self._executor = self._executor, None
+            heartbeat, self._heartbeat = self._heartbeat, None
+            pending = set(self._local)
+            self._cancelled.update(pending)
+
+        if executor is not None:
+            if pending:
+                now = datetime.utcnow()
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(Job)
+                        .where(Job.id.in_(pending), Job.status == "queued")
+                        .values(status="cancelled", error="server shutdown", finished_at=now, updated_at=now)
+                    )
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        # 実行中のジョブが終わりきるまで heartbeat を続ける
+        if heartbeat is not None:
+            self._heartbeat_stop.set()
+            heartbeat.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "kinds": {name: {"exclusive": k.exclusive} for name, k in _kinds.items()},
+                "local": sorted(self._local),
+                "submitted": self.submitted,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "reaped": self.reaped,
+            }
+
+
+job_runner = JobRunner(
+    workers=int(os.getenv("JOBS_WORKERS", "2")),
+    progress_interval=float(os.getenv("JOBS_PROGRESS_INTERVAL", "0.5")),
+    heartbeat_interval=float(os.getenv("JOBS_HEARTBEAT_INTERVAL", "10")),
+    stale_after=float(os.getenv("JOBS_STALE_AFTER", "60")),
+)
+
+
+async def submit_job(kind: str, params: dict | None, user_id: int | None) -> dict:
+    """
+    job_runner.submit() for routes: off the event loop, 409 on a conflict.
+    """
+    try:
+        return await run_in_threadpool(job_runner.submit, kind, params, user_id)
+    except JobConflict as e:
+        raise HTTPException(409, f"Job {e.job['id']} ({e.job['kind']}) is {e.job['status']}")
@@ -0,0 +1,146 @@
+"""
+KPI 結果キャッシュ（プロセス内 LRU + TTL）。
+
+Entries are keyed by (endpoint, year, month) and scoped to the month
+they describe; entries that span every month (the trend) have scope None
+and are dropped by any invalidation. Task writes reach invalidate_months()
+through app/tasks/hooks.py after their commit, so a cached past month stays valid until something
+in that month actually changes. Other workers only see the change once
+their own entry expires (KPI_CACHE_TTL).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Iterable
+
+from app.filters import month_start
+from app.tasks import hooks
+
+
+class KpiCache:
+    def __init__(self, maxsize: int = 512, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, scope, value)
+        self._lock = threading.Lock()
+        # invalidate のたびに進む。ロード中に無効化されたら結果を保存しない
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # ---------------------------
+    # 読み書き
+    # ---------------------------
+    def get(self, key) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, scope: date | None, generation: int | None = None):
+        """
+        Store `value`. If `generation` is given and an invalidation happened
+        since it was read, the value may predate that write and is dropped.
+        """
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+
+            self._entries[key] = (time.monotonic() + self.ttl, scope, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # ---------------------------
+    # 無効化
+    # ---------------------------
+    def invalidate_months(self, months: Iterable[date]):
+        """
+        Drop entries for the given months plus every all-months entry.
+        """
+        months = set(months)
+        if not months:
+            return
+
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key for key, (_, scope, _) in self._entries.items()
+                if scope is None or scope in months
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+kpi_cache = KpiCache(
+    maxsize=int(os.getenv("KPI_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("KPI_CACHE_TTL", "300")),
+)
+
+
+# ---------------------------
+# タスク書き込みで無効化
+# ---------------------------
+@hooks.on_change
+def _invalidate_changed_months(changes):
+    kpi_cache.invalidate_months({
+        month_start(state.created_at)
+        for change in changes
+        if change.before != change.after
+        for state in (change.before, change.after)
+        if state is not None
+    })
+
+
+@hooks.on_reset
+def _clear_on_reset():
+    kpi_cache.clear()
@@ -0,0 +1,474 @@
+"""
+In-process columnar KPI engine (KPI_ENGINE=columnar).
+
+At startup every task is loaded into NumPy columns: id, created_at
+(int64 epoch seconds), status (uint8 code) and assignee (int32 code,
+0 = unassigned). The columns are bucketed into a day × status × assignee
+count cube, and a cumulative sum along the day axis turns any
+[start, end) date range into one subtraction per (status, assignee)
+cell. A /kpi answer then costs the same for a thousand tasks or ten
+million, and it does not touch the database.
+
+The load is a plain four-column SELECT with no DATE_TRUNC/EXTRACT, so
+this also gives KPI on backends without them.
+
+Writes in this process reach the engine through app/tasks/hooks.py after
+their commit. A change is applied as "task <id> now looks like this",
+not as a delta, so applying one twice is harmless. Changes that arrive
+during a reload are replayed once the snapshot is in.
+
+Writes from other processes (another worker, `python -m app.tasks.seed`,
+SQL run by hand) are picked up from the change feed (app/tasks/changes.py)
+every KPI_COLUMNAR_REFRESH_INTERVAL seconds. The load remembers a feed
+cursor taken before its SELECT, so nothing committed after the snapshot
+is missed; rows read twice are harmless for the same reason as above. A
+restart response from the feed (reset, pruned tombstones) reloads.
+Postgres NOTIFY kpi events are per-month aggregates without the task ids,
+so they cannot be applied to the columns. A refresh can briefly undo a
+newer write from this process that it raced with; the next refresh
+reads that row again.
+
+The cube takes 4 bytes × days × statuses × assignees. Three years, three
+statuses and 100 assignees come to about 1.3 MB. The columns take
+21 bytes per task.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+from sqlalchemy import text
+
+from app.models import Task
+from app.tasks import hooks
+from app.tasks.changes import changes_page, head_cursor
+
+logger = logging.getLogger(__name__)
+
+KPI_ENGINE = os.getenv("KPI_ENGINE", "sql")
+if KPI_ENGINE not in ("sql", "columnar"):
+    raise RuntimeError(f"KPI_ENGINE must be 'sql' or 'columnar', got {KPI_ENGINE!r}")
+
+DAY = 86_400
+EPOCH = date(1970, 1, 1)
+DEAD = 255          # 削除済み行の status コード
+GROW_DAYS = 31      # 未来方向に伸ばすときの余裕（毎日の再確保を避ける）
+LOAD_CHUNK = 100_000
+REFRESH_INTERVAL = float(os.getenv("KPI_COLUMNAR_REFRESH_INTERVAL", "1"))
+
+# 変更フィードから読む列
+FEED_COLUMNS = (Task.id, Task.created_at, Task.status, Task.assignee_id)
+
+LOAD_SQL = text("""
+    SELECT id, created_at, status, COALESCE(assignee_id, 0) AS assignee_id
+    FROM tasks
+    ORDER BY id
+""")
+
+
+def day_number(d: date) -> int:
+    return (d - EPOCH).days
+
+
+class ColumnarKpi:
+    def __init__(self, enabled: bool, refresh_interval: float = REFRESH_INTERVAL):
+        self.enabled = enabled
+        self.refresh_interval = refresh_interval
+        self.loaded = False
+
+        self._lock = threading.Lock()
+        # reload 中に届いた変更（None は reset）。reload 中以外は None
+        self._pending: list | None = None
+        # load と refresh を直列にする。_cursor は次に読む変更フィードの位置
+        self._feed_lock = threading.Lock()
+        self._cursor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.loads = 0
+        self.load_seconds = None
+        self.applied = 0
+        self.refreshes = 0
+        self._clear()
+
+    def _clear(self):
+        # 列（id 昇順、先頭 _n 行が有効。容量は倍々で確保）
+        self._n = 0
+        self._dead = 0
+        self._ids = np.empty(0, np.int64)
+        self._created = np.empty(0, np.int64)
+        self._status = np.empty(0, np.uint8)
+        self._assignee = np.empty(0, np.int32)
+
+        # コード <-> 値
+        self._status_names: list[str] = []
+        self._status_codes: dict[str, int] = {}
+        self._assignee_ids: list[int] = [0]
+        self._assignee_codes: dict[int, int] = {0: 0}
+
+        # day × status × assignee の件数と、その day 方向の累積和
+        self._day0 = 0
+        self._cube = np.zeros((0, 0, 1), np.int32)
+        self._cum = None
+        self._cum_total = None
+
+    # ---------------------------
+    # ロード
+    # ---------------------------
+    def start(self):
+        if not self.enabled:
+            return
+        from app.db import SessionLocal
+
+        db = SessionLocal()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+        if self._thread is None and self.refresh_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="columnar-kpi", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def load(self, db):
+        """
+        Replace the columns with a fresh snapshot of `tasks`.
+        """
+        with self._feed_lock:
+            self._load(db)
+
+    def _load(self, db):
+        started = time.perf_counter()
+        with self._lock:
+            self._pending = []
+
+        try:
+            # SELECT より前の位置から追う：スナップショットの後のコミットを取りこぼさない
+            cursor = head_cursor(db)
+            chunks = []
+            result = db.execute(LOAD_SQL.execution_options(yield_per=LOAD_CHUNK))
+            for rows in result.partitions():
+                ids, created, status, assignee = zip(*rows)
+                chunks.append((
+                    np.array(ids, np.int64),
+                    np.array(created, "datetime64[s]").astype(np.int64),
+                    np.array(status, object),
+                    np.array(assignee, np.int64),
+                ))
+            db.rollback()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._clear()
+            if chunks:
+                self._insert(*(np.concatenate(cols) for cols in zip(*chunks)))
+            for changes in pending:
+                if changes is None:
+                    self._clear()
+                else:
+                    self._apply(changes)
+
+            self.loaded = True
+            self._cursor = cursor
+            self.loads += 1
+            self.load_seconds = time.perf_counter() - started
+            rows = self._n - self._dead
+
+        logger.info("columnar KPI engine loaded %d tasks in %.2fs", rows, self.load_seconds)
+
+    # ---------------------------
+    # 他プロセスの書き込み（変更フィード）
+    # ---------------------------
+    def refresh(self, db) -> int:
+        """
+        Apply every change in the feed since the last load or refresh.
+        Returns the number of tasks changed or deleted.
+        """
+        with self._feed_lock:
+            if not self.loaded:
+                return 0
+            seen = 0
+            while True:
+                page = changes_page(db, FEED_COLUMNS, self._cursor, LOAD_CHUNK)
+                if page["reset"]:
+                    db.rollback()
+                    logger.info("change feed restarted; reloading the columnar KPI engine")
+                    self._load(db)
+                    return seen
+                changes = [
+                    hooks.TaskChange(row.id, None, hooks.TaskState(row.created_at, row.status, row.assignee_id))
+                    for row in page["changes"]
+                ] + [hooks.TaskChange(id, None, None) for id in page["deleted"]]
+                if changes:
+                    self.apply(changes)
+                    seen += len(changes)
+                self._cursor = page["cursor"]
+                if not page["has_more"]:
+                    db.rollback()
+                    self.refreshes += 1
+                    return seen
+
+    def _run(self):
+        from app.db import SessionLocal
+
+        while not self._stop.wait(self.refresh_interval):
+            db = SessionLocal()
+            try:
+                self.refresh(db)
+            except Exception:
+                logger.exception("columnar KPI refresh failed")
+            finally:
+                db.close()
+
+    # ---------------------------
+    # 変更の反映（hooks から）
+    # ---------------------------
+    def apply(self, changes):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(changes)
+            elif self.loaded:
+                self._apply(changes)
+
+    def reset(self):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(None)
+            elif self.loaded:
+                self._clear()
+
+    def _apply(self, changes):
+        # 同じ id が複数回あれば最後の状態だけを使う
+        latest = {change.id: change.after for change in changes}
+        ids = np.fromiter(latest, np.int64, len(latest))
+        afters = list(latest.values())
+
+        # 既存行：いったん件数から外して削除扱いにする
+        pos, found = self._locate(ids)
+        rows = pos[found]
+        live = rows[self._status[rows] != DEAD]
+        self._count(live, -1)
+        self._status[live] = DEAD
+        self._dead += len(live)
+
+        keep = [i for i, after in enumerate(afters) if after is not None]
+        if keep:
+            ids = ids[keep]
+            created = np.array([afters[i].created_at for i in keep], "datetime64[s]").astype(np.int64)
+            status = np.array([afters[i].status for i in keep], object)
+            assignee = np.array([afters[i].assignee_id or 0 for i in keep], np.int64)
+
+            # 既存 id はその行を上書きし、新しい id は追記する
+            pos, found = self._locate(ids)
+            if found.any():
+                rows = pos[found]
+                self._write(rows, created[found], status[found], assignee[found])
+                self._dead -= len(rows)
+                self._count(rows, 1)
+            new = ~found
+            if new.any():
+                self._insert(ids[new], created[new], status[new], assignee[new])
+
+        if self._dead > max(self._n // 2, 1024):
+            self._compact()
+        self.applied += len(latest)
+
+    def _locate(self, ids):
+        n = self._n
+        pos = np.searchsorted(self._ids[:n], ids)
+        found = pos < n
+        found[found] = self._ids[:n][pos[found]] == ids[found]
+        return pos, found
+
+    def _insert(self, ids, created, status, assignee):
+        n, m = self._n, len(ids)
+        if n + m > len(self._ids):
+            capacity = max(n + m, 2 * len(self._ids), 1024)
+            for name in ("_ids", "_created", "_status", "_assignee"):
+                old = getattr(self, name)
+                grown = np.empty(capacity, old.dtype)
+                grown[:n] = old[:n]
+                setattr(self, name, grown)
+
+        rows = np.arange(n, n + m)
+        self._ids[rows] = ids
+        self._n = n + m
+        self._write(rows, created, status, assignee)
+
+        # 並行トランザクションのコミット順で id が前後したときだけ並べ直す
+        if (n and ids.min() <= self._ids[n - 1]) or np.any(np.diff(ids) <= 0):
+            order = np.argsort(self._ids[:self._n], kind="stable")
+            for name in ("_ids", "_created", "_status", "_assignee"):
+                col = getattr(self, name)
+                col[:self._n] = col[:self._n][order]
+            rows = np.searchsorted(self._ids[:self._n], ids)
+        self._count(rows, 1)
+
+    def _write(self, rows, created, status, assignee):
+        self._created[rows] = created
+        self._status[rows] = self._encode(status, self._status_names, self._status_codes)
+        self._assignee[rows] = self._encode(assignee, self._assignee_ids, self._assignee_codes)
+
+    @staticmethod
+    def _encode(values, names: list, codes: dict) -> np.ndarray:
+        uniq, inverse = np.unique(values, return_inverse=True)
+        mapped = []
+        for value in uniq.tolist():
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(names)
+                names.append(value)
+            mapped.append(code)
+        return np.asarray(mapped, np.int64)[inverse.reshape(-1)]
+
+    def _compact(self):
+        keep = np.flatnonzero(self._status[:self._n] != DEAD)
+        for name in ("_ids", "_created", "_status", "_assignee"):
+            col = getattr(self, name)
+            col[:len(keep)] = col[keep]
+        self._n = len(keep)
+        self._dead = 0
+
+    # ---------------------------
+    # バケット集計
+    # ---------------------------
+    def _count(self, rows, sign: int):
+        if len(rows) == 0:
+            return
+        days = self._created[rows] // DAY
+        self._fit(int(days.min()), int(days.max()))
+        np.add.at(
+            self._cube,
+            (days - self._day0, self._status[rows].astype(np.int64), self._assignee[rows].astype(np.int64)),
+            sign,
+        )
+        self._cum = None
+
+    def _fit(self, first_day: int, last_day: int):
+        """
+        Grow the cube to cover [first_day, last_day] and every known code.
+        """
+        days, statuses, assignees = self._cube.shape
+        lo, hi = self._day0, self._day0 + days
+        if days == 0:
+            lo, hi = first_day, last_day + 1
+        else:
+            lo = min(lo, first_day)
+            if last_day >= hi:
+                hi = last_day + 1 + GROW_DAYS
+
+        shape = (hi - lo, len(self._status_names), len(self._assignee_ids))
+        if shape == self._cube.shape:
+            return
+        cube = np.zeros(shape, np.int32)
+        if days:
+            offset = self._day0 - lo
+            cube[offset:offset + days, :statuses, :assignees] = self._cube
+        self._cube, self._day0 = cube, lo
+
+    def _cumulative(self):
+        if self._cum is None:
+            days, statuses, assignees = self._cube.shape
+            cum = np.zeros((days + 1, statuses, assignees), np.int64)
+            np.cumsum(self._cube, axis=0, out=cum[1:])
+            self._cum = cum
+            self._cum_total = cum.sum(axis=(1, 2))
+        return self._cum
+
+    # ---------------------------
+    # 問い合わせ
+    # ---------------------------
+    def _bounds(self, start: date | None, end: date | None) -> tuple[int, int]:
+        days = self._cube.shape[0]
+        i = 0 if start is None else min(max(day_number(start) - self._day0, 0), days)
+        j = days if end is None else min(max(day_number(end) - self._day0, 0), days)
+        return i, max(i, j)
+
+    def range_counts(self, start: date | None = None, end: date | None = None) -> tuple[dict, dict]:
+        """
+        Tasks created in [start, end), as ({status: n}, {assignee_id: n}).
+        Either bound may be omitted; the unassigned bucket is keyed None.
+        """
+        with self._lock:
+            cum = self._cumulative()
+            i, j = self._bounds(start, end)
+            cells = cum[j] - cum[i]
+            by_status = cells.sum(axis=1).tolist()
+            by_assignee = cells.sum(axis=0).tolist()
+            return (
+                {name: n for name, n in zip(self._status_names, by_status) if n},
+                {(a or None): n for a, n in zip(self._assignee_ids, by_assignee) if n},
+            )
+
+    def monthly_totals(self) -> list[tuple[date, int]]:
+        """
+        Task count per calendar month, for months with at least one task.
+        """
+        with self._lock:
+            self._cumulative()
+            days = self._cube.shape[0]
+            if days == 0:
+                return []
+            first = np.datetime64(self._day0, "D").astype("datetime64[M]")
+            last = np.datetime64(self._day0 + days - 1, "D").astype("datetime64[M]")
+            months = np.arange(first, last + 2)
+            bounds = np.clip(months.astype("datetime64[D]").astype(np.int64) - self._day0, 0, days)
+            totals = self._cum_total[bounds[1:]] - self._cum_total[bounds[:-1]]
+            return [
+                (m, n)
+                for m, n in zip(months[:-1].astype(date).tolist(), totals.tolist())
+                if n
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "engine": KPI_ENGINE,
+                "loaded": self.loaded,
+                "tasks": self._n - self._dead,
+                "dead_rows": self._dead,
+                "days": self._cube.shape[0],
+                "first_day": str(np.datetime64(self._day0, "D")) if self._cube.shape[0] else None,
+                "statuses": list(self._status_names),
+                "assignees": len(self._assignee_ids) - 1,
+                "cube_bytes": self._cube.nbytes,
+                "column_bytes": sum(
+                    getattr(self, name).nbytes for name in ("_ids", "_created", "_status", "_assignee")
+                ),
+                "loads": self.loads,
+                "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+                "applied_changes": self.applied,
+                "refreshes": self.refreshes,
+            }
+
+
+columnar_kpi = ColumnarKpi(enabled=KPI_ENGINE == "columnar")
+
+
+# ---------------------------
+# タスク書き込みの反映
+# ---------------------------
+@hooks.on_change
+def _apply_changes(changes):
+    changes = [change for change in changes if change.before != change.after]
+    if changes:
+        columnar_kpi.apply(changes)
+
+
+@hooks.on_reset
+def _reset():
+    columnar_kpi.reset()
@@ -0,0 +1,177 @@
+"""
+task_month_stats ロールアップの管理。
+
+Writes in app/tasks/service.py call record_* inside their own transaction,
+so the rollup commits (or rolls back) together with the task row.
+
+    python -m app.kpi.rollup rebuild   # backfill from tasks
+    python -m app.kpi.rollup check     # report drift, exit 1 if any
+"""
+import argparse
+import sys
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.filters import month_start
+from app.kpi.cache import kpi_cache
+from app.models import Task
+
+UPSERT_SQL = text("""
+    INSERT INTO task_month_stats (month, status, assignee_id, count)
+    VALUES (:month, :status, :assignee_id, :delta)
+    ON CONFLICT (month, status, assignee_id)
+    DO UPDATE SET count = task_month_stats.count + EXCLUDED.count
+""")
+
+# tasks から再集計した値（rebuild / check 共通）
+ACTUAL_SQL = """
+    SELECT CAST(DATE_TRUNC('month', created_at) AS DATE) AS month,
+           status,
+           COALESCE(assignee_id, 0) AS assignee_id,
+           COUNT(*) AS count
+    FROM tasks
+    GROUP BY 1, 2, 3
+"""
+
+
+def bucket(created_at: datetime, status: str, assignee_id: int | None) -> tuple:
+    return month_start(created_at), status, assignee_id or 0
+
+
+def task_bucket(task) -> tuple:
+    return bucket(task.created_at, task.status, task.assignee_id)
+
+
+# ---------------------------
+# 差分の適用
+# ---------------------------
+def apply_deltas(db: Session, deltas: Counter):
+    """
+    Add `deltas` ({(month, status, assignee_id): n}) to the rollup.
+
+    Rows are upserted in key order so concurrent writers touching the
+    same buckets lock them in the same order and cannot deadlock.
+    """
+    rows = [
+        {"month": m, "status": s, "assignee_id": a, "delta": n}
+        for (m, s, a), n in sorted(deltas.items())
+        if n
+    ]
+    if rows:
+        db.execute(UPSERT_SQL, rows)
+
+
+def record_create(db: Session, task):
+    apply_deltas(db, Counter({task_bucket(task): 1}))
+
+
+def record_delete(db: Session, task):
+    apply_deltas(db, Counter({task_bucket(task): -1}))
+
+
+def record_move(db: Session, before: tuple, after: tuple):
+    """
+    status 変更・担当者変更でバケットを移動する。
+    """
+    if before != after:
+        apply_deltas(db, Counter({before: -1, after: 1}))
+
+
+# ---------------------------
+# 再構築 / ドリフト検査
+# ---------------------------
+def rebuild(db: Session) -> int:
+    """
+    Recompute the whole rollup from `tasks`. Returns the number of buckets.
+
+    The EXCLUSIVE lock blocks concurrent record_* upserts until commit, so
+    a write racing the rebuild is either counted by it or applied after it.
+    (SQLite serializes writers without it.)
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE task_month_stats IN EXCLUSIVE MODE"))
+    db.execute(text("DELETE FROM task_month_stats"))
+    buckets = backfill(db.connection())
+    db.commit()
+
+    kpi_cache.clear()
+    return buckets
+
+
+def backfill(conn) -> int:
+    """
+    Fill an empty rollup from `tasks` inside the caller's transaction
+    (rebuild(), and app.migrate when it adopts a database from before the
+    rollup). Returns the number of buckets.
+    """
+    if conn.dialect.name == "postgresql":
+        return conn.execute(text(f"""
+            INSERT INTO task_month_stats (month, status, assignee_id, count)
+            SELECT month, status, assignee_id, count FROM ({ACTUAL_SQL}) actual
+        """)).rowcount
+
+    # DATE_TRUNC の無い DB：月への丸めは bucket() で行う
+    deltas = Counter()
+    rows = conn.execution_options(yield_per=10_000).execute(
+        select(Task.created_at, Task.status, Task.assignee_id)
+    )
+    for created_at, status, assignee_id in rows:
+        deltas[bucket(created_at, status, assignee_id)] += 1
+    apply_deltas(conn, deltas)
+    return len(deltas)
+
+
+def check(db: Session) -> list[dict]:
+    """
+    Buckets whose stored count differs from a fresh aggregate of `tasks`.
+    """
+    rows = db.execute(text(f"""
+        SELECT month, status, assignee_id,
+               COALESCE(actual.count, 0) AS actual,
+               COALESCE(stats.count, 0) AS stored
+        FROM ({ACTUAL_SQL}) actual
+        FULL OUTER JOIN task_month_stats stats USING (month, status, assignee_id)
+        WHERE COALESCE(actual.count, 0) <> COALESCE(stats.count, 0)
+        ORDER BY month, status, assignee_id
+    """)).fetchall()
+
+    return [
+        {
+            "month": r.month.strftime("%Y-%m"),
+            "status": r.status,
+            "assignee_id": r.assignee_id or None,
+            "actual": r.actual,
+            "stored": r.stored,
+        }
+        for r in rows
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="task_month_stats maintenance")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"rebuilt {rebuild(db)} buckets")
+            return
+
+        drift = check(db)
+        for d in drift:
+            print(d)
+        print(f"{len(drift)} drifted buckets")
+        if drift:
+            sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
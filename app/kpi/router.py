@@ -1,41 +1,68 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from app.db import get_db
+from app.db import get_db, run_db
 from app.tasks.router import get_current_user
-from sqlalchemy import text
+from app.filters import resolve_month
+from app.kpi import service
+from app.kpi.cache import kpi_cache
 
 router = APIRouter()
 
 
 # --------------------------
-# ① 月間 KPI
+# ダッシュボード（全 KPI を 1 クエリで）
 # --------------------------
+@router.get("/dashboard")
+async def dashboard_kpi(
+    year: int | None = Query(None, ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    # デフォルト：今月
+    year, month = resolve_month(year, month)
+    return await run_db(db, service.dashboard, year, month)
 
-@router.get("/monthly")
-def monthly_kpi(
-    year: int = None,
-    month: int = None,
+
+# --------------------------
+# 任意の期間（日単位、[start, end)）
+# --------------------------
+@router.get("/range")
+async def range_kpi(
+    start: date | None = None,
+    end: date | None = None,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    if year is None or month is None:
-        # 今月 default
-        now = datetime.now()
-        year = now.year
-        month = now.month
+    if start is not None and end is not None and end < start:
+        raise HTTPException(400, "end must not be before start")
+    return await run_db(db, service.range_summary, start, end)
 
-    sql = text("""
-        SELECT status, COUNT(*) 
-        FROM tasks
-        WHERE EXTRACT(YEAR FROM created_at) = :year
-          AND EXTRACT(MONTH FROM created_at) = :month
-        GROUP BY status
-    """)
 
-    result = db.execute(sql, {"year": year, "month": month}).fetchall()
+# --------------------------
+# キャッシュ統計（サイズ調整用）
+# --------------------------
+@router.get("/cache/stats")
+async def cache_stats(current_user=Depends(get_current_user)):
+    return kpi_cache.stats()
+
+
+# --------------------------
+# ① 月間 KPI
+# --------------------------
 
-    return [{"status": r[0], "count": r[1]} for r in result]
+@router.get("/monthly")
+async def monthly_kpi(
+    year: int | None = Query(None, ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    # 今月 default
+    year, month = resolve_month(year, month)
+    return await run_db(db, service.monthly, year, month)
 
 # --------------------------
 # ② 担当者別 KPI
@@ -50,133 +77,39 @@ def monthly_kpi(
 #     rows = db.execute(sql).fetchall()
 #     return [{"user": r[0], "count": r[1]} for r in rows]
 @router.get("/by-user")
-def kpi_by_user(
-    year: int | None = None,
-    month: int | None = None,
+async def kpi_by_user(
+    year: int | None = Query(None, ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
     # デフォルト：今月
-    if year is None or month is None:
-        today = datetime.now()
-        year = year or today.year
-        month = month or today.month
-
-    sql = text("""
-        SELECT assignee_id, COUNT(*)
-        FROM tasks
-        WHERE EXTRACT(YEAR FROM created_at) = :year
-          AND EXTRACT(MONTH FROM created_at) = :month
-        GROUP BY assignee_id
-    """)
-
-    rows = db.execute(sql, {"year": year, "month": month}).fetchall()
-
-    return {
-        "year": year,
-        "month": month,
-        "data": [
-            {"user": r[0], "count": r[1]}
-            for r in rows
-        ]
-    }
+    year, month = resolve_month(year, month)
+    return await run_db(db, service.by_user, year, month)
 
 
 # --------------------------
 # 月次タスク数
 # --------------------------
 @router.get("/monthly-trend")
-def monthly_trend_kpi(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    sql = text("""
-        SELECT
-            DATE_TRUNC('month', created_at) AS month,
-            COUNT(*) AS count
-        FROM tasks
-        GROUP BY month
-        ORDER BY month
-    """)
-
-    rows = db.execute(sql).fetchall()
-
-    return [
-        {
-            "month": r[0].strftime("%Y-%m"),
-            "count": r[1]
-        }
-        for r in rows
-    ]
+async def monthly_trend_kpi(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    year, month = resolve_month()
+    return await run_db(db, service.monthly_trend, year, month)
 
 # --------------------------
 # 完了率
 # --------------------------
 
 @router.get("/completion-rate")
-def completion_rate(
-    year: int | None = None,
-    month: int | None = None,
+async def completion_rate(
+    year: int | None = Query(None, ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
     # デフォルト：今月
-    if year is None or month is None:
-        today = datetime.now()
-        year = year or today.year
-        month = month or today.month
-
-    params = {"year": year, "month": month}
-
-    # ---------------------------
-    # ① 全件数
-    # ---------------------------
-    sql_total = text("""
-        SELECT COUNT(*)
-        FROM tasks
-        WHERE EXTRACT(YEAR FROM created_at) = :year
-          AND EXTRACT(MONTH FROM created_at) = :month
-    """)
-
-    # ---------------------------
-    # ② 完了（done）件数
-    # ---------------------------
-    sql_done = text("""
-        SELECT COUNT(*)
-        FROM tasks
-        WHERE status = 'done'
-          AND EXTRACT(YEAR FROM created_at) = :year
-          AND EXTRACT(MONTH FROM created_at) = :month
-    """)
-
-    total = db.execute(sql_total, params).scalar()
-    done = db.execute(sql_done, params).scalar()
-
-    rate = done / total if total else 0
-
-    # ---------------------------
-    # ③ ステータス別 breakdown
-    # ---------------------------
-    sql_status = text("""
-        SELECT status, COUNT(*)
-        FROM tasks
-        WHERE EXTRACT(YEAR FROM created_at) = :year
-          AND EXTRACT(MONTH FROM created_at) = :month
-        GROUP BY status
-    """)
-
-    rows = db.execute(sql_status, params).fetchall()
-
-    # dict 化
-    status_counts = {"todo": 0, "in_progress": 0, "done": 0}
-    for s, c in rows:
-        status_counts[s] = c
-
-    return {
-        "year": year,
-        "month": month,
-        "completion_rate": rate,
-        "done": done,
-        "total": total,
-        "status_counts": status_counts,
-    }
+    year, month = resolve_month(year, month)
+    return await run_db(db, service.completion_rate, year, month)
 
 # @router.get("/completion-rate")
 # def completion_rate(
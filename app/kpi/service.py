@@ -0,0 +1,224 @@
+"""
+KPI クエリ層。
+
+Every /kpi endpoint is a projection of dashboard(): one GROUPING SETS
+query over task_month_stats that yields the per-month trend, and the
+status / assignee breakdowns of the selected month, in a single pass.
+Each section is cached under its endpoint name (app/kpi/cache.py), and a
+miss on any of them refills all sections from that one query.
+
+With KPI_ENGINE=columnar the same sections are computed from the
+in-process arrays of app/kpi/columnar.py instead. That costs less than a
+cache lookup, so the result cache is bypassed.
+"""
+from datetime import date
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.filters import date_range, month_range
+from app.kpi.cache import kpi_cache
+from app.kpi.columnar import KPI_ENGINE, columnar_kpi
+from app.models import Task
+
+STATUSES = ("todo", "in_progress", "done")
+
+# GROUPING(month, status, assignee_id) のビット（1 = 集約された列）
+BY_MONTH = 0b011
+BY_STATUS = 0b101
+BY_ASSIGNEE = 0b110
+
+DASHBOARD_SQL = text("""
+    SELECT GROUPING(month, status, assignee_id) AS grp,
+           month,
+           status,
+           NULLIF(assignee_id, 0) AS assignee_id,
+           SUM(count) AS total,
+           COALESCE(SUM(count) FILTER (WHERE month = :month), 0) AS in_month
+    FROM task_month_stats
+    GROUP BY GROUPING SETS ((month), (status), (assignee_id))
+    ORDER BY grp, month, status, assignee_id
+""")
+
+
+# dashboard のセクション名 -> キャッシュキーに使うエンドポイント名
+SECTIONS = {
+    "monthly": "monthly",
+    "by_user": "by-user",
+    "monthly_trend": "monthly-trend",
+    "completion_rate": "completion-rate",
+}
+
+
+def build_sections(year: int, month: int, trend: list, status_counts: dict, by_user: list) -> dict:
+    total = sum(status_counts.values())
+    done = status_counts["done"]
+
+    return {
+        "monthly": [
+            {"status": s, "count": c} for s, c in status_counts.items() if c
+        ],
+        "by_user": {"year": year, "month": month, "data": by_user},
+        "monthly_trend": trend,
+        "completion_rate": {
+            "year": year,
+            "month": month,
+            "completion_rate": done / total if total else 0,
+            "done": done,
+            "total": total,
+            "status_counts": status_counts,
+        },
+    }
+
+
+def query_dashboard(db: Session, year: int, month: int) -> dict:
+    """
+    All KPI sections for (year, month) from one aggregate query (uncached).
+    """
+    rows = db.execute(DASHBOARD_SQL, {"month": date(year, month, 1)}).fetchall()
+
+    trend = []
+    status_counts = {s: 0 for s in STATUSES}
+    by_user = []
+
+    for r in rows:
+        if r.grp == BY_MONTH:
+            if r.total:
+                trend.append({"month": r.month.strftime("%Y-%m"), "count": r.total})
+        elif r.grp == BY_STATUS:
+            if r.in_month:
+                status_counts[r.status] = r.in_month
+        elif r.grp == BY_ASSIGNEE:
+            if r.in_month:
+                by_user.append({"user": r.assignee_id, "count": r.in_month})
+
+    return build_sections(year, month, trend, status_counts, by_user)
+
+
+def _user_counts(by_assignee: dict) -> list:
+    # SQL 版と同じ並び：担当者 id 昇順、未割り当て（None）は最後
+    return [
+        {"user": a, "count": n}
+        for a, n in sorted(by_assignee.items(), key=lambda item: (item[0] is None, item[0] or 0))
+    ]
+
+
+def columnar_dashboard(year: int, month: int) -> dict:
+    """
+    The same sections as query_dashboard(), from the columnar engine.
+    """
+    start, end = month_range(year, month)
+    by_status, by_assignee = columnar_kpi.range_counts(start.date(), end.date())
+
+    trend = [
+        {"month": m.strftime("%Y-%m"), "count": n}
+        for m, n in columnar_kpi.monthly_totals()
+    ]
+    status_counts = {s: 0 for s in STATUSES}
+    status_counts.update(by_status)
+
+    return build_sections(year, month, trend, status_counts, _user_counts(by_assignee))
+
+
+# ---------------------------
+# 任意の期間（/kpi/range）
+# ---------------------------
+def range_summary(db: Session, start: date | None, end: date | None) -> dict:
+    """
+    Status / assignee breakdown of tasks created in [start, end); either
+    bound may be omitted. The SQL engine reads `tasks` with a plain range
+    predicate, so day-level ranges need no rollup.
+    """
+    if KPI_ENGINE == "columnar":
+        by_status, by_assignee = columnar_kpi.range_counts(start, end)
+    else:
+        rows = db.execute(
+            select(Task.status, Task.assignee_id, func.count())
+            .where(date_range(Task.created_at, start, end))
+            .group_by(Task.status, Task.assignee_id)
+        ).all()
+        by_status, by_assignee = {}, {}
+        for status, assignee_id, n in rows:
+            by_status[status] = by_status.get(status, 0) + n
+            by_assignee[assignee_id] = by_assignee.get(assignee_id, 0) + n
+
+    status_counts = {s: 0 for s in STATUSES}
+    status_counts.update(by_status)
+    total = sum(status_counts.values())
+    done = status_counts["done"]
+
+    return {
+        "start": start,
+        "end": end,
+        "total": total,
+        "done": done,
+        "completion_rate": done / total if total else 0,
+        "status_counts": status_counts,
+        "by_user": _user_counts(by_assignee),
+    }
+
+
+# ---------------------------
+# キャッシュ
+# ---------------------------
+def cache_key(section: str, year: int, month: int) -> tuple:
+    # トレンドは全月にまたがるので年月を持たない
+    if section == "monthly_trend":
+        return SECTIONS[section], None, None
+    return SECTIONS[section], year, month
+
+
+def cache_scope(section: str, year: int, month: int) -> date | None:
+    if section == "monthly_trend":
+        return None
+    return date(year, month, 1)
+
+
+def load(db: Session, year: int, month: int) -> dict:
+    generation = kpi_cache.generation()
+    sections = query_dashboard(db, year, month)
+    for section, value in sections.items():
+        kpi_cache.set(
+            cache_key(section, year, month),
+            value,
+            cache_scope(section, year, month),
+            generation,
+        )
+    return sections
+
+
+def get_section(db: Session, name: str, year: int, month: int):
+    if KPI_ENGINE == "columnar":
+        return columnar_dashboard(year, month)[name]
+    value = kpi_cache.get(cache_key(name, year, month))
+    if value is None:
+        value = load(db, year, month)[name]
+    return value
+
+
+def dashboard(db: Session, year: int, month: int) -> dict:
+    if KPI_ENGINE == "columnar":
+        return {"year": year, "month": month, **columnar_dashboard(year, month)}
+    sections = {name: kpi_cache.get(cache_key(name, year, month)) for name in SECTIONS}
+    if any(value is None for value in sections.values()):
+        sections = load(db, year, month)
+    return {"year": year, "month": month, **sections}
+
+
+# ---------------------------
+# 各エンドポイント用の射影
+# ---------------------------
+def monthly(db: Session, year: int, month: int) -> list:
+    return get_section(db, "monthly", year, month)
+
+
+def by_user(db: Session, year: int, month: int) -> dict:
+    return get_section(db, "by_user", year, month)
+
+
+def monthly_trend(db: Session, year: int, month: int) -> list:
+    return get_section(db, "monthly_trend", year, month)
+
+
+def completion_rate(db: Session, year: int, month: int) -> dict:
+    return get_section(db, "completion_rate", year, month)
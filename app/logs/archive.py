@@ -0,0 +1,124 @@
+"""
+Compressed JSONL archives of retired activity_logs partitions.
+
+Each retired partition becomes one file,
+LOG_ARCHIVE_DIR/activity_logs_YYYY_MM.<part>.jsonl.gz, holding one JSON
+object per row ordered by (created_at, id). <part> is the partition
+table's OID: retrying a retirement that crashed before the DROP rewrites
+the same file instead of duplicating rows, and a month retired twice
+(rows that arrived after the first retirement) gets a second part.
+
+Files are written to a temporary name, fsynced and renamed into place,
+so a reader never sees a half-written archive. Reads stream a month's
+parts line by line; the cursor is the line number to resume from.
+"""
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "archive/activity_logs")
+
+COLUMNS = ("id", "user_id", "task_id", "action_type", "detail", "created_at")
+
+_NAME = re.compile(r"^activity_logs_(\d{4})_(\d{2})\.(\d+)\.jsonl\.gz$")
+
+
+def _prefix(year: int, month: int) -> str:
+    return f"activity_logs_{year:04d}_{month:02d}."
+
+
+def write_archive(year: int, month: int, part: int, rows) -> tuple[str, int]:
+    """
+    Write `rows` (tuples in COLUMNS order) as one part of a month's archive.
+    Returns (path, row count).
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"{_prefix(year, month)}{part}.jsonl.gz")
+    tmp = path + ".tmp"
+
+    count = 0
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for row in rows:
+                record = dict(zip(COLUMNS, row))
+                record["created_at"] = record["created_at"].isoformat()
+                gz.write((json.dumps(record, ensure_ascii=False) + "\n").encode())
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    os.replace(tmp, path)
+    return path, count
+
+
+def _parts(year: int, month: int) -> list[str]:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    prefix = _prefix(year, month)
+    return sorted(
+        os.path.join(ARCHIVE_DIR, name)
+        for name in os.listdir(ARCHIVE_DIR)
+        if name.startswith(prefix) and _NAME.match(name)
+    )
+
+
+def list_archives() -> list[dict]:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+
+    months: dict[tuple[int, int], dict] = {}
+    for name in sorted(os.listdir(ARCHIVE_DIR)):
+        m = _NAME.match(name)
+        if m:
+            key = (int(m.group(1)), int(m.group(2)))
+            entry = months.setdefault(key, {"year": key[0], "month": key[1], "files": [], "bytes": 0})
+            entry["files"].append(name)
+            entry["bytes"] += os.path.getsize(os.path.join(ARCHIVE_DIR, name))
+    return list(months.values())
+
+
+def _lines(paths):
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            yield from f
+
+
+def read_archive(
+    year: int,
+    month: int,
+    task_id: int | None = None,
+    user_id: int | None = None,
+    action_type: str | None = None,
+    cursor: int = 0,
+    limit: int = 100,
+) -> dict | None:
+    """
+    One page of matching rows from a month's archive, or None when the
+    month has not been archived.
+    """
+    paths = _parts(year, month)
+    if not paths:
+        return None
+
+    items = []
+    next_cursor = None
+    for line_no, line in enumerate(_lines(paths)):
+        if line_no < cursor:
+            continue
+        record = json.loads(line)
+        if task_id is not None and record["task_id"] != task_id:
+            continue
+        if user_id is not None and record["user_id"] != user_id:
+            continue
+        if action_type is not None and record["action_type"] != action_type:
+            continue
+
+        if len(items) == limit:
+            next_cursor = line_no
+            break
+        record["created_at"] = datetime.fromisoformat(record["created_at"])
+        items.append(record)
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,268 @@
+"""
+Write-behind buffer for activity events (POST /logs/batch).
+
+Requests only append to an in-memory queue; a background thread writes
+the queue to activity_logs with multi-row INSERTs once it holds
+LOG_BUFFER_FLUSH_SIZE events or its oldest event is
+LOG_BUFFER_FLUSH_INTERVAL seconds old. The queue is bounded by
+LOG_BUFFER_MAX_SIZE: when an offer would overflow it, the whole offer is
+rejected so the caller can retry later. A failed batch always goes back
+whole, even past LOG_BUFFER_MAX_SIZE; offers are turned away until the
+queue is below it again. stop() drains the queue (for up
+to LOG_BUFFER_SHUTDOWN_TIMEOUT seconds), so accepted events survive a
+graceful shutdown.
+
+A failed flush is handled by its cause:
+
+- unknown task_id (IntegrityError): those events get task_id NULL and
+  the batch is inserted again.
+- an error about the rows themselves (DataError, an IntegrityError that
+  remains after that, or a value the driver cannot bind): the batch is
+  split in halves until the failing events are alone. Each of those is
+  retried up to LOG_BUFFER_MAX_ATTEMPTS times and then dropped (logged,
+  and counted in stats() as "dropped"), so one bad event cannot block
+  the events behind it.
+- anything else (the database is unreachable, a table or partition is
+  missing during a migration, ...): the batch goes back to the head of
+  the queue and is retried as is, after a delay that doubles with each
+  failure in a row, up to LOG_BUFFER_MAX_BACKOFF seconds. Accepted
+  events are never dropped for these.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.db import SessionLocal
+from app.models import ActivityLog, Task
+from app.stream import LOG_EVENT_COLUMNS, publish_logs
+
+logger = logging.getLogger(__name__)
+
+# 行そのものが書けない：二分して該当イベントだけを再試行・破棄する
+# （SQLite は範囲外の整数を DataError ではなく OverflowError で返す）
+ROW_ERRORS = (DataError, IntegrityError, OverflowError)
+
+
+class LogBuffer:
+    def __init__(
+        self,
+        max_size: int = 100_000,
+        flush_size: int = 1000,
+        flush_interval: float = 0.5,
+        shutdown_timeout: float = 30.0,
+        max_attempts: int = 3,
+        max_backoff: float = 30.0,
+    ):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+
+        self._queue: deque = deque()
+        self._oldest = 0.0  # キュー先頭の投入時刻
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        # 単独でも書けなかったイベント：id(event) -> 失敗回数（キューにある間だけ）
+        self._attempts: dict[int, int] = {}
+        self._failures = 0  # 連続して失敗したフラッシュ（バックオフ用）
+
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dropped = 0
+
+    # ---------------------------
+    # 受付
+    # ---------------------------
+    def offer(self, events: list[dict]) -> bool:
+        """
+        Queue `events` as a unit. Returns False (and queues nothing) when
+        the buffer is full or stopping.
+        """
+        with self._cond:
+            if self._stopping or len(self._queue) + len(events) > self.max_size:
+                self.rejected += len(events)
+                return False
+
+            was_empty = not self._queue
+            if was_empty:
+                self._oldest = time.monotonic()
+            self._queue.extend(events)
+            self.accepted += len(events)
+
+            # 空のキューではフラッシャーが無期限に待っている：
+            # 最初のイベントで起こして flush_interval のタイマーを始めさせる
+            if was_empty or len(self._queue) >= self.flush_size:
+                self._cond.notify()
+            return True
+
+    # ---------------------------
+    # フラッシュ
+    # ---------------------------
+    def _due(self) -> bool:
+        if not self._queue:
+            return False
+        return (
+            self._stopping
+            or len(self._queue) >= self.flush_size
+            or time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _drain(self) -> list[dict]:
+        n = min(len(self._queue), self.flush_size)
+        batch = [self._queue.popleft() for _ in range(n)]
+        # 残りがあるならその先頭は _oldest 以降に入ったもの：期限は延ばさない
+        if not self._queue:
+            self._oldest = time.monotonic()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._stopping:
+                        return
+                    timeout = None
+                    if self._queue:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - self._oldest))
+                    self._cond.wait(timeout)
+                batch = self._drain()
+
+            self._write(batch)
+
+    def _write(self, batch: list[dict]):
+        try:
+            rows = self._insert(batch)
+        except ROW_ERRORS:
+            with self._cond:
+                self.errors += 1
+            if len(batch) > 1:
+                # 悪いイベントを半分ずつに絞り込む（残りは書ける）
+                half = len(batch) // 2
+                self._write(batch[:half])
+                self._write(batch[half:])
+            else:
+                self._retry_or_drop(batch[0])
+            return
+        except Exception:
+            with self._cond:
+                self.errors += 1
+            self._failures += 1
+            delay = min(self.flush_interval * 2 ** (self._failures - 1), self.max_backoff)
+            logger.exception("activity log flush failed; %d events requeued, retry in %.1fs", len(batch), delay)
+            self._requeue(batch)
+            time.sleep(delay)
+            return
+
+        self._failures = 0
+        if self._attempts:
+            for e in batch:
+                self._attempts.pop(id(e), None)
+        publish_logs(rows)
+        with self._cond:
+            self.flushed += len(batch)
+            self.flushes += 1
+
+    def _insert(self, batch: list[dict]) -> list:
+        db = SessionLocal()
+        try:
+            stmt = insert(ActivityLog).returning(*LOG_EVENT_COLUMNS)
+            try:
+                rows = db.execute(stmt, batch).all()
+                db.commit()
+            except IntegrityError:
+                # 存在しない task_id が混ざっている：その分だけ NULL にして再挿入
+                db.rollback()
+                task_ids = {e["task_id"] for e in batch if e["task_id"] is not None}
+                known = set(db.execute(select(Task.id).where(Task.id.in_(task_ids))).scalars())
+                for e in batch:
+                    if e["task_id"] not in known:
+                        e["task_id"] = None
+                rows = db.execute(stmt, batch).all()
+                db.commit()
+            return rows
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _retry_or_drop(self, event: dict):
+        attempts = self._attempts.get(id(event), 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[id(event)] = attempts
+            self._requeue([event])
+            return
+        self._attempts.pop(id(event), None)
+        with self._cond:
+            self.dropped += 1
+        logger.exception(
+            "activity log event dropped after %d attempts: user_id=%s task_id=%s action_type=%.100r",
+            attempts, event.get("user_id"), event.get("task_id"), event.get("action_type"),
+        )
+
+    def _requeue(self, batch: list[dict]):
+        # 受け付け済みのイベントは全部戻す。max_size を一時的に超えても、
+        # その間は offer() が新しいイベントを断る
+        with self._cond:
+            self._queue.extendleft(reversed(batch))
+            self._oldest = time.monotonic() - self.flush_interval
+
+    # ---------------------------
+    # ライフサイクル
+    # ---------------------------
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="log-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """
+        Stop accepting events and flush everything already queued.
+        """
+        with self._cond:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._cond.notify()
+
+        self._thread.join(self.shutdown_timeout if timeout is None else timeout)
+        if self._thread.is_alive():
+            logger.warning("log buffer still had %d events at shutdown", len(self._queue))
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "max_size": self.max_size,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "dropped": self.dropped,
+            }
+
+
+log_buffer = LogBuffer(
+    max_size=int(os.getenv("LOG_BUFFER_MAX_SIZE", "100000")),
+    flush_size=int(os.getenv("LOG_BUFFER_FLUSH_SIZE", "1000")),
+    flush_interval=float(os.getenv("LOG_BUFFER_FLUSH_INTERVAL", "0.5")),
+    shutdown_timeout=float(os.getenv("LOG_BUFFER_SHUTDOWN_TIMEOUT", "30")),
+    max_attempts=int(os.getenv("LOG_BUFFER_MAX_ATTEMPTS", "3")),
+    max_backoff=float(os.getenv("LOG_BUFFER_MAX_BACKOFF", "30")),
+)
@@ -0,0 +1,375 @@
+"""
+Monthly range partitions of activity_logs.
+
+activity_logs is PARTITION BY RANGE (created_at) with one partition per
+month (activity_logs_YYYY_MM) and a DEFAULT partition for rows whose
+month has no partition yet. Month-scoped queries bind created_at bounds
+and are pruned to a single partition.
+
+Maintenance (PartitionMaintainer, every LOG_PARTITION_INTERVAL seconds,
+and on startup):
+
+- ensure: create partitions from last month to LOG_PARTITIONS_AHEAD
+  months ahead, plus one for every month that has rows in the default
+  partition (those rows are moved in before the partition is attached).
+- retention (LOG_RETENTION_MONTHS > 0): partitions entirely older than
+  the cutoff are detached, written to a gzip JSONL archive
+  (app.logs.archive) and dropped. The three steps commit separately. A
+  table left detached but not dropped by a crash is picked up again on
+  the next run and rewrites the same archive file.
+
+Every step takes the same transaction-level advisory lock, so several
+API processes can run the maintainer at once.
+
+    python -m app.logs.partitions status|ensure|retention|convert
+
+`convert` rebuilds a pre-partitioning activity_logs table in place.
+"""
+import argparse
+import logging
+import os
+import re
+import threading
+from datetime import date
+
+from sqlalchemy import text
+
+from app.db import engine
+from app.filters import month_range, month_start
+from app.logs import archive
+from app.models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+PARENT = "activity_logs"
+DEFAULT_PARTITION = "activity_logs_default"
+
+PARTITIONS_AHEAD = int(os.getenv("LOG_PARTITIONS_AHEAD", "3"))
+RETENTION_MONTHS = int(os.getenv("LOG_RETENTION_MONTHS", "0"))  # 0 = 無期限
+MAINTENANCE_INTERVAL = float(os.getenv("LOG_PARTITION_INTERVAL", "3600"))
+
+LOCK_KEY = 0x61C7_1065  # pg_advisory_xact_lock のキー（activity_logs 保守）
+
+_NAME = re.compile(r"^activity_logs_(\d{4})_(\d{2})$")
+
+
+# ---------------------------
+# 補助
+# ---------------------------
+def partition_name(year: int, month: int) -> str:
+    return f"{PARENT}_{year:04d}_{month:02d}"
+
+
+def add_months(d: date, n: int) -> date:
+    i = d.year * 12 + d.month - 1 + n
+    return date(i // 12, i % 12 + 1, 1)
+
+
+def months_between(start: date, end: date) -> list[date]:
+    months, m = [], month_start(start)
+    while m <= end:
+        months.append(m)
+        m = add_months(m, 1)
+    return months
+
+
+def _lock(conn):
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+
+
+def _exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def is_partitioned(conn) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:name)"), {"name": PARENT}
+    ).scalar()
+    return relkind == "p"
+
+
+def attached_partitions(conn) -> set[str]:
+    return set(conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:name)
+    """), {"name": PARENT}).scalars())
+
+
+# ---------------------------
+# 作成
+# ---------------------------
+def create_partition(conn, month: date) -> bool:
+    """
+    Create the partition for `month` (caller holds the lock). Rows of that
+    month already sitting in the default partition are moved into it.
+    """
+    name = partition_name(month.year, month.month)
+    if _exists(conn, name):
+        return False
+
+    start, end = month_range(month.year, month.month)
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    params = {"start": start, "end": end}
+
+    stray = conn.execute(text(f"""
+        SELECT EXISTS (
+            SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end
+        )
+    """), params).scalar()
+
+    if not stray:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}"))
+        return True
+
+    # default に入っている行を移してから ATTACH（default と範囲が重なると作成できない）
+    # 生成列（search_vector）は INCLUDING GENERATED で複製し、INSERT では列を指定して再計算させる
+    columns = ", ".join(archive.COLUMNS)
+    conn.execute(text(
+        f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+    ))
+    moved = conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE created_at >= :start AND created_at < :end
+            RETURNING {columns}
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+    """), params).rowcount
+    conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    logger.info("moved %d rows from %s into %s", moved, DEFAULT_PARTITION, name)
+    return True
+
+
+def ensure_partitions(conn, months) -> list[str]:
+    """
+    Create any missing partitions for `months` (dates, any day of the month).
+    Runs in the caller's transaction; commit to release the lock.
+    """
+    _lock(conn)
+    created = []
+    for month in sorted({month_start(m) for m in months}):
+        if create_partition(conn, month):
+            created.append(partition_name(month.year, month.month))
+    return created
+
+
+def ensure_window(conn, today: date | None = None) -> list[str]:
+    current = month_start(today or date.today())
+    months = [add_months(current, n) for n in range(-1, PARTITIONS_AHEAD + 1)]
+    months += conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {DEFAULT_PARTITION}"
+    )).scalars().all()
+    return ensure_partitions(conn, months)
+
+
+# ---------------------------
+# 保持期間（detach → アーカイブ → drop）
+# ---------------------------
+def retention_cutoff(months: int, today: date | None = None) -> date:
+    """
+    Partitions for months before this date are retired.
+    """
+    return add_months(month_start(today or date.today()), -months)
+
+
+def expired_partitions(conn, cutoff: date) -> list[tuple[str, date]]:
+    names = conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE 'activity\\_logs\\_%'"
+    )).scalars()
+
+    expired = []
+    for name in names:
+        m = _NAME.match(name)
+        if m:
+            month = date(int(m.group(1)), int(m.group(2)), 1)
+            if month < cutoff:
+                expired.append((name, month))
+    return sorted(expired, key=lambda e: e[1])
+
+
+def retire_partition(name: str, month: date) -> int:
+    with engine.begin() as conn:
+        _lock(conn)
+        if name in attached_partitions(conn):
+            conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+
+    # 切り離したテーブルはもう書き込まれない：ロックなしで読み出す
+    with engine.connect() as conn:
+        oid = conn.execute(text("SELECT to_regclass(:name)::oid"), {"name": name}).scalar()
+        rows = conn.execution_options(yield_per=5000).execute(text(f"""
+            SELECT {', '.join(archive.COLUMNS)} FROM {name} ORDER BY created_at, id
+        """))
+        path, count = archive.write_archive(month.year, month.month, oid, rows)
+
+    with engine.begin() as conn:
+        _lock(conn)
+        conn.execute(text(f"DROP TABLE {name}"))
+
+    logger.info("archived %s (%d rows) to %s", name, count, path)
+    return count
+
+
+def apply_retention(months: int = RETENTION_MONTHS, today: date | None = None) -> dict:
+    if months <= 0:
+        return {}
+
+    with engine.connect() as conn:
+        expired = expired_partitions(conn, retention_cutoff(months, today))
+
+    return {name: retire_partition(name, month) for name, month in expired}
+
+
+# ---------------------------
+# 既存（非パーティション）テーブルの変換
+# ---------------------------
+def convert(conn) -> int:
+    """
+    Rebuild a plain activity_logs table as the partitioned one, keeping
+    ids. Holds an ACCESS EXCLUSIVE lock on activity_logs until commit.
+    """
+    if is_partitioned(conn):
+        return 0
+
+    old = f"{PARENT}_unpartitioned"
+    conn.execute(text(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {old}"))
+
+    # 名前が衝突する索引・制約・シーケンスを外す（テーブルは最後に drop）
+    for index in ActivityLog.__table__.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text(f"DROP INDEX IF EXISTS ix_{PARENT}_search_vector"))
+    conn.execute(text(f"ALTER TABLE {old} DROP CONSTRAINT IF EXISTS {PARENT}_pkey"))
+    conn.execute(text(f"ALTER TABLE {old} ALTER COLUMN id DROP DEFAULT"))
+    conn.execute(text(f"DROP SEQUENCE IF EXISTS {PARENT}_id_seq"))
+
+    ActivityLog.__table__.create(conn)  # after_create で default パーティションも作られる
+
+    first, last = conn.execute(text(f"SELECT MIN(created_at), MAX(created_at) FROM {old}")).one()
+    if first is not None:
+        ensure_partitions(conn, months_between(first.date(), last.date()))
+    ensure_window(conn)
+
+    columns = ", ".join(archive.COLUMNS)
+    count = conn.execute(text(f"""
+        INSERT INTO {PARENT} ({columns})
+        SELECT id, user_id, task_id, action_type, detail, COALESCE(created_at, now())
+        FROM {old}
+    """)).rowcount
+    conn.execute(text(f"""
+        SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'),
+                      COALESCE((SELECT MAX(id) FROM {PARENT}), 0) + 1, false)
+    """))
+    conn.execute(text(f"DROP TABLE {old}"))
+    conn.execute(text(f"ANALYZE {PARENT}"))
+    return count
+
+
+# ---------------------------
+# 状況
+# ---------------------------
+def status(conn) -> dict:
+    if not is_partitioned(conn):
+        return {"partitioned": False}
+
+    partitions = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), GREATEST(c.reltuples, 0)::bigint
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:name)
+        ORDER BY c.relname
+    """), {"name": PARENT}).all()
+
+    return {
+        "partitioned": True,
+        "ahead": PARTITIONS_AHEAD,
+        "retention_months": RETENTION_MONTHS,
+        "partitions": [
+            {"name": name, "bounds": bounds, "estimated_rows": rows}
+            for name, bounds, rows in partitions
+        ],
+        "archives": archive.list_archives(),
+    }
+
+
+# ---------------------------
+# 定期実行
+# ---------------------------
+class PartitionMaintainer:
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with engine.begin() as conn:
+            if not is_partitioned(conn):
+                logger.warning(
+                    "activity_logs is not partitioned; run `python -m app.logs.partitions convert`"
+                )
+                return
+            created = ensure_window(conn)
+        if created:
+            logger.info("created partitions: %s", ", ".join(created))
+        apply_retention()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("activity_logs partition maintenance failed")
+
+    def start(self):
+        # パーティションは Postgres のみ（SQLite などは 1 表のまま）
+        if self._thread is not None or engine.dialect.name != "postgresql":
+            return
+        # 起動時に一度：今月のパーティションが無いまま受け付けない
+        try:
+            self.run_once()
+        except Exception:
+            logger.exception("activity_logs partition maintenance failed")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="log-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+partition_maintainer = PartitionMaintainer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="activity_logs partition maintenance")
+    parser.add_argument("command", choices=["status", "ensure", "retention", "convert"])
+    parser.add_argument("--months", type=int, default=RETENTION_MONTHS,
+                        help="retention: keep this many months before the current one")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        with engine.connect() as conn:
+            for key, value in status(conn).items():
+                print(f"{key}: {value}")
+
+    elif args.command == "ensure":
+        with engine.begin() as conn:
+            print("created:", ", ".join(ensure_window(conn)) or "-")
+
+    elif args.command == "retention":
+        retired = apply_retention(args.months)
+        for name, count in retired.items():
+            print(f"{name}: {count} rows archived")
+        if not retired:
+            print("nothing to retire")
+
+    else:
+        with engine.begin() as conn:
+            print(f"converted: {convert(conn)} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,82 @@
+import asyncio
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.db import get_db
-from app.models import ActivityLog
-from app.schemas import ActivityLogOut
-from app.tasks.router import get_current_user
-from sqlalchemy import extract
+from app.db import SessionLocal, get_db, run_db
+from app.models import ActivityLog, Task, User
+from app.schemas import ActivityLogOut, ActivityLogPage, ActivityLogSearchPage, LogBatch, StreamTicketOut
+from app.tasks.router import get_current_user, principal_for_token
+from app.auth.principal import Principal
+from app.filters import resolve_month, in_month, date_range
+from app.pagination import paginate, DEFAULT_LIMIT, MAX_LIMIT
+from app.export import ExportFormat, export_response
+from app.logs.buffer import log_buffer
+from app.logs import archive, tickets
+from app.responses import dumps, page_response, row_dicts
+from app.expand import Relation, expand_param, expand_query, expand_rows
+from app.search import log_index, search_page
+from app.stream import stream_hub
+from sqlalchemy import select
 router = APIRouter()
 
-@router.get("/")
-def get_logs(
+MAX_BATCH_EVENTS = 10_000
+
+
+# 一覧で返す列（ActivityLogOut と同じ並び。ORM オブジェクトは作らない）
+LOG_COLUMNS = (
+    ActivityLog.id,
+    ActivityLog.user_id,
+    ActivityLog.task_id,
+    ActivityLog.action_type,
+    ActivityLog.detail,
+    ActivityLog.created_at,
+)
+LOG_KEYS = tuple(c.key for c in LOG_COLUMNS)
+
+# ?expand=user,task（JOIN で同じクエリに載せる。削除済みタスクは null）
+LOG_EXPANSIONS = {
+    "user": Relation(User, ActivityLog.user_id, ("id", "username")),
+    "task": Relation(Task, ActivityLog.task_id, ("id", "title", "status")),
+}
+log_expand = expand_param(*LOG_EXPANSIONS)
+
+
+def log_page(db: Session, criteria: list, cursor, limit, expand: tuple[str, ...] = ()):
+    query = expand_query(db.query(*LOG_COLUMNS), LOG_EXPANSIONS, expand).filter(*criteria)
+    logs, next_cursor = paginate(query, ActivityLog.created_at, ActivityLog.id, cursor, limit)
+
+    return page_response(expand_rows(LOG_KEYS, LOG_EXPANSIONS, expand, logs), next_cursor)
+
+
+@router.get("/", response_model=ActivityLogPage)
+async def get_logs(
     task_id: int | None = None,
-    year: int | None = None,
-    month: int | None = None,
+    year: int | None = Query(None, ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12),
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    expand: tuple[str, ...] = Depends(log_expand),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
 
-    query = db.query(ActivityLog)
-
     # -------------------------
     # ① 特定タスクのログ取得
     # -------------------------
     if task_id is not None:
-        query = query.filter(ActivityLog.task_id == task_id)
+        criteria = [ActivityLog.task_id == task_id]
 
     else:
         # -------------------------
         # ② 月次ログ（year + month）
         # -------------------------
-        now = datetime.now()
-
-        if year is None:
-            year = now.year
+        year, month = resolve_month(year, month)
 
-        if month is None:
-            month = now.month
+        criteria = [in_month(ActivityLog.created_at, year, month)]
 
-        query = query.filter(
-            extract("year", ActivityLog.created_at) == year,
-            extract("month", ActivityLog.created_at) == month
-        )
-
-    logs = query.order_by(ActivityLog.created_at.desc()).all()
-
-    return [
-        {
-            "id": log.id,
-            "task_id": log.task_id,
-            "user_id": log.user_id,
-            "action_type": log.action_type,
-            "detail": log.detail,
-            "created_at": log.created_at,
-        }
-        for log in logs
-    ]
+    return await run_db(db, log_page, criteria, cursor, limit, expand)
 
 # @router.get("/")
 # def get_logs(
@@ -89,14 +111,282 @@ def get_logs(
 #     ]
 
 
-@router.get("/by-task/{task_id}")
-def logs_by_task(
+# -------------------------
+# イベント一括登録（write-behind）
+# -------------------------
+@router.post("/batch", status_code=202)
+async def ingest_logs(
+    data: LogBatch,
+    current_user=Depends(get_current_user)
+):
+    """
+    イベントはバッファに積むだけで、DB への書き込みはバックグラウンドで行う。
+    バッファが満杯なら 503（Retry-After 付き）。
+    """
+    if len(data.events) > MAX_BATCH_EVENTS:
+        raise HTTPException(413, f"At most {MAX_BATCH_EVENTS} events per request")
+
+    now = datetime.utcnow()
+    events = [
+        {
+            "user_id": current_user.id,
+            "task_id": e.task_id,
+            "action_type": e.action_type,
+            "detail": e.detail,
+            "created_at": e.created_at or now,
+        }
+        for e in data.events
+    ]
+
+    if not log_buffer.offer(events):
+        raise HTTPException(
+            503,
+            "Log buffer is full, retry later",
+            headers={"Retry-After": str(max(1, round(log_buffer.flush_interval)))},
+        )
+
+    return {"accepted": len(events)}
+
+
+@router.get("/batch/stats")
+async def ingest_stats(current_user=Depends(get_current_user)):
+    return log_buffer.stats()
+
+
+@router.get("/export")
+async def export_logs(
+    fmt: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    task_id: int | None = None,
+    user_id: int | None = None,
+    action_type: str | None = None,
+    current_user=Depends(get_current_user)
+):
+    """
+    全期間のログを NDJSON / CSV でストリーミング出力する。
+    start/end は created_at の範囲（end は含まない）。
+    """
+    stmt = select(*LOG_COLUMNS).where(date_range(ActivityLog.created_at, start, end))
+
+    if task_id is not None:
+        stmt = stmt.where(ActivityLog.task_id == task_id)
+    if user_id is not None:
+        stmt = stmt.where(ActivityLog.user_id == user_id)
+    if action_type is not None:
+        stmt = stmt.where(ActivityLog.action_type == action_type)
+
+    return export_response(
+        stmt.order_by(ActivityLog.created_at, ActivityLog.id), fmt, "activity_logs"
+    )
+
+
+@router.get("/search", response_model=ActivityLogSearchPage)
+async def search_logs(
+    q: str = Query(..., min_length=1, max_length=200),
+    task_id: int | None = None,
+    user_id: int | None = None,
+    action_type: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """
+    detail に q の語をすべて含むログを一致度の高い順に返す（アーカイブ済みの月は対象外）。
+    """
+    criteria = [date_range(ActivityLog.created_at, start, end)]
+    if task_id is not None:
+        criteria.append(ActivityLog.task_id == task_id)
+    if user_id is not None:
+        criteria.append(ActivityLog.user_id == user_id)
+    if action_type is not None:
+        criteria.append(ActivityLog.action_type == action_type)
+
+    rows, next_cursor, searched_from = await run_db(
+        db, search_page, log_index, LOG_COLUMNS, criteria, q, cursor, limit
+    )
+    return page_response(
+        row_dicts(LOG_KEYS + ("rank",), rows), next_cursor,
+        truncated=searched_from is not None, searched_from=searched_from,
+    )
+
+
+# -------------------------
+# ライブフィード（SSE / WebSocket）
+# -------------------------
+STREAM_TYPES = ("log", "kpi")
+
+
+def stream_types(types: str) -> set[str]:
+    requested = {t.strip() for t in types.split(",") if t.strip()}
+    unknown = requested - set(STREAM_TYPES)
+    if unknown or not requested:
+        raise HTTPException(400, f"types must be a subset of {', '.join(STREAM_TYPES)}")
+    return requested
+
+
+@router.post("/stream-ticket", response_model=StreamTicketOut)
+async def create_stream_ticket(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    EventSource / ブラウザの WebSocket 用：?ticket= に 1 回だけ使えるチケット（app/logs/tickets.py）。
+    """
+    ticket = await run_db(db, tickets.issue, current_user.id)
+    return {"ticket": ticket, "expires_in": tickets.TTL}
+
+
+async def stream_principal(token: str | None, ticket: str | None):
+    """
+    The Authorization header, or else a ticket from POST /logs/stream-ticket.
+    The session is closed before the stream starts instead of being held
+    for its lifetime.
+    """
+    if not token and not ticket:
+        raise HTTPException(401, "Not authenticated")
+    db = SessionLocal()
+    try:
+        if token:
+            return await principal_for_token(token, db)
+
+        def load(db):
+            user_id = tickets.redeem(db, ticket)
+            return db.get(User, user_id) if user_id is not None else None
+
+        user = await run_db(db, load)
+        if user is None:
+            raise HTTPException(401, "Invalid or expired ticket")
+        return Principal.from_user(user)
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def bearer_token(headers) -> str | None:
+    scheme, _, credentials = headers.get("authorization", "").partition(" ")
+    return credentials if scheme.lower() == "bearer" and credentials else None
+
+
+def sse(event: str, data) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+@router.get("/stream")
+async def stream_logs(
+    request: Request,
+    types: str = Query("log,kpi", description="Comma-separated: log, kpi"),
+    ticket: str | None = Query(None, description="From POST /logs/stream-ticket, instead of the Authorization header"),
+):
+    """
+    新しいログと KPI の差分を Server-Sent Events で送る。
+    resync を受け取ったら表示中のデータを取り直す（app/stream.py）。
+    """
+    await stream_principal(bearer_token(request.headers), ticket)
+    wanted = stream_types(types)
+
+    sub = stream_hub.subscribe(wanted)
+    if sub is None:
+        raise HTTPException(503, "Too many stream clients", headers={"Retry-After": "5"})
+
+    async def events():
+        try:
+            yield b"retry: 3000\n" + sse("ready", {"types": sorted(wanted)})
+            while True:
+                try:
+                    e = await sub.get(stream_hub.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if e is None:
+                    return
+                yield sse(e["type"], e["data"])
+        finally:
+            stream_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/stream/ws")
+async def stream_logs_ws(websocket: WebSocket, types: str = "log,kpi", ticket: str | None = None):
+    """
+    /logs/stream と同じイベントを {"type": ..., "data": ...} の JSON テキストで送る。
+    """
+    try:
+        await stream_principal(bearer_token(websocket.headers), ticket)
+        wanted = stream_types(types)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+
+    sub = stream_hub.subscribe(wanted)
+    if sub is None:
+        await websocket.close(code=1013, reason="Too many stream clients")
+        return
+
+    await websocket.accept()
+    try:
+        await websocket.send_text(dumps({"type": "ready", "data": {"types": sorted(wanted)}}).decode())
+        while True:
+            try:
+                e = await sub.get(stream_hub.heartbeat)
+            except asyncio.TimeoutError:
+                e = {"type": "ping", "data": None}
+            if e is None:
+                await websocket.close(code=1001)
+                return
+            await websocket.send_text(dumps(e).decode())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        stream_hub.unsubscribe(sub)
+
+
+# -------------------------
+# アーカイブ（保持期間を過ぎた月）
+# -------------------------
+@router.get("/archive")
+async def list_log_archives(current_user=Depends(get_current_user)):
+    return await run_in_threadpool(archive.list_archives)
+
+
+@router.get("/archive/{year}/{month}")
+async def get_archived_logs(
+    year: int = Path(ge=1, le=9999),
+    month: int = Path(ge=1, le=12),
+    task_id: int | None = None,
+    user_id: int | None = None,
+    action_type: str | None = None,
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    current_user=Depends(get_current_user)
+):
+    """
+    DB から切り離された月のログを gzip JSONL から読む（ファイルを順に走査）。
+    """
+    page = await run_in_threadpool(
+        archive.read_archive, year, month, task_id, user_id, action_type, cursor, limit
+    )
+    if page is None:
+        raise HTTPException(404, "Month not archived")
+    return page
+
+
+@router.get("/by-task/{task_id}", response_model=ActivityLogPage)
+async def logs_by_task(
     task_id: int,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    expand: tuple[str, ...] = Depends(log_expand),
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
-    logs = db.query(ActivityLog).filter(
-        ActivityLog.task_id == task_id
-    ).order_by(ActivityLog.created_at.desc()).all()
+    criteria = [ActivityLog.task_id == task_id]
 
-    return logs
+    return await run_db(db, log_page, criteria, cursor, limit, expand)
@@ -0,0 +1,56 @@
+"""
+One-time tickets for the live feed (GET /logs/stream, /logs/stream/ws).
+
+EventSource and browser WebSockets cannot send an Authorization header.
+A bearer token in the URL would end up in uvicorn and proxy access logs
+and in browser history, and it stays valid there until it expires. The
+client instead sends its token to POST /logs/stream-ticket and opens the
+stream with ?ticket=. A ticket is random, works once, and expires after
+STREAM_TICKET_TTL seconds, so a URL that was logged is of no use.
+
+Tickets are rows in stream_tickets, so any worker can redeem one. Only
+their SHA-256 is stored, and the redeeming DELETE ... RETURNING makes
+sure a ticket opens one stream at most. Expired rows are deleted when
+new tickets are issued.
+"""
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app.models import StreamTicket
+
+TTL = int(os.getenv("STREAM_TICKET_TTL", "30"))
+
+
+def _hash(ticket: str) -> str:
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+def issue(db: Session, user_id: int) -> str:
+    now = datetime.utcnow()
+    ticket = secrets.token_urlsafe(32)
+
+    db.execute(delete(StreamTicket).where(StreamTicket.expires_at < now))
+    db.add(StreamTicket(ticket_hash=_hash(ticket), user_id=user_id, expires_at=now + timedelta(seconds=TTL)))
+    db.commit()
+    return ticket
+
+
+def redeem(db: Session, ticket: str) -> int | None:
+    """
+    The ticket's user id, or None if it is unknown, used or expired.
+    """
+    row = db.execute(
+        delete(StreamTicket)
+        .where(StreamTicket.ticket_hash == _hash(ticket))
+        .returning(StreamTicket.user_id, StreamTicket.expires_at)
+    ).first()
+    db.commit()
+
+    if row is None or row.expires_at < datetime.utcnow():
+        return None
+    return row.user_id
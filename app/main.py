@@ -1,15 +1,87 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from app.auth.router import router as auth_router
 from app.tasks.router import router as tasks_router
 from app.logs.router import router as logs_router
 from app.kpi.router import router as kpi_router   
 from app.tasks.seed import router as seed_router
-from app.db import Base, engine
+from app.admin.router import router as admin_router
+from app.jobs.router import router as jobs_router
+from app.logs.buffer import log_buffer
+from app.auth.hasher import hash_pool
+from app.logs.partitions import partition_maintainer
+from app.kpi.columnar import columnar_kpi
+from app.stream import stream_hub
+from app.jobs.runner import job_runner
+from app.tasks.changes import tombstone_pruner
+from app.config import db_settings
+from app.db import pool_statuses, wait_for_database
+from app.health import router as health_router
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics, startup_report
+from app.migrate import prepare_schema
+from app.startup import warm_pool, warm_queries
+from app.traffic import TrafficRecorderMiddleware, traffic_recorder
+
+
+# --------------------------
+# 起動・終了
+# --------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 起動の途中で失敗しても、そこまでに起動したスレッド・プールは必ず止める（各 stop は未起動なら何もしない）
+    try:
+        # import 時には DB に触れない。ここで順に用意してから受け付ける（各フェーズの秒数は /health/ready）
+        with startup_report.phase("database"):
+            # Postgres が遅れて起動しても DB_STARTUP_TIMEOUT までは待つ
+            await run_in_threadpool(wait_for_database, db_settings.startup_timeout)
+        with startup_report.phase("schema"):
+            # スキーマは Alembic（create_all はしない）。DB_MIGRATE=check なら head になるまで待つだけ
+            startup_report.details["schema_revision"] = await run_in_threadpool(prepare_schema)
+
+        with startup_report.phase("partitions"):
+            # 今月〜数か月先の activity_logs パーティションを用意してから受け付ける
+            partition_maintainer.start()
+        tombstone_pruner.start()
+        log_buffer.start()
+        hash_pool.start()
+        with startup_report.phase("columnar_kpi"):
+            # KPI_ENGINE=columnar のときだけ tasks を列に読み込み、変更フィードを追うスレッドを起動
+            columnar_kpi.start()
+        traffic_recorder.start()
+        # STREAM_BACKEND=postgres のときだけ LISTEN / NOTIFY のスレッドを起動
+        stream_hub.start()
+        job_runner.start()
+
+        with startup_report.phase("pool_warmup"):
+            startup_report.details["pool_connections"] = await warm_pool()
+        if db_settings.warmup_queries:
+            with startup_report.phase("query_warmup"):
+                startup_report.details["warmup"] = await warm_queries()
+        startup_report.ready()
+
+        yield
+    finally:
+        # /health/ready を先に 503 にする
+        startup_report.draining()
+        # 実行中のジョブは次のチャンクの区切りで止め、待ち行列のジョブは cancelled にする
+        job_runner.stop()
+        # 受け付け済みのイベントを書き切ってから終了する
+        log_buffer.stop()
+        hash_pool.stop()
+        partition_maintainer.stop()
+        tombstone_pruner.stop()
+        columnar_kpi.stop()
+        traffic_recorder.stop()
+        # 接続中のストリームも終わらせる
+        stream_hub.stop()
 
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="Efficient System API",
+    lifespan=lifespan,
 )
 
 app.include_router(auth_router, prefix="/auth", tags=["Auth"])
@@ -17,6 +89,18 @@ app.include_router(tasks_router, prefix="/tasks", tags=["Tasks"])
 app.include_router(logs_router, prefix="/logs", tags=["Activity Logs"])
 app.include_router(kpi_router, prefix="/kpi", tags=["KPI"])   
 app.include_router(seed_router, prefix="/tasks", tags=["Seed"])
+app.include_router(admin_router, prefix="/admin", tags=["Admin"])
+app.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
+app.include_router(health_router, prefix="/health", tags=["Health"])
+
+
+# --------------------------
+# メトリクス（Prometheus）
+# --------------------------
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(pool_statuses()), media_type=CONTENT_TYPE)
+
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -27,3 +111,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+
+# TRAFFIC_RECORD_FILE が設定されたときだけ記録（bench/replay.py で再生）
+if traffic_recorder.enabled:
+    app.add_middleware(TrafficRecorderMiddleware)
+
+# 最外側：CORS の preflight も含めて計測する
+app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,385 @@
+"""
+Per-request latency and SQL cost metrics, exposed in Prometheus text format.
+
+MetricsMiddleware times every HTTP request and labels it with the route
+template (/tasks/{task_id}, not /tasks/42). While a request runs, a
+RequestStats object sits in a context variable; the engine's cursor
+hooks (app.db_instrumentation) add each statement's count and duration
+to it. The context is copied into run_in_threadpool / run_sync calls, so
+queries issued from the threadpool or the async session are still
+attributed to the request. A queries-per-request histogram that jumps
+for one route is the N+1 signal.
+
+Statements slower than DB_SLOW_QUERY_MS go to the slow-query log with
+their SQL template (bound parameters stay as placeholders) and route.
+
+StartupReport records the cold start: seconds from process start to the
+end of each startup phase, to ready, and to the first request served
+(health probes excluded), plus that request's latency.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (cumulative counts, Prometheus style).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+
+        return {"count": count, "sum": total, "buckets": cumulative}
+
+
+# ---------------------------
+# リクエスト単位の SQL 集計
+# ---------------------------
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_template(self.scope)
+
+
+def route_template(scope: dict) -> str:
+    """
+    Path template of the matched route, e.g. /tasks/{task_id}.
+
+    scope["route"] is set once routing has matched. Depending on the
+    FastAPI version it is the route of the included router, whose path
+    lacks the include_router prefix; the prefix is then recovered from the
+    request path (prefixes in this app have no parameters).
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return UNMATCHED_ROUTE
+
+    path = scope["path"]
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for i in range(1, len(path)):
+            if path[i] == "/" and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def record_query(seconds: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+
+
+class SlowQueryLog:
+    """
+    Last `maxlen` slow statements, plus a running count per (route, template).
+    """
+
+    def __init__(self, maxlen: int = 200):
+        self.recent = deque(maxlen=maxlen)
+        self.counts: dict[tuple[str, str], list] = {}  # -> [count, total_ms, max_ms]
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed_ms: float):
+        stats = current_request.get()
+        route = stats.route if stats is not None else None
+        template = " ".join(statement.split())
+
+        with self._lock:
+            self.recent.append({
+                "at": time.time(),
+                "route": route,
+                "ms": round(elapsed_ms, 1),
+                "statement": template,
+            })
+            entry = self.counts.setdefault((route, template), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+            entry[2] = max(entry[2], elapsed_ms)
+        return route
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            top = sorted(self.counts.items(), key=lambda kv: kv[1][1], reverse=True)
+            return {
+                "recent": list(self.recent)[::-1],
+                "by_statement": [
+                    {
+                        "route": route,
+                        "statement": template,
+                        "count": count,
+                        "total_ms": round(total, 1),
+                        "max_ms": round(worst, 1),
+                    }
+                    for (route, template), (count, total, worst) in top[:50]
+                ],
+            }
+
+    def total_by_route(self) -> dict:
+        totals: dict = {}
+        with self._lock:
+            for (route, _), (count, _, _) in self.counts.items():
+                totals[route] = totals.get(route, 0) + count
+        return totals
+
+
+slow_query_log = SlowQueryLog()
+
+
+# ---------------------------
+# ルート別メトリクス
+# ---------------------------
+class RouteMetrics:
+    def __init__(self):
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.db_time: dict[tuple[str, str], Histogram] = {}
+        self.queries: dict[tuple[str, str], Histogram] = {}
+        self.responses: dict[tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.db_time[key] = Histogram(LATENCY_BUCKETS)
+                self.queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            rkey = (method, route, str(status))
+            self.responses[rkey] = self.responses.get(rkey, 0) + 1
+
+        self.latency[key].observe(seconds)
+        self.db_time[key].observe(stats.db_seconds)
+        self.queries[key].observe(stats.queries)
+
+
+route_metrics = RouteMetrics()
+
+
+# ---------------------------
+# 起動時間（cold start）
+# ---------------------------
+def process_start_time() -> float:
+    """
+    Wall-clock time this process started (Linux: /proc), else now.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # starttime（")" の後ろから数えて 20 番目：起動からのクロック数）
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class StartupReport:
+    def __init__(self):
+        self.started = process_start_time()
+        self.state = "starting"  # starting -> ready -> draining
+        self.phases: dict[str, float] = {}  # 各フェーズの所要秒
+        self.details: dict[str, object] = {}
+        self.ready_after = None
+        self.first_request_after = None
+        self.first_request_seconds = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 4)
+
+    def ready(self):
+        self.ready_after = round(time.time() - self.started, 4)
+        self.state = "ready"
+
+    def draining(self):
+        self.state = "draining"
+
+    def served(self, path: str, seconds: float):
+        if self.first_request_after is not None or path.startswith("/health"):
+            return
+        with self._lock:
+            if self.first_request_after is None:
+                self.first_request_after = round(time.time() - self.started, 4)
+                self.first_request_seconds = round(seconds, 4)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "phases": dict(self.phases),
+            **self.details,
+            "ready_after_start_s": self.ready_after,
+            "first_request_after_start_s": self.first_request_after,
+            "first_request_s": self.first_request_seconds,
+        }
+
+
+startup_report = StartupReport()
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware: the request is measured until the last body
+    chunk is sent, so streaming responses (exports) include their queries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            elapsed = time.perf_counter() - start
+            route_metrics.observe(scope["method"], stats.route, status, elapsed, stats)
+            startup_report.served(scope["path"], elapsed)
+
+
+# ---------------------------
+# Prometheus テキスト形式
+# ---------------------------
+def _labels(**labels) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, labels: dict, snap: dict) -> list[str]:
+    lines = [
+        f"{name}_bucket{_labels(**labels, le=le)} {n}"
+        for le, n in snap["buckets"].items()
+    ]
+    lines.append(f"{name}_sum{_labels(**labels)} {snap['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {snap['count']}")
+    return lines
+
+
+def _family(out: list, name: str, kind: str, help: str):
+    out.append(f"# HELP {name} {help}")
+    out.append(f"# TYPE {name} {kind}")
+
+
+def render_metrics(pools: dict) -> str:
+    """
+    `pools` maps an engine name to its app.db_instrumentation.pool_status().
+    """
+    out: list[str] = []
+    m = route_metrics
+    with m._lock:
+        keys = sorted(m.latency)
+        responses = sorted(m.responses.items())
+
+    _family(out, "http_requests_total", "counter", "HTTP responses by route and status.")
+    for (method, route, status), n in responses:
+        out.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {n}")
+
+    for name, source, help in (
+        ("http_request_duration_seconds", m.latency, "Request latency by route."),
+        ("http_request_db_seconds", m.db_time, "Time spent in SQL per request."),
+        ("http_request_queries", m.queries, "SQL statements executed per request."),
+    ):
+        _family(out, name, "histogram", help)
+        for method, route in keys:
+            out += _histogram_lines(name, {"method": method, "route": route}, source[(method, route)].snapshot())
+
+    _family(out, "db_slow_queries_total", "counter", "Statements slower than DB_SLOW_QUERY_MS.")
+    for route, n in sorted(slow_query_log.total_by_route().items(), key=lambda kv: str(kv[0])):
+        out.append(f"db_slow_queries_total{_labels(route=route or '')} {n}")
+
+    gauges = (
+        ("db_pool_size", "size", "Configured pool size."),
+        ("db_pool_checked_out", "checked_out", "Connections currently checked out."),
+        ("db_pool_overflow", "overflow", "Overflow connections currently open."),
+    )
+    for name, field, help in gauges:
+        _family(out, name, "gauge", help)
+        for engine, status in pools.items():
+            out.append(f"{name}{_labels(engine=engine)} {status[field]}")
+
+    _family(out, "db_pool_timeouts_total", "counter", "Checkouts that hit DB_POOL_TIMEOUT.")
+    for engine, status in pools.items():
+        out.append(f"db_pool_timeouts_total{_labels(engine=engine)} {status['timeouts']}")
+
+    _family(out, "db_pool_checkout_wait_seconds", "histogram", "Time to obtain a pooled connection.")
+    for engine, status in pools.items():
+        out += _histogram_lines("db_pool_checkout_wait_seconds", {"engine": engine}, status["checkout_wait_seconds"])
+
+    _family(out, "app_ready", "gauge", "1 once startup has finished, 0 while starting or draining.")
+    out.append(f"app_ready {int(startup_report.state == 'ready')}")
+    _family(out, "app_startup_phase_seconds", "gauge", "Duration of each startup phase.")
+    for phase, seconds in startup_report.phases.items():
+        out.append(f"app_startup_phase_seconds{_labels(phase=phase)} {seconds}")
+    for name, value, help in (
+        ("app_ready_after_start_seconds", startup_report.ready_after, "Process start to ready."),
+        ("app_first_request_after_start_seconds", startup_report.first_request_after,
+         "Process start to the first request served (health probes excluded)."),
+    ):
+        if value is not None:
+            _family(out, name, "gauge", help)
+            out.append(f"{name} {value}")
+
+    return "\n".join(out) + "\n"
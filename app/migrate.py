@@ -0,0 +1,168 @@
+"""
+Schema migrations (Alembic, app/migrations).
+
+    python -m app.migrate upgrade    # wait for the database, migrate to head
+    python -m app.migrate current    # revision of the database and of the code
+    python -m app.migrate check      # exit 1 unless the database is at head
+
+The `alembic` CLI works as well (alembic.ini at the repo root), e.g.
+`alembic revision --autogenerate -m "..."` for the next migration.
+
+The server changes the schema only with DB_MIGRATE=upgrade. With the
+default DB_MIGRATE=check it waits (up to DB_STARTUP_TIMEOUT) for the
+database to reach head, which lets a separate migration step run
+first. upgrade() takes an advisory lock, so several workers started
+together migrate once.
+
+Databases created by the old create_all() at startup have the tables
+but no alembic_version, and may predate parts of 0001. upgrade() first
+creates whatever 0001 objects are missing (adopt_schema): the
+task_month_stats rollup, backfilled from tasks, the month indexes, the
+search columns, and on Postgres the partitioned activity_logs (the same
+rebuild as `python -m app.logs.partitions convert`). It then stamps the
+database as 0001 and continues from there. Later revisions skip objects
+that create_all() already made.
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect, text
+
+from app.config import db_settings
+from app.db import engine, wait_for_database
+from app.kpi import rollup
+from app.logs import partitions
+from app.models import ActivityLog, Task, TaskMonthStat
+from app.search import ensure_search_columns
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = Path(__file__).parent / "migrations"
+BASELINE = "0001"
+LOCK_KEY = 0x61C7_0001  # pg_advisory_xact_lock のキー（マイグレーション）
+
+# 0001 の索引（create_all() 時代の DB には無いことがある）
+BASELINE_INDEXES = {
+    Task.__table__: ("ix_tasks_created_at_status", "ix_tasks_assignee_id_created_at", "ix_tasks_created_at_id"),
+    ActivityLog.__table__: ("ix_activity_logs_created_at", "ix_activity_logs_task_id_created_at"),
+}
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS))
+    config.attributes["connection"] = connection
+    return config
+
+
+def head_revision() -> str:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def current_revision(conn) -> str | None:
+    return MigrationContext.configure(conn).get_current_revision()
+
+
+# ---------------------------
+# 適用
+# ---------------------------
+def adopt_schema(conn):
+    """
+    Bring a database made by create_all() up to revision 0001 without
+    touching what it already has.
+    """
+    if conn.dialect.name == "postgresql" and not partitions.is_partitioned(conn):
+        # 索引・検索列ごと作り直す（ACCESS EXCLUSIVE：コミットまで書き込みを止める）
+        logger.warning("converting activity_logs to monthly partitions")
+        partitions.convert(conn)
+    ensure_search_columns(conn)
+
+    inspector = inspect(conn)
+
+    for table, names in BASELINE_INDEXES.items():
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in names and index.name not in existing:
+                logger.warning("building %s", index.name)
+                index.create(conn)
+
+    if not inspector.has_table(TaskMonthStat.__tablename__):
+        TaskMonthStat.__table__.create(conn)
+        logger.warning("task_month_stats backfilled: %d buckets", rollup.backfill(conn))
+
+
+def upgrade() -> str:
+    """
+    Migrate to head in one transaction. Returns the new revision.
+    """
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+
+        config = alembic_config(conn)
+        if current_revision(conn) is None and inspect(conn).has_table("tasks"):
+            # create_all() 時代の DB：足りない 0001 の中身を作ってから 0001 とする
+            logger.warning("adopting an existing schema as revision %s", BASELINE)
+            adopt_schema(conn)
+            command.stamp(config, BASELINE)
+
+        command.upgrade(config, "head")
+        return current_revision(conn)
+
+
+def wait_for_head(timeout: float) -> str:
+    """
+    Wait until another process has migrated the database to head.
+    """
+    head = head_revision()
+    deadline = time.monotonic() + timeout
+    while True:
+        with engine.connect() as conn:
+            current = current_revision(conn)
+        if current == head:
+            return current
+        if time.monotonic() > deadline:
+            raise RuntimeError(
+                f"database schema is at {current or 'nothing'}, the code needs {head}: "
+                "run `python -m app.migrate upgrade` (or start with DB_MIGRATE=upgrade)"
+            )
+        logger.warning("waiting for migrations (database at %s, head %s)", current, head)
+        time.sleep(1.0)
+
+
+def prepare_schema(mode: str = db_settings.migrate, timeout: float = db_settings.startup_timeout) -> str:
+    # 起動時（lifespan）：DB_MIGRATE=upgrade なら適用、check なら head になるまで待つ
+    if mode == "upgrade":
+        return upgrade()
+    return wait_for_head(timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="schema migrations")
+    parser.add_argument("command", choices=["upgrade", "current", "check"])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    wait_for_database(db_settings.startup_timeout)
+
+    if args.command == "upgrade":
+        print(f"at {upgrade()}")
+        return
+
+    with engine.connect() as conn:
+        current = current_revision(conn)
+    head = head_revision()
+    print(f"database: {current or '-'}  head: {head}")
+    if args.command == "check" and current != head:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Alembic environment. Connects with app.db's engine (DATABASE_URL), or
+uses the connection app.migrate passes in config.attributes.
+"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.db import Base, engine
+import app.models  # noqa: F401  Base.metadata にテーブルを登録
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # 月パーティションと検索用の生成列は ORM の外で管理する（autogenerate の差分に出さない）
+    if type_ == "table" and reflected and compare_to is None and name.startswith("activity_logs_"):
+        return False
+    if type_ == "column" and name == "search_vector":
+        return False
+    if type_ == "index" and name.endswith("_search_vector"):
+        return False
+    # SQLite の変更フィード用カウンタ（CHANGE_CLOCK_DDL）
+    if type_ == "table" and reflected and compare_to is None and name == "change_clock":
+        return False
+    return True
+
+
+def run(connection):
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+elif config.attributes.get("connection") is not None:
+    run(config.attributes["connection"])
+else:
+    with engine.connect() as connection:
+        run(connection)
+        connection.commit()
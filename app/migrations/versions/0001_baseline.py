@@ -0,0 +1,110 @@
+"""baseline: users, tasks, activity_logs (partitioned), task_month_stats
+
+The schema as create_all() used to build it on startup. Databases that
+were created that way get the objects of this revision they lack
+(app.migrate.adopt_schema) and are then stamped at it instead of
+running it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 全文検索の生成列（app/models.py の SEARCH_DOCUMENTS と同じ式）
+SEARCH_DOCUMENTS = {
+    "tasks": "coalesce(title, '') || ' ' || coalesce(description, '')",
+    "activity_logs": "coalesce(detail, '')",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    postgres = op.get_bind().dialect.name == "postgresql"
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("password_hash", sa.String()),
+        sa.Column("role", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("username"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+
+    op.create_table(
+        "tasks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String()),
+        sa.Column("description", sa.Text()),
+        sa.Column("status", sa.String()),
+        sa.Column("assignee_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("creator_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("due_date", sa.DateTime()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tasks_id", "tasks", ["id"])
+    op.create_index("ix_tasks_created_at_status", "tasks", ["created_at", "status"])
+    op.create_index("ix_tasks_assignee_id_created_at", "tasks", ["assignee_id", "created_at"])
+    op.create_index("ix_tasks_created_at_id", "tasks", ["created_at", "id"])
+
+    op.create_table(
+        "activity_logs",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("task_id", sa.Integer(), sa.ForeignKey("tasks.id")),
+        sa.Column("action_type", sa.String()),
+        sa.Column("detail", sa.Text()),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id", "created_at"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    op.create_index("ix_activity_logs_id", "activity_logs", ["id"])
+    op.create_index("ix_activity_logs_created_at", "activity_logs", ["created_at", "id"])
+    op.create_index("ix_activity_logs_task_id_created_at", "activity_logs", ["task_id", "created_at", "id"])
+    if postgres:
+        # 月パーティションは app/logs/partitions.py が作る。それまでの受け皿
+        op.execute("CREATE TABLE activity_logs_default PARTITION OF activity_logs DEFAULT")
+
+    op.create_table(
+        "task_month_stats",
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("assignee_id", sa.Integer(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("month", "status", "assignee_id"),
+    )
+
+    if postgres:
+        for table, document in SEARCH_DOCUMENTS.items():
+            op.execute(
+                f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED"
+            )
+            op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("task_month_stats")
+    op.drop_table("activity_logs")  # パーティションも一緒に消える
+    op.drop_table("tasks")
+    op.drop_table("users")
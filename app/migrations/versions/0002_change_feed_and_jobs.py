@@ -0,0 +1,70 @@
+"""change feed (task_tombstones, ix_tasks_updated_at_id) and jobs
+
+A database stamped at 0001 by app.migrate may already have some of
+these objects, made by create_all() before migrations existed. Each one
+is created only if it is missing.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:01
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    task_indexes = {index["name"] for index in inspector.get_indexes("tasks")}
+
+    if "ix_tasks_updated_at_id" not in task_indexes:
+        # tasks への書き込みは索引ができるまで待たされる（100 万行で数秒）
+        op.create_index("ix_tasks_updated_at_id", "tasks", ["updated_at", "id"])
+
+    if not inspector.has_table("task_tombstones"):
+        op.create_table(
+            "task_tombstones",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("task_id", sa.Integer()),
+            sa.Column("deleted_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_task_tombstones_deleted_at_task_id", "task_tombstones", ["deleted_at", "task_id"])
+
+    if not inspector.has_table("jobs"):
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("kind", sa.String(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("params", sa.JSON()),
+            sa.Column("result", sa.JSON()),
+            sa.Column("error", sa.Text()),
+            sa.Column("done", sa.BigInteger(), nullable=False),
+            sa.Column("total", sa.BigInteger()),
+            sa.Column("cancel_requested", sa.Boolean(), nullable=False),
+            sa.Column("created_by", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("started_at", sa.DateTime()),
+            sa.Column("finished_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_jobs_status_created_at", "jobs", ["status", "created_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("jobs")
+    op.drop_table("task_tombstones")
+    op.drop_index("ix_tasks_updated_at_id", table_name="tasks")
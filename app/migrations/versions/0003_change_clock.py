@@ -0,0 +1,109 @@
+"""commit-ordered change feed position (change_xid)
+
+tasks and task_tombstones get change_xid, stamped by the database in
+commit order (app.models.CHANGE_CLOCK_DDL), and the feed index moves
+from (updated_at, id) to (change_xid, id). Existing rows get 0, which
+is a metadata-only change on Postgres (no table rewrite), and are
+ordered by id within it.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:02
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# app/models.py の CHANGE_CLOCK_DDL と同じ文。create_all() で先に作られていることがあるので
+# トリガーは作り直す / 無ければ作る
+CHANGE_CLOCK_DDL = {
+    "postgresql": [
+        "ALTER TABLE tasks ALTER COLUMN change_xid SET DEFAULT (pg_current_xact_id()::text::bigint)",
+        """
+        CREATE OR REPLACE FUNCTION tasks_change_xid() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.change_xid := pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END $$
+        """,
+        "DROP TRIGGER IF EXISTS tasks_change_xid ON tasks",
+        "CREATE TRIGGER tasks_change_xid BEFORE UPDATE ON tasks FOR EACH ROW EXECUTE FUNCTION tasks_change_xid()",
+        "ALTER TABLE task_tombstones ALTER COLUMN change_xid SET DEFAULT (pg_current_xact_id()::text::bigint)",
+    ],
+    "sqlite": [
+        "CREATE TABLE IF NOT EXISTS change_clock (value INTEGER NOT NULL)",
+        "INSERT INTO change_clock (value) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_clock)",
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_change_xid_insert AFTER INSERT ON tasks BEGIN
+            UPDATE change_clock SET value = value + 1;
+            UPDATE tasks SET change_xid = (SELECT value FROM change_clock) WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS tasks_change_xid_update
+        AFTER UPDATE OF title, description, status, assignee_id, creator_id, due_date, created_at, updated_at
+        ON tasks BEGIN
+            UPDATE change_clock SET value = value + 1;
+            UPDATE tasks SET change_xid = (SELECT value FROM change_clock) WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS task_tombstones_change_xid AFTER INSERT ON task_tombstones BEGIN
+            UPDATE change_clock SET value = value + 1;
+            UPDATE task_tombstones SET change_xid = (SELECT value FROM change_clock) WHERE id = NEW.id;
+        END
+        """,
+    ],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for table in ("tasks", "task_tombstones"):
+        if "change_xid" in {column["name"] for column in inspector.get_columns(table)}:
+            continue
+        op.add_column(table, sa.Column("change_xid", sa.BigInteger(), nullable=False, server_default=sa.text("0")))
+    for statement in CHANGE_CLOCK_DDL.get(bind.dialect.name, []):
+        op.execute(statement)
+
+    # CREATE INDEX CONCURRENTLY で先に作ってあればそのまま（README）
+    task_indexes = {index["name"] for index in inspector.get_indexes("tasks")}
+    if "ix_tasks_change_xid_id" not in task_indexes:
+        op.create_index("ix_tasks_change_xid_id", "tasks", ["change_xid", "id"])
+    tombstone_indexes = {index["name"] for index in inspector.get_indexes("task_tombstones")}
+    if "ix_task_tombstones_change_xid_task_id" not in tombstone_indexes:
+        op.create_index("ix_task_tombstones_change_xid_task_id", "task_tombstones", ["change_xid", "task_id"])
+    if "ix_tasks_updated_at_id" in task_indexes:
+        op.drop_index("ix_tasks_updated_at_id", table_name="tasks")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+
+    op.create_index("ix_tasks_updated_at_id", "tasks", ["updated_at", "id"])
+    op.drop_index("ix_task_tombstones_change_xid_task_id", table_name="task_tombstones")
+    op.drop_index("ix_tasks_change_xid_id", table_name="tasks")
+
+    if dialect == "postgresql":
+        op.execute("DROP TRIGGER tasks_change_xid ON tasks")
+        op.execute("DROP FUNCTION tasks_change_xid()")
+    elif dialect == "sqlite":
+        for trigger in ("tasks_change_xid_insert", "tasks_change_xid_update", "task_tombstones_change_xid"):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE change_clock")
+
+    for table in ("task_tombstones", "tasks"):
+        op.drop_column(table, "change_xid")
@@ -0,0 +1,39 @@
+"""stream_tickets (one-time tickets for /logs/stream)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:03
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+
+    # create_all() で先に作られていることがある
+    if not inspector.has_table("stream_tickets"):
+        op.create_table(
+            "stream_tickets",
+            sa.Column("ticket_hash", sa.String(length=64), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("ticket_hash"),
+        )
+        op.create_index("ix_stream_tickets_expires_at", "stream_tickets", ["expires_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("stream_tickets")
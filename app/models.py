@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, ForeignKey, Text, JSON, Index, DDL, PrimaryKeyConstraint, event, text
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateColumn
 from datetime import datetime
 from app.db import Base
 
@@ -31,21 +33,238 @@ class Task(Base):
     due_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
+    # 変更フィードの位置（コミット順）。DB 側で振る：CHANGE_CLOCK_DDL
+    change_xid = Column(BigInteger, nullable=False, server_default=text("0"))
 
     assignee = relationship("User", foreign_keys=[assignee_id])
     creator = relationship("User", foreign_keys=[creator_id])
     logs = relationship("ActivityLog", back_populates="task")
 
+    __table_args__ = (
+        # 月次 KPI / 一覧（created_at の範囲 + status 集計）
+        Index("ix_tasks_created_at_status", "created_at", "status"),
+        # 担当者別 KPI
+        Index("ix_tasks_assignee_id_created_at", "assignee_id", "created_at"),
+        # 一覧の keyset pagination（created_at DESC, id DESC）
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        # 変更フィード（GET /tasks/changes：change_xid ASC, id ASC）
+        Index("ix_tasks_change_xid_id", "change_xid", "id"),
+    )
+
+
+class TaskTombstone(Base):
+    """
+    削除されたタスクの記録（GET /tasks/changes が tombstone として返す）。
+    delete_task / 一括 delete と同じトランザクションで書く。
+    task_id が NULL の行は印：reset（reset_all はこの表も空にしてから 1 行だけ書く）か、
+    保持期間を過ぎて消した tombstone の境界（prune_tombstones）。
+    """
+    __tablename__ = "task_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=True)  # 外部キーなし：タスクはもう無い
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    change_xid = Column(BigInteger, nullable=False, server_default=text("0"))
+
+    __table_args__ = (
+        # 保持期間での削除
+        Index("ix_task_tombstones_deleted_at_task_id", "deleted_at", "task_id"),
+        # 変更フィード
+        Index("ix_task_tombstones_change_xid_task_id", "change_xid", "task_id"),
+    )
+
+
+# ---------------------------
+# 変更フィードの位置（app/tasks/changes.py）
+# ---------------------------
+# 書き込んだトランザクションの順に増える値を DB 側で振る（アプリの時計は使わない）。
+# Postgres：トランザクション id（xid8）。INSERT は列の既定値、UPDATE はトリガー。
+#   pg_snapshot_xmin より小さい値のトランザクションはすべて終わっている。
+# SQLite：書き込みは直列なので、change_clock の値を書き込みロックの中で 1 ずつ進める。
+CHANGE_CLOCK_DDL = {
+    "postgresql": {
+        "tasks": [
+            "ALTER TABLE tasks ALTER COLUMN change_xid SET DEFAULT (pg_current_xact_id()::text::bigint)",
+            """
+            CREATE OR REPLACE FUNCTION tasks_change_xid() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                NEW.change_xid := pg_current_xact_id()::text::bigint;
+                RETURN NEW;
+            END $$
+            """,
+            "CREATE TRIGGER tasks_change_xid BEFORE UPDATE ON tasks FOR EACH ROW EXECUTE FUNCTION tasks_change_xid()",
+        ],
+        "task_tombstones": [
+            "ALTER TABLE task_tombstones ALTER COLUMN change_xid SET DEFAULT (pg_current_xact_id()::text::bigint)",
+        ],
+    },
+    "sqlite": {
+        "tasks": [
+            "CREATE TABLE IF NOT EXISTS change_clock (value INTEGER NOT NULL)",
+            "INSERT INTO change_clock (value) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_clock)",
+            """
+            CREATE TRIGGER tasks_change_xid_insert AFTER INSERT ON tasks BEGIN
+                UPDATE change_clock SET value = value + 1;
+                UPDATE tasks SET change_xid = (SELECT value FROM change_clock) WHERE id = NEW.id;
+            END
+            """,
+            """
+            CREATE TRIGGER tasks_change_xid_update
+            AFTER UPDATE OF title, description, status, assignee_id, creator_id, due_date, created_at, updated_at
+            ON tasks BEGIN
+                UPDATE change_clock SET value = value + 1;
+                UPDATE tasks SET change_xid = (SELECT value FROM change_clock) WHERE id = NEW.id;
+            END
+            """,
+        ],
+        "task_tombstones": [
+            """
+            CREATE TRIGGER task_tombstones_change_xid AFTER INSERT ON task_tombstones BEGIN
+                UPDATE change_clock SET value = value + 1;
+                UPDATE task_tombstones SET change_xid = (SELECT value FROM change_clock) WHERE id = NEW.id;
+            END
+            """,
+        ],
+    },
+}
+
+for _dialect, _tables in CHANGE_CLOCK_DDL.items():
+    for _table in (Task.__table__, TaskTombstone.__table__):
+        for _statement in _tables[_table.name]:
+            event.listen(_table, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+
 
 class ActivityLog(Base):
+    """
+    created_at の月ごとにレンジパーティション化（app/logs/partitions.py が管理）。
+    パーティションキーを主キーに含める必要があるため主キーは (id, created_at)。
+    """
     __tablename__ = "activity_logs"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=True)
     action_type = Column(String)
     detail = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
 
     user = relationship("User", back_populates="logs")
     task = relationship("Task", back_populates="logs")
+
+    __table_args__ = (
+        # 月次ログ（id は keyset pagination のタイブレーク）
+        Index("ix_activity_logs_created_at", "created_at", "id"),
+        # タスク別ログ
+        Index("ix_activity_logs_task_id_created_at", "task_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+# 月パーティションが未作成の行の受け皿
+event.listen(
+    ActivityLog.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS activity_logs_default PARTITION OF activity_logs DEFAULT")
+    .execute_if(dialect="postgresql"),
+)
+
+
+# SQLite（テスト・ローカル用）は複合主キーの id を自動採番できない：
+# id だけを INTEGER PRIMARY KEY（rowid の別名）にする。パーティションもないので困らない
+@compiles(CreateColumn, "sqlite")
+def _sqlite_log_id(create, compiler, **kw):
+    column = create.element
+    if column.table.name == "activity_logs" and column.name == "id":
+        return f"{compiler.preparer.format_column(column)} INTEGER PRIMARY KEY"
+    return compiler.visit_create_column(create, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_log_primary_key(constraint, compiler, **kw):
+    if constraint.table.name == "activity_logs":
+        return None
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
+# ---------------------------
+# 全文検索（Postgres のみ。app/search.py）
+# ---------------------------
+# ORM には載せない生成列：一覧・更新では読み書きせず、検索クエリだけが参照する
+SEARCH_CONFIG = "simple"
+SEARCH_DOCUMENTS = {
+    "tasks": "coalesce(title, '') || ' ' || coalesce(description, '')",
+    "activity_logs": "coalesce(detail, '')",
+}
+
+
+def search_ddl(table: str) -> list[str]:
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', {SEARCH_DOCUMENTS[table]})) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING gin (search_vector)",
+    ]
+
+
+for _table in (Task.__table__, ActivityLog.__table__):
+    for _statement in search_ddl(_table.name):
+        event.listen(_table, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+
+class TaskMonthStat(Base):
+    """
+    月 × status × 担当者 ごとのタスク件数（KPI 用ロールアップ）。
+    app/kpi/rollup.py がタスクの作成・更新・削除と同じトランザクションで更新する。
+    """
+    __tablename__ = "task_month_stats"
+
+    month = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    # 0 = 未割り当て（主キーに NULL は使えないため）
+    assignee_id = Column(Integer, primary_key=True, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class Job(Base):
+    """
+    バックグラウンドジョブ（app/jobs/runner.py）。
+    状態を DB に置くので、どのワーカーに来た GET /jobs/{id} / cancel でも同じ結果になる。
+    """
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    # queued -> running -> succeeded | failed | cancelled
+    status = Column(String, nullable=False, default="queued")
+    params = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    done = Column(BigInteger, nullable=False, default=0)
+    total = Column(BigInteger)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 一覧（新しい順）・排他ジョブの実行中チェック
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+    )
+
+
+class StreamTicket(Base):
+    """
+    ライブフィードの 1 回限りのチケット（app/logs/tickets.py）。
+    チケットそのものではなく SHA-256 を持つ。どのワーカーでも引き換えられる。
+    """
+    __tablename__ = "stream_tickets"
+
+    ticket_hash = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # 期限切れの削除
+        Index("ix_stream_tickets_expires_at", "expires_at"),
+    )
@@ -0,0 +1,112 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+# ---------------------------
+# カーソル（opaque）
+# ---------------------------
+def _encode(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    return _encode([created_at.isoformat(), id])
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = _decode(cursor)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+# 検索結果用：(rank, id)。float は repr で往復するので境界の行を取りこぼさない
+def encode_rank_cursor(rank: float, id: int) -> str:
+    return _encode([rank, id])
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        rank, id = _decode(cursor)
+        return float(rank), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+# 変更フィード用：(change_xid, id, 同期開始時の位置)。0003 より前の (updated_at, id) 形式は None（古すぎる）
+def encode_change_cursor(position: int, id: int, floor: int) -> str:
+    return _encode([position, id, floor])
+
+
+def decode_change_cursor(cursor: str) -> tuple[int, int, int] | None:
+    try:
+        values = _decode(cursor)
+        if not isinstance(values, list) or len(values) not in (2, 3):
+            raise ValueError("unexpected cursor payload")
+        if len(values) == 2 and isinstance(values[0], str):
+            datetime.fromisoformat(values[0])
+            return None
+        position, id, floor = values
+        return int(position), int(id), int(floor)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+# ---------------------------
+# keyset pagination
+# ---------------------------
+def paginate(query, created_col, id_col, cursor: str | None, limit: int):
+    """
+    One page of `query` ordered by (created_at DESC, id DESC).
+
+    The cursor is the (created_at, id) of the last row already returned,
+    so page N costs the same index range scan as page 1 instead of an
+    OFFSET that skips N * limit rows. Returns (rows, next_cursor), with
+    next_cursor None on the last page.
+    """
+    if cursor:
+        query = query.filter(tuple_(created_col, id_col) < decode_cursor(cursor))
+
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, created_col.key), getattr(last, id_col.key)
+        )
+
+    return rows, next_cursor
+
+
+def paginate_ranked(query, rank_col, id_col, cursor: str | None, limit: int):
+    """
+    Like paginate(), ordered by (rank DESC, id DESC) for search results.
+    """
+    if cursor:
+        query = query.filter(tuple_(rank_col, id_col) < decode_rank_cursor(cursor))
+
+    rows = query.order_by(rank_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_rank_cursor(getattr(last, rank_col.key), getattr(last, id_col.key))
+
+    return rows, next_cursor
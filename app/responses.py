@@ -0,0 +1,50 @@
+"""
+Fast JSON path for list endpoints.
+
+List and export endpoints select only the columns they return, as plain
+rows (no ORM objects, no identity map), and serialize them here with
+orjson. The response is returned as a prebuilt Response, so FastAPI does
+not validate each row again through response_model. The model is still
+declared on the route for the OpenAPI schema, and the column lists below
+must match it.
+
+orjson writes naive datetimes the same way pydantic does
+("2025-01-02T03:04:05"). Without orjson installed, the standard json
+module is used.
+"""
+from datetime import date, datetime
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+    import json
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def row_dicts(columns: tuple[str, ...], rows) -> list[dict]:
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def page_response(items: list[dict], next_cursor: str | None, **extra) -> FastJSONResponse:
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor, **extra})
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, field_validator
+from typing import Any, Optional, List, Literal
 from datetime import datetime
 
 # ---------------------
@@ -64,6 +64,103 @@ class TaskOut(TaskBase):
         orm_mode = True
 
 
+class UserRef(BaseModel):
+    id: int
+    username: str
+
+
+class TaskRef(BaseModel):
+    id: int
+    title: str
+    status: str
+
+
+class TaskExpandedOut(TaskOut):
+    """
+    TaskOut plus the relations requested with ?expand= (absent otherwise).
+    """
+    assignee: Optional[UserRef] = None
+    creator: Optional[UserRef] = None
+
+
+class TaskPage(BaseModel):
+    items: List[TaskExpandedOut]
+    next_cursor: Optional[str] = None
+
+
+class TaskSearchHit(TaskOut):
+    rank: float
+
+
+class TaskSearchPage(BaseModel):
+    """
+    truncated: older matches were not ranked. Search again with
+    end=searched_from to rank the next older ones.
+    """
+    items: List[TaskSearchHit]
+    next_cursor: Optional[str] = None
+    truncated: bool = False
+    searched_from: Optional[datetime] = None
+
+
+class TaskChangeOut(TaskOut):
+    updated_at: datetime
+
+
+class TaskChanges(BaseModel):
+    """
+    GET /tasks/changes: apply changes (upsert) and deleted. reset means the
+    cursor is too old: drop every local task and sync again without since.
+    """
+    reset: bool
+    changes: List[TaskChangeOut]
+    deleted: List[int]
+    cursor: Optional[str] = None
+    has_more: bool
+
+
+class TaskPatch(BaseModel):
+    """
+    一括更新用：指定したフィールドだけを書き換える。
+    null で消せるのは description / assignee_id / due_date だけ。
+    """
+    title: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[str] = None
+    assignee_id: Optional[int] = None
+    due_date: Optional[datetime] = None
+
+    @field_validator("title", "status")
+    @classmethod
+    def not_null(cls, value, info):
+        # 省略時はここを通らない（明示的な null だけを拒否）
+        if value is None:
+            raise ValueError(f"{info.field_name} may not be null")
+        return value
+
+
+class BulkOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None     # update / delete
+    data: Optional[dict] = None  # create: TaskCreate, update: TaskPatch
+
+
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation]
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    op: str
+    id: Optional[int] = None
+    ok: bool
+    error: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    results: List[BulkItemResult]
+
+
 # ---------------------
 # Activity Log
 # ---------------------
@@ -78,3 +175,78 @@ class ActivityLogOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class ActivityLogExpandedOut(ActivityLogOut):
+    """
+    ActivityLogOut plus the relations requested with ?expand= (absent
+    otherwise). task is null when the task was deleted.
+    """
+    user: Optional[UserRef] = None
+    task: Optional[TaskRef] = None
+
+
+class ActivityLogPage(BaseModel):
+    items: List[ActivityLogExpandedOut]
+    next_cursor: Optional[str] = None
+
+
+class ActivityLogSearchHit(ActivityLogOut):
+    rank: float
+
+
+class ActivityLogSearchPage(BaseModel):
+    """
+    truncated: older matches were not ranked. Search again with
+    end=searched_from to rank the next older ones.
+    """
+    items: List[ActivityLogSearchHit]
+    next_cursor: Optional[str] = None
+    truncated: bool = False
+    searched_from: Optional[datetime] = None
+
+
+class LogEvent(BaseModel):
+    task_id: Optional[int] = None
+    action_type: str
+    detail: Optional[str] = ""
+    created_at: Optional[datetime] = None  # 省略時は受付時刻
+
+    @field_validator("action_type", "detail")
+    @classmethod
+    def no_nul(cls, value, info):
+        # Postgres の text は NUL を持てない：受け付けてから書けないイベントにしない
+        if value is not None and "\x00" in value:
+            raise ValueError(f"{info.field_name} may not contain NUL characters")
+        return value
+
+
+class LogBatch(BaseModel):
+    events: List[LogEvent]
+
+
+class StreamTicketOut(BaseModel):
+    ticket: str       # /logs/stream?ticket= に 1 回だけ使える
+    expires_in: int   # 秒
+
+
+# ---------------------
+# Background Job
+# ---------------------
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    status: str   # queued | running | succeeded | failed | cancelled
+    params: dict
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    done: int
+    total: Optional[int] = None
+    progress: Optional[float] = None  # done / total
+    cancel_requested: bool
+    created_by: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: datetime
@@ -0,0 +1,271 @@
+"""
+Full-text search over tasks (title + description) and activity logs (detail).
+
+Postgres: both tables carry a stored generated column
+`search_vector = to_tsvector('simple', ...)` with a GIN index (DDL in
+app/models.py). Every word of q must match (plainto_tsquery). Results are
+ordered by ts_rank, with id as the tie-break, and paged by a (rank, id)
+keyset cursor. The 'simple' configuration lowercases words but does not
+stem them, and it treats Japanese and English text alike.
+
+Only the newest SEARCH_MAX_CANDIDATES matching rows (by created_at, after
+the filters) are ranked, plus any that share the oldest one's created_at.
+A rare word is answered from the GIN index. A very common word is
+answered by walking the created_at index until enough rows match. Either
+way the work per request stays bounded, where ranking every one of a
+million matches would not. When older matches were left out, the page
+says so: search_page() returns `searched_from`, the created_at the
+ranking started at, and a search with end=searched_from ranks the next
+older window. No match falls between the two windows.
+
+Other databases (SQLite test runs): an in-process inverted index per
+table stands in. Tasks are re-read after the task hooks report a change,
+and logs are read incrementally by id, since they are only appended.
+Scores are term counts rather than ts_rank values. The order is
+comparable but the numbers are not.
+
+Migration 0001 creates the column. A database from before migrations
+gets it when app.migrate adopts it (ensure_search_columns), which
+rewrites the table once.
+"""
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import Float, cast, func, literal_column, select, text
+
+from app.db import engine
+from app.models import SEARCH_CONFIG, SEARCH_DOCUMENTS, ActivityLog, Task, search_ddl
+from app.pagination import decode_rank_cursor, encode_rank_cursor, paginate_ranked
+from app.tasks import hooks
+
+logger = logging.getLogger(__name__)
+
+MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "2000"))
+LOAD_CHUNK = 10_000
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(value: str | None) -> list[str]:
+    return _WORD.findall(value.lower()) if value else []
+
+
+# ---------------------------
+# 列・索引の用意（Postgres）
+# ---------------------------
+def ensure_search_columns(conn):
+    if conn.dialect.name != "postgresql":
+        return
+
+    for table in SEARCH_DOCUMENTS:
+        add_column, create_index = search_ddl(table)
+        exists = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = :table AND column_name = 'search_vector'
+            )
+        """), {"table": table}).scalar()
+        if not exists:
+            logger.warning("adding search_vector to %s (rewrites the table)", table)
+            conn.execute(text(add_column))
+
+        index = conn.execute(
+            text("SELECT to_regclass(:name)"), {"name": f"ix_{table}_search_vector"}
+        ).scalar()
+        if index is None:
+            logger.warning("building ix_%s_search_vector", table)
+            conn.execute(text(create_index))
+
+
+# ---------------------------
+# フォールバック：プロセス内の転置索引
+# ---------------------------
+class InvertedIndex:
+    def __init__(self, model, document: tuple, append_only: bool, enabled: bool):
+        self.model = model
+        self.document = document        # 索引する列
+        self.append_only = append_only  # True：id > 読み込み済みの最大 id だけ読み足す
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._postings: dict[str, dict[int, int]] = {}  # 語 -> {id: 出現回数}
+        self._docs: dict[int, Counter] = {}
+        self._dirty: set[int] = set()
+        self._loaded = False
+        self._last_id = 0
+
+    # ---------------------------
+    # 変更の受け取り（タスクのフック）
+    # ---------------------------
+    def invalidate(self, ids):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._dirty.update(ids)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._dirty.clear()
+            self._loaded = False
+            self._last_id = 0
+
+    # ---------------------------
+    # 索引の更新
+    # ---------------------------
+    def _add(self, id: int, values):
+        counts = Counter(word for value in values for word in tokenize(value))
+        self._docs[id] = counts
+        for word, n in counts.items():
+            self._postings.setdefault(word, {})[id] = n
+        self._last_id = max(self._last_id, id)
+
+    def _remove(self, id: int):
+        for word in self._docs.pop(id, ()):
+            postings = self._postings.get(word)
+            if postings is not None:
+                postings.pop(id, None)
+                if not postings:
+                    del self._postings[word]
+
+    def _read(self, db, *criteria):
+        q = db.query(self.model.id, *self.document).filter(*criteria).order_by(self.model.id)
+        for row in q.yield_per(LOAD_CHUNK):
+            self._add(row[0], row[1:])
+
+    def _refresh(self, db):
+        if not self._loaded:
+            self._dirty.clear()
+            self._read(db)
+            self._loaded = True
+        elif self.append_only:
+            self._read(db, self.model.id > self._last_id)
+
+        if self._dirty:
+            ids, self._dirty = list(self._dirty), set()
+            for id in ids:
+                self._remove(id)
+            self._read(db, self.model.id.in_(ids))
+
+    def search(self, db, words: list[str]) -> dict[int, float]:
+        """
+        {id: score} of the rows containing every word.
+        """
+        with self._lock:
+            self._refresh(db)
+            postings = sorted((self._postings.get(w, {}) for w in set(words)), key=len)
+            if not postings or not postings[0]:
+                return {}
+            ids = set(postings[0]).intersection(*postings[1:])
+            return {id: float(sum(p[id] for p in postings)) for id in ids}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "loaded": self._loaded,
+                "documents": len(self._docs),
+                "words": len(self._postings),
+                "pending": len(self._dirty),
+            }
+
+
+_fallback = engine.dialect.name != "postgresql"
+
+task_index = InvertedIndex(Task, (Task.title, Task.description), append_only=False, enabled=_fallback)
+log_index = InvertedIndex(ActivityLog, (ActivityLog.detail,), append_only=True, enabled=_fallback)
+
+
+@hooks.on_change
+def _invalidate_tasks(changes):
+    task_index.invalidate(change.id for change in changes)
+
+
+@hooks.on_reset
+def _clear_indexes():
+    # reset はタスクとログを両方消す
+    task_index.clear()
+    log_index.clear()
+
+
+# ---------------------------
+# 検索（1 ページ）
+# ---------------------------
+def _window(db, model, criteria: list) -> datetime | None:
+    """
+    created_at of the oldest row to rank, or None when every match is.
+    """
+    # 新しい順に MAX_CANDIDATES 件目の created_at（同時刻の行は全部入れる）
+    start = db.scalar(
+        select(model.created_at)
+        .where(*criteria)
+        .order_by(model.created_at.desc())
+        .offset(MAX_CANDIDATES - 1)
+        .limit(1)
+    )
+    if start is None:
+        return None
+    older = db.scalar(select(model.id).where(*criteria, model.created_at < start).limit(1))
+    return start if older is not None else None
+
+
+def _pg_page(db, model, columns: tuple, criteria: list, q: str, cursor, limit: int):
+    vector = literal_column(f"{model.__tablename__}.search_vector")
+    tsquery = func.plainto_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q)
+    criteria = [vector.op("@@")(tsquery), *criteria]
+
+    # ts_rank は新しい側の窓（約 MAX_CANDIDATES 件）だけで計算する
+    start = _window(db, model, criteria)
+    if start is not None:
+        criteria.append(model.created_at >= start)
+    candidates = select(*columns, vector.label("search_vector")).where(*criteria).subquery("candidates")
+    rank = cast(func.ts_rank(candidates.c.search_vector, tsquery), Float).label("rank")
+    query = db.query(*(candidates.c[c.key] for c in columns), rank)
+
+    rows, next_cursor = paginate_ranked(query, rank, candidates.c.id, cursor, limit)
+    return rows, next_cursor, start
+
+
+def _memory_page(db, index: InvertedIndex, columns: tuple, criteria: list, words: list[str], cursor, limit: int):
+    model = index.model
+    after = decode_rank_cursor(cursor) if cursor else None
+    scores = index.search(db, words)
+    if not scores:
+        return [], None, None
+
+    criteria = [model.id.in_(list(scores)), *criteria]
+    start = _window(db, model, criteria)
+    if start is not None:
+        criteria.append(model.created_at >= start)
+    rows = db.query(*columns).filter(*criteria).all()
+    ranked = sorted(((scores[row.id], row.id, tuple(row)) for row in rows), reverse=True)
+    if after is not None:
+        ranked = [r for r in ranked if (r[0], r[1]) < after]
+
+    page = ranked[:limit + 1]
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_rank_cursor(page[-1][0], page[-1][1])
+
+    return [values + (score,) for score, _, values in page], next_cursor, start
+
+
+def search_page(db, index: InvertedIndex, columns: tuple, criteria: list, q: str, cursor, limit: int):
+    """
+    One page of `columns` + rank for rows matching every word of q.
+    Returns (rows, next_cursor, searched_from): rows and next_cursor like
+    paginate(), and searched_from as described above (None when every
+    match was ranked). `columns` must include the model's id.
+    """
+    words = tokenize(q)
+    if not words:
+        return [], None, None
+    if index.enabled:
+        return _memory_page(db, index, columns, criteria, words, cursor, limit)
+    return _pg_page(db, index.model, columns, criteria, q, cursor, limit)
@@ -0,0 +1,101 @@
+"""
+Startup warm-up, run by the lifespan handler in app/main.py before the
+first request is accepted.
+
+- warm_pool: opens DB_POOL_WARMUP connections (at most DB_POOL_SIZE) on
+  the engine that serves requests, at the same time, and returns them to
+  the pool. The first burst of requests then does not pay for TCP,
+  authentication and pre-ping one connection at a time.
+- warm_queries: runs each hot read once with limit 1: principal lookup,
+  task and log pages, a single task, the change feed and the KPI
+  dashboard query. This fills SQLAlchemy's compiled-statement cache (and
+  asyncpg's prepared statements on the warmed connections). The first
+  real request then skips compilation. Everything runs in one
+  transaction that is rolled back. Nothing is cached in the KPI cache,
+  and a failure is logged without stopping startup.
+
+Each step is timed in app.metrics.startup_report, so that
+/health/ready and /metrics report the cold start.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import db_settings
+from app.db import AsyncSessionLocal, SessionLocal, async_engine, engine, run_db
+from app.filters import in_month, resolve_month
+from app.kpi import service as kpi_service
+from app.logs.router import log_page
+from app.models import ActivityLog, Task, User
+from app.tasks.changes import changes_page
+from app.tasks.router import TASK_CHANGE_COLUMNS, task_page, task_row
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# 接続プール
+# ---------------------------
+def _open_sync(n: int):
+    with ThreadPoolExecutor(n) as executor:
+        connections = list(executor.map(lambda _: engine.connect(), range(n)))
+    for conn in connections:
+        conn.close()  # プールに戻る（pool_size までは保持される）
+
+
+async def warm_pool(n: int = db_settings.pool_warmup) -> int:
+    n = min(n, db_settings.pool_size)
+    if n <= 0:
+        return 0
+    if async_engine is None:
+        await run_in_threadpool(_open_sync, n)
+        return n
+
+    connections = await asyncio.gather(*(async_engine.connect().start() for _ in range(n)))
+    await asyncio.gather(*(conn.close() for conn in connections))
+    return n
+
+
+# ---------------------------
+# よく使うクエリ（コンパイル結果のキャッシュ）
+# ---------------------------
+def _hot_queries(db) -> dict:
+    year, month = resolve_month(None, None)
+    queries = {
+        "principal": lambda: db.get(User, 0),
+        "task_page": lambda: task_page(db, [in_month(Task.created_at, year, month)], None, 1),
+        "task_row": lambda: task_row(db, 0),
+        "log_page": lambda: log_page(db, [in_month(ActivityLog.created_at, year, month)], None, 1),
+        "task_changes": lambda: changes_page(db, TASK_CHANGE_COLUMNS, None, 1),
+    }
+    if kpi_service.KPI_ENGINE != "columnar":
+        queries["kpi_dashboard"] = lambda: kpi_service.query_dashboard(db, year, month)
+
+    failed = {}
+    for name, run in queries.items():
+        try:
+            run()
+        except Exception as e:
+            # 起動は止めない（初回リクエストがコンパイルするだけ）
+            logger.warning("warm-up query %s failed: %s", name, e)
+            failed[name] = str(e).splitlines()[0]
+            db.rollback()
+    db.rollback()
+    return {"queries": len(queries) - len(failed), "failed": failed}
+
+
+async def warm_queries() -> dict:
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            return await run_db(db, _hot_queries)
+
+    def run():
+        db = SessionLocal()
+        try:
+            return _hot_queries(db)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(run)
@@ -0,0 +1,448 @@
+"""
+Live activity feed: new activity logs and KPI deltas (GET /logs/stream).
+
+Writers publish events after their commit:
+
+  * log    : one new activity_logs row. Rows added through the ORM
+             (app/tasks/service.py) are collected by Session events.
+             Core bulk inserts (POST /tasks/bulk, the /logs/batch buffer)
+             call publish_logs() with the rows their INSERT returned.
+  * kpi    : per-month count deltas derived from the task hooks, e.g.
+             {"month": "2025-12", "deltas": [{"status": "done",
+             "assignee_id": 3, "delta": 1}, ...]}. Applied to the
+             /kpi/dashboard of that month, they keep it current.
+  * resync : state changed in a way that is not sent as events (reset,
+             seed, a lost listener connection, a failed NOTIFY, or this
+             client fell behind). Clients refetch what they display.
+
+StreamHub fans events out to subscribers. Each subscriber has a bounded
+queue. A client that falls STREAM_QUEUE_SIZE events behind either loses
+its backlog and gets one resync (STREAM_OVERFLOW=resync, the default),
+or loses the new events and is told how many (drop).
+
+Backends (STREAM_BACKEND):
+
+  * memory   : events go straight to this process's subscribers.
+  * postgres : events are sent with NOTIFY on one channel, and every
+               worker (the sender included) LISTENs and fans out what it
+               receives. All workers see the same events in the same
+               order. This is the default when DATABASE_URL is Postgres.
+
+A NOTIFY payload is limited to 8000 bytes, so events are packed into
+payloads below that, and a log's detail is cut to MAX_DETAIL characters
+(with "truncated": true) in the event.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict, deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db import engine
+from app.filters import month_start
+from app.models import ActivityLog
+from app.tasks import hooks
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "activity_stream"
+EVENT_TYPES = ("log", "kpi", "resync")
+MAX_PAYLOAD = 7900   # NOTIFY の上限は 8000 バイト
+MAX_DETAIL = 1000
+
+# publish_logs() に渡す行の列（INSERT ... RETURNING で使う）
+LOG_EVENT_COLUMNS = (
+    ActivityLog.id,
+    ActivityLog.task_id,
+    ActivityLog.user_id,
+    ActivityLog.action_type,
+    ActivityLog.detail,
+    ActivityLog.created_at,
+)
+LOG_EVENT_KEYS = tuple(c.key for c in LOG_EVENT_COLUMNS)
+
+
+# ---------------------------
+# イベント
+# ---------------------------
+def log_event(values: dict) -> dict:
+    data = {key: values[key] for key in LOG_EVENT_KEYS}
+    data["created_at"] = data["created_at"].isoformat() if data["created_at"] else None
+    detail = data["detail"]
+    if detail and len(detail) > MAX_DETAIL:
+        data["detail"] = detail[:MAX_DETAIL]
+        data["truncated"] = True
+    return {"type": "log", "data": data}
+
+
+def kpi_events(changes) -> list[dict]:
+    """
+    One kpi event per month touched by `changes` (net deltas, zeros dropped).
+    """
+    deltas = defaultdict(int)
+    for change in changes:
+        if change.before == change.after:
+            continue
+        for state, sign in ((change.before, -1), (change.after, 1)):
+            if state is not None:
+                deltas[(month_start(state.created_at), state.status, state.assignee_id)] += sign
+
+    months = defaultdict(list)
+    for (month, status, assignee_id), delta in sorted(deltas.items(), key=lambda kv: (kv[0][0], kv[0][1], kv[0][2] or 0)):
+        if delta:
+            months[month].append({"status": status, "assignee_id": assignee_id, "delta": delta})
+
+    return [
+        {"type": "kpi", "data": {"month": month.strftime("%Y-%m"), "deltas": items}}
+        for month, items in months.items()
+    ]
+
+
+def resync_event(reason: str) -> dict:
+    return {"type": "resync", "data": {"reason": reason}}
+
+
+def pack(events: list[dict], limit: int = MAX_PAYLOAD) -> list[str]:
+    """
+    JSON arrays of events, each at most `limit` bytes. A kpi event that is
+    too big on its own is split by deltas.
+    """
+    payloads, current, size = [], [], 2
+    for e in _split(events, limit):
+        encoded = json.dumps(e, ensure_ascii=False, separators=(",", ":"))
+        n = len(encoded.encode()) + 1
+        if current and size + n > limit:
+            payloads.append("[" + ",".join(current) + "]")
+            current, size = [], 2
+        current.append(encoded)
+        size += n
+    if current:
+        payloads.append("[" + ",".join(current) + "]")
+    return payloads
+
+
+def _split(events: list[dict], limit: int):
+    for e in events:
+        deltas = e["data"].get("deltas", ())
+        if e["type"] != "kpi" or len(deltas) < 2 or len(json.dumps(e).encode()) < limit:
+            yield e
+            continue
+        month = e["data"]["month"]
+        step = max(1, len(deltas) // 2)
+        for i in range(0, len(deltas), step):
+            yield from _split([{"type": "kpi", "data": {"month": month, "deltas": deltas[i:i + step]}}], limit)
+
+
+# ---------------------------
+# 購読者
+# ---------------------------
+class Subscription:
+    def __init__(self, hub: "StreamHub", types: set[str], max_queue: int, overflow: str):
+        self.hub = hub
+        self.types = types
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.dropped = 0    # overflow=drop：まだ通知していない破棄件数
+        self.resyncs = 0
+
+    def offer(self, e: dict | None):
+        # イベントループ上でのみ呼ばれる（resync は types に関係なく届ける）
+        if e is not None and e["type"] not in self.types and e["type"] != "resync":
+            return
+        try:
+            self.queue.put_nowait(e)
+        except asyncio.QueueFull:
+            if e is None:
+                # 終了の合図は必ず届ける
+                self._clear()
+                self.queue.put_nowait(None)
+            elif self.overflow == "resync":
+                self._clear()
+                self.queue.put_nowait(resync_event("overflow"))
+                self.resyncs += 1
+                self.hub.overflows += 1
+            else:
+                self.dropped += 1
+                self.hub.overflows += 1
+
+    def _clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def get(self, timeout: float) -> dict | None:
+        """
+        Next event. Raises asyncio.TimeoutError when nothing arrives within
+        `timeout`, and returns None when the hub shuts down.
+        """
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"type": "dropped", "data": {"count": dropped}}
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+# ---------------------------
+# ハブ
+# ---------------------------
+class StreamHub:
+    def __init__(
+        self,
+        backend: str,
+        max_queue: int = 1000,
+        overflow: str = "resync",
+        max_clients: int = 1000,
+        heartbeat: float = 15.0,
+    ):
+        if backend not in ("memory", "postgres"):
+            raise RuntimeError(f"STREAM_BACKEND must be 'memory' or 'postgres', got {backend!r}")
+        if overflow not in ("resync", "drop"):
+            raise RuntimeError(f"STREAM_OVERFLOW must be 'resync' or 'drop', got {overflow!r}")
+
+        self.backend = backend
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+
+        self._subscribers: set[Subscription] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+        # postgres：NOTIFY 送信待ち（publish はリクエストのスレッドから呼ばれる）
+        self._outbox: deque = deque()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self.notify_errors = 0
+        self.reconnects = 0
+
+    # ---------------------------
+    # 送信（任意のスレッドから）
+    # ---------------------------
+    def publish(self, events: list[dict]):
+        if not events:
+            return
+        self.published += len(events)
+        if self.backend == "postgres":
+            with self._cond:
+                if len(self._outbox) >= self.max_queue * 10:
+                    # 送信が詰まっている：古いものを捨て、受信側には resync を送る
+                    self._outbox.clear()
+                    self._outbox.append(resync_event("overflow"))
+                    self.overflows += 1
+                self._outbox.extend(events)
+                self._cond.notify()
+        else:
+            self._deliver(events)
+
+    def _deliver(self, events: list[dict]):
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, events)
+        except RuntimeError:
+            # ループが閉じている（終了処理中）
+            pass
+
+    def _dispatch(self, events: list[dict]):
+        for sub in list(self._subscribers):
+            for e in events:
+                sub.offer(e)
+        self.delivered += len(events) * len(self._subscribers)
+
+    # ---------------------------
+    # 購読（イベントループ上で）
+    # ---------------------------
+    def subscribe(self, types: set[str]) -> Subscription | None:
+        """
+        A new subscription, or None when STREAM_MAX_CLIENTS are connected.
+        """
+        if len(self._subscribers) >= self.max_clients:
+            return None
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(self, types, self.max_queue, self.overflow)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+
+    # ---------------------------
+    # ライフサイクル
+    # ---------------------------
+    def start(self):
+        if self.backend != "postgres" or self._threads:
+            return
+        self._stopping = False
+        for target, name in ((self._send_loop, "stream-notify"), (self._listen_loop, "stream-listen")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+        # 接続中のストリームを終わらせる（graceful shutdown を待たせない）
+        if self._loop is not None and self._subscribers:
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, [None])
+            except RuntimeError:
+                pass
+
+    # ---------------------------
+    # postgres バックエンド
+    # ---------------------------
+    def _connect(self):
+        raw = engine.raw_connection()
+        conn = raw.driver_connection
+        raw.detach()  # プールに返さない専用接続
+        conn.rollback()  # pre-ping で始まったトランザクションを閉じてから autocommit
+        conn.autocommit = True
+        return raw, conn
+
+    def _send_loop(self):
+        raw, lost = None, False
+        while True:
+            with self._cond:
+                # 失った後は新しいイベントを待たずにつなぎ直して resync を送る
+                while not self._outbox and not lost and not self._stopping:
+                    self._cond.wait()
+                if not self._outbox and self._stopping:
+                    break
+                events = list(self._outbox)
+                self._outbox.clear()
+
+            try:
+                if raw is None:
+                    raw, conn = self._connect()
+                with conn.cursor() as cur:
+                    # どのワーカーにも届いていない：全員に（自分にも）先に resync
+                    for payload in pack([resync_event("notify_failed")] + events if lost else events):
+                        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+                lost = False
+            except Exception:
+                self.notify_errors += 1
+                logger.exception("stream NOTIFY failed; %d events lost", len(events))
+                lost = True
+                raw = self._close(raw)
+                time.sleep(1.0)
+        self._close(raw)
+
+    def _listen_loop(self):
+        raw, backoff = None, 0.5
+        while not self._stopping:
+            try:
+                if raw is None:
+                    raw, conn = self._connect()
+                    with conn.cursor() as cur:
+                        cur.execute(f"LISTEN {CHANNEL}")
+                    if self.reconnects:
+                        # 切断中のイベントは届いていない
+                        self._deliver([resync_event("reconnect")])
+                    backoff = 0.5
+
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                events = []
+                while conn.notifies:
+                    events.extend(json.loads(conn.notifies.pop(0).payload))
+                if events:
+                    self._deliver(events)
+            except Exception:
+                logger.exception("stream LISTEN connection lost; reconnecting")
+                self.reconnects += 1
+                raw = self._close(raw)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+        self._close(raw)
+
+    @staticmethod
+    def _close(raw):
+        if raw is not None:
+            try:
+                raw.close()
+            except Exception:
+                pass
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "clients": len(self._subscribers),
+            "max_clients": self.max_clients,
+            "queue_size": self.max_queue,
+            "overflow": self.overflow,
+            "backlog": max((s.queue.qsize() for s in list(self._subscribers)), default=0),
+            "outbox": len(self._outbox),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+            "notify_errors": self.notify_errors,
+            "reconnects": self.reconnects,
+        }
+
+
+stream_hub = StreamHub(
+    backend=os.getenv("STREAM_BACKEND") or ("postgres" if engine.dialect.name == "postgresql" else "memory"),
+    max_queue=int(os.getenv("STREAM_QUEUE_SIZE", "1000")),
+    overflow=os.getenv("STREAM_OVERFLOW", "resync"),
+    max_clients=int(os.getenv("STREAM_MAX_CLIENTS", "1000")),
+    heartbeat=float(os.getenv("STREAM_HEARTBEAT", "15")),
+)
+
+
+def publish_logs(rows):
+    """
+    Publish rows of LOG_EVENT_COLUMNS (e.g. from INSERT ... RETURNING).
+    """
+    stream_hub.publish([log_event(dict(zip(LOG_EVENT_KEYS, row))) for row in rows])
+
+
+# ---------------------------
+# 発行元
+# ---------------------------
+@hooks.on_change
+def _publish_kpi_deltas(changes):
+    stream_hub.publish(kpi_events(changes))
+
+
+@hooks.on_reset
+def _publish_reset():
+    stream_hub.publish([resync_event("reset")])
+
+
+# ORM で追加されたログ（create_log）：flush で値を拾い、commit 後に送る
+@event.listens_for(Session, "after_flush")
+def _collect_logs(session, flush_context):
+    logs = [obj for obj in session.new if isinstance(obj, ActivityLog)]
+    if logs:
+        session.info.setdefault("stream_logs", []).extend(
+            log_event({key: getattr(obj, key) for key in LOG_EVENT_KEYS}) for obj in logs
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_logs(session):
+    events = session.info.pop("stream_logs", None)
+    if events:
+        stream_hub.publish(events)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_logs(session, previous_transaction):
+    session.info.pop("stream_logs", None)
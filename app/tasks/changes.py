@@ -0,0 +1,257 @@
+"""
+Incremental change feed (GET /tasks/changes).
+
+A client keeps a cursor and asks for everything after it: tasks created
+or updated after the cursor, merged with the tombstones of tasks deleted
+after it. Each request is two keyset range scans: ix_tasks_change_xid_id
+and ix_task_tombstones_change_xid_task_id. A sync therefore costs the
+number of changes since the last one, not the size of the table.
+
+Rows are ordered by (change_xid, id). change_xid is stamped by the
+database, not the app clock (app.models.CHANGE_CLOCK_DDL):
+
+- Postgres: the id of the writing transaction. A transaction with a
+  smaller id can still be in flight, so the feed only returns rows below
+  pg_snapshot_xmin of the current snapshot: every transaction below it
+  has finished, and no row can appear behind the cursor later. A long
+  write transaction holds the feed back until it ends; it is never
+  skipped.
+- SQLite: a counter bumped inside the write transaction. Writes are
+  serialized, so counter order is commit order and nothing is held back.
+
+Tombstones are written in the same transaction as the delete and are
+kept for CHANGES_TOMBSTONE_RETENTION_DAYS (TombstonePruner). Both reset_all
+and the pruner leave a marker (task_id NULL): everything before the
+marker is gone, so a cursor older than a marker gets a restart response
+(reset true, nothing else, cursor null) and the client syncs again from
+scratch. The same happens to a cursor from before migration 0003.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models import Task, TaskTombstone
+from app.pagination import decode_change_cursor, encode_change_cursor
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("CHANGES_TOMBSTONE_RETENTION_DAYS", "30"))
+PRUNE_INTERVAL = float(os.getenv("CHANGES_PRUNE_INTERVAL", "3600"))
+
+# 印の位置は (change_xid, 0)：タスク id は 1 から始まるので同じトランザクションの変更より先に並ぶ
+_MARKER_ID = 0
+
+# 全員 restart：手元を捨てて since なしから取り直す
+_RESTART = {"reset": True, "changes": [], "deleted": [], "cursor": None, "has_more": True}
+
+
+# ---------------------------
+# tombstone の記録（削除と同じトランザクション）
+# ---------------------------
+def record_deletes(db: Session, task_ids, deleted_at: datetime):
+    rows = [{"task_id": task_id, "deleted_at": deleted_at} for task_id in task_ids]
+    if rows:
+        db.execute(insert(TaskTombstone), rows)
+
+
+def record_reset(db: Session) -> TaskTombstone:
+    marker = TaskTombstone(task_id=None, deleted_at=datetime.utcnow())
+    db.add(marker)
+    return marker
+
+
+# ---------------------------
+# 変更の読み出し（1 ページ）
+# ---------------------------
+def _horizon(db: Session) -> int | None:
+    """
+    change_xid below which every writer has finished (None: no limit).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+
+def _floor(db: Session, horizon: int | None) -> int:
+    """
+    Every write that has not committed yet is stamped at this or above.
+    """
+    if horizon is not None:
+        return horizon
+    # SQLite：書き込みは直列。次の書き込みは今のカウンタより大きい
+    return db.execute(text("SELECT value FROM change_clock")).scalar() + 1
+
+
+def changes_page(db: Session, columns: tuple, since: str | None, limit: int) -> dict:
+    """
+    Up to `limit` changes after `since`, oldest first. `columns` are the
+    task columns to return and must include Task.id.
+
+    Returns {"reset", "changes", "deleted", "cursor", "has_more"}. Apply
+    a page's changes before its deletes: an id that was deleted and then
+    used again within the page is only in changes. With nothing new the
+    cursor is `since` unchanged. A cursor that may have
+    missed a reset or a pruned tombstone gets the restart response.
+
+    The cursor also carries the floor of the sync that started without
+    `since`. A marker below it is older than everything the client holds
+    (the reset, or the deletes pruned with it, came first), so it does
+    not restart that client while it pages through the older rows.
+    """
+    if since:
+        after = decode_change_cursor(since)
+        if after is None:
+            return dict(_RESTART)
+        position, id, floor = after
+        after = (position, id)
+        horizon = _horizon(db)
+    else:
+        after = None
+        horizon = _horizon(db)
+        floor = _floor(db, horizon)
+
+    tasks = db.query(*columns, Task.change_xid)
+    tombstone_id = func.coalesce(TaskTombstone.task_id, _MARKER_ID)
+    tombstones = db.query(TaskTombstone.change_xid, tombstone_id)
+    if horizon is not None:
+        tasks = tasks.filter(Task.change_xid < horizon)
+        tombstones = tombstones.filter(TaskTombstone.change_xid < horizon)
+    if after is not None:
+        tasks = tasks.filter(tuple_(Task.change_xid, Task.id) > after)
+        tombstones = tombstones.filter(tuple_(TaskTombstone.change_xid, tombstone_id) > after)
+
+        # 同期を始めた後の印より前のカーソル：その間の tombstone はもう無い
+        marker = (
+            tombstones.filter(TaskTombstone.task_id.is_(None), TaskTombstone.change_xid >= floor)
+            .limit(1)
+            .first()
+        )
+        if marker is not None:
+            return dict(_RESTART)
+    tombstones = tombstones.filter(TaskTombstone.task_id.is_not(None))
+
+    # 両方から limit + 1 件ずつ読んで (change_xid, id) 順にマージ
+    task_rows = tasks.order_by(Task.change_xid, Task.id).limit(limit + 1).all()
+    tombstone_rows = (
+        tombstones.order_by(TaskTombstone.change_xid, tombstone_id).limit(limit + 1).all()
+    )
+    merged = sorted(
+        [((row.change_xid, row.id), row) for row in task_rows]
+        + [((change_xid, task_id), None) for change_xid, task_id in tombstone_rows],
+        key=lambda item: item[0],
+    )
+    page, has_more = merged[:limit], len(merged) > limit
+
+    changes, deleted = [], {}
+    for (_, id), row in page:
+        if row is not None:
+            changes.append(row)
+            # 削除の後に同じ id で作り直された（SQLite は rowid を再利用する）
+            deleted.pop(id, None)
+        else:
+            deleted[id] = None
+
+    cursor = encode_change_cursor(*page[-1][0], floor) if page else since
+    return {"reset": False, "changes": changes, "deleted": list(deleted), "cursor": cursor, "has_more": has_more}
+
+
+def head_cursor(db: Session) -> str:
+    """
+    A cursor before every write that has not committed yet. Read the
+    table after taking it and follow the feed from it, and nothing is
+    missed (rows committed in between are returned again).
+    """
+    floor = _floor(db, _horizon(db))
+    return encode_change_cursor(floor - 1, _MARKER_ID, floor)
+
+
+# ---------------------------
+# tombstone の保持期間
+# ---------------------------
+def prune_tombstones(db: Session, before: datetime) -> int:
+    """
+    Drop tombstones older than `before`. Let X be the newest change_xid
+    among them: every tombstone below X is deleted and one of them is
+    kept as the marker at X, so exactly the cursors that may have missed
+    a deleted tombstone (change_xid < X) get the restart response.
+    Returns the number of rows deleted.
+    """
+    boundary = (
+        db.query(func.max(TaskTombstone.change_xid))
+        .filter(TaskTombstone.deleted_at < before)
+        .scalar()
+    )
+    if boundary is None:
+        return 0
+
+    ids = [
+        id for (id,) in
+        db.query(TaskTombstone.id)
+        .filter(TaskTombstone.change_xid < boundary)
+        .order_by(TaskTombstone.id)
+    ]
+    if not ids:
+        return 0
+
+    keep, drop = ids[0], ids[1:]
+    # tombstone には UPDATE のトリガーが無い：change_xid はこの値のまま
+    db.query(TaskTombstone).filter(TaskTombstone.id == keep).update(
+        {"task_id": None, "change_xid": boundary}, synchronize_session=False
+    )
+    if drop:
+        db.query(TaskTombstone).filter(TaskTombstone.id.in_(drop)).delete(synchronize_session=False)
+    return len(drop)
+
+
+class TombstonePruner:
+    def __init__(
+        self,
+        retention_days: float = TOMBSTONE_RETENTION_DAYS,
+        interval: float = PRUNE_INTERVAL,
+    ):
+        self.retention_days = retention_days
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        db = SessionLocal()
+        try:
+            before = datetime.utcnow() - timedelta(days=self.retention_days)
+            deleted = prune_tombstones(db, before)
+            db.commit()
+        finally:
+            db.close()
+        if deleted:
+            logger.info("pruned %d task tombstones older than %s", deleted, before)
+        return deleted
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("task tombstone pruning failed")
+
+    def start(self):
+        # CHANGES_TOMBSTONE_RETENTION_DAYS=0 なら無期限に保持
+        if self._thread is not None or self.retention_days <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tombstone-pruner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+tombstone_pruner = TombstonePruner()
@@ -0,0 +1,77 @@
+"""
+Post-commit hooks for task writes.
+
+Every path that changes `tasks` (app/tasks/service.py, the seeder and
+DELETE /tasks/reset) calls notify() or notify_reset() after its commit.
+Derived in-process state subscribes here instead of being called from
+each write path: the KPI result cache drops the months a change touched,
+the columnar KPI engine (app/kpi/columnar.py) updates its arrays, the
+search fallback (app/search.py) re-reads the task, and the live feed
+(app/stream.py) publishes KPI deltas.
+
+A change carries the task's KPI-relevant fields before and after the
+write. A create has before=None, a delete has after=None. Every update
+is reported, so an edit that only touched other fields (title,
+description, ...) has before == after, and KPI listeners skip it.
+
+A listener that raises is logged and skipped, because the write it
+reports has already committed.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, Iterable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskState(NamedTuple):
+    created_at: datetime
+    status: str
+    assignee_id: int | None
+
+
+class TaskChange(NamedTuple):
+    id: int
+    before: TaskState | None
+    after: TaskState | None
+
+
+def task_state(task) -> TaskState:
+    return TaskState(task.created_at, task.status, task.assignee_id)
+
+
+_change_listeners: list[Callable[[list[TaskChange]], None]] = []
+_reset_listeners: list[Callable[[], None]] = []
+
+
+def on_change(fn):
+    _change_listeners.append(fn)
+    return fn
+
+
+def on_reset(fn):
+    _reset_listeners.append(fn)
+    return fn
+
+
+def notify(changes: Iterable[TaskChange]):
+    changes = list(changes)
+    if not changes:
+        return
+    for fn in _change_listeners:
+        try:
+            fn(changes)
+        except Exception:
+            logger.exception("task change listener %r failed", fn)
+
+
+def notify_reset():
+    """
+    DELETE /tasks/reset finished: every task is gone. The per-batch
+    notify() calls came first, but listeners may simply start over.
+    """
+    for fn in _reset_listeners:
+        try:
+            fn()
+        except Exception:
+            logger.exception("task reset listener %r failed", fn)
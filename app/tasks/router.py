@@ -1,30 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from app.db import get_db
-from app.models import Task,User
-from app.schemas import TaskCreate, TaskUpdate, TaskOut
-from app.tasks.service import create_task, update_task,delete_task
+from app.db import SessionLocal, get_db, run_db
+from app.models import ActivityLog, Task, TaskTombstone, User
+from app.schemas import TaskCreate, TaskUpdate, TaskOut, TaskExpandedOut, TaskPage, TaskSearchPage, TaskChanges, BulkRequest, BulkResponse, JobOut
+from app.tasks.service import create_task, update_task,delete_task, apply_bulk, delete_id_batch, delete_task_batch
+from app.tasks.changes import changes_page, record_reset
 from fastapi.security import OAuth2PasswordBearer,HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt, JWTError
-from sqlalchemy import text
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
-from sqlalchemy import extract
+import os
+from app.filters import resolve_month, in_month, date_range
+from app.tasks import hooks
+from app.kpi import rollup
+from app.pagination import paginate, DEFAULT_LIMIT, MAX_LIMIT
+from app.export import ExportFormat, export_response
+from app.auth.service import SECRET_KEY, ALGORITHM
+from app.auth.principal import Principal, principal_cache
+from app.responses import FastJSONResponse, page_response, row_dicts
+from app.expand import Relation, expand_param, expand_query, expand_rows
+from app.search import search_page, task_index
+from app.jobs.runner import register, submit_job
 
 
 router = APIRouter()
 now = datetime.now()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-SECRET_KEY = "secret"
-ALGORITHM = "HS256"
+# 一覧で返す列（TaskOut と同じ並び）
+TASK_OUT_COLUMNS = (
+    Task.title,
+    Task.description,
+    Task.status,
+    Task.assignee_id,
+    Task.due_date,
+    Task.id,
+    Task.creator_id,
+    Task.created_at,
+)
+TASK_OUT_KEYS = tuple(c.key for c in TASK_OUT_COLUMNS)
+
+# 変更フィードで返す列（TaskChangeOut と同じ並び）
+TASK_CHANGE_COLUMNS = TASK_OUT_COLUMNS + (Task.updated_at,)
+TASK_CHANGE_KEYS = tuple(c.key for c in TASK_CHANGE_COLUMNS)
+
+# ?expand=assignee,creator（JOIN で同じクエリに載せる）
+TASK_EXPANSIONS = {
+    "assignee": Relation(User, Task.assignee_id, ("id", "username")),
+    "creator": Relation(User, Task.creator_id, ("id", "username")),
+}
+task_expand = expand_param(*TASK_EXPANSIONS)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 bearer = HTTPBearer()
 
-def get_current_user(
+async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(bearer),
     db=Depends(get_db)
-):
-    token = creds.credentials  
+) -> Principal:
+    return await principal_for_token(creds.credentials, db)
+
+
+async def principal_for_token(token: str, db) -> Principal:
+    # 同じトークン：署名検証・users 参照ともに省略
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -34,20 +75,68 @@ def get_current_user(
     except JWTError:
         raise HTTPException(401, "Invalid token")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    # users を読む前の世代：読み込み中に権限変更が入ったらキャッシュしない
+    generation = principal_cache.generation(user_id)
+    user = await run_db(db, lambda db: db.get(User, user_id))
     if not user:
         raise HTTPException(401, "User not found")
 
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.set(token, principal, payload.get("exp"), generation)
+    return principal
 
 # --- CREATE ---
 @router.post("/", response_model=TaskOut)
-def create_task_route(
+async def create_task_route(
     data: TaskCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
+):
+    return await run_db(db, create_task, current_user.id, data)
+
+
+# --- BULK ---
+MAX_BULK_OPERATIONS = 5000
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_tasks_route(
+    data: BulkRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    return create_task(db, current_user.id, data)
+    """
+    create / update / delete をまとめて 1 トランザクションで実行する。
+    結果は operations と同じ順番で返す。
+    """
+    if len(data.operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(413, f"At most {MAX_BULK_OPERATIONS} operations per request")
+
+    # update / delete は単体 API と同じく admin のみ
+    if current_user.role != "admin" and any(op.op != "create" for op in data.operations):
+        raise HTTPException(403, "Admin only")
+
+    def apply(db: Session):
+        try:
+            return apply_bulk(db, current_user.id, data.operations)
+        except IntegrityError as e:
+            # 例：存在しない assignee_id。バッチ全体をロールバック
+            db.rollback()
+            raise HTTPException(409, "Batch rejected: " + str(e.orig).splitlines()[0])
+
+    return {"results": await run_db(db, apply)}
+
+
+def task_page(db: Session, criteria: list, cursor, limit, expand: tuple[str, ...] = ()):
+    # ORM オブジェクトを作らず列だけ取得し、TaskOut の再検証も省く
+    q = expand_query(db.query(*TASK_OUT_COLUMNS), TASK_EXPANSIONS, expand).filter(*criteria)
+    rows, next_cursor = paginate(q, Task.created_at, Task.id, cursor, limit)
+
+    return page_response(expand_rows(TASK_OUT_KEYS, TASK_EXPANSIONS, expand, rows), next_cursor)
+
+
+def task_row(db: Session, task_id: int, expand: tuple[str, ...] = ()):
+    q = expand_query(db.query(*TASK_OUT_COLUMNS), TASK_EXPANSIONS, expand)
+    return q.filter(Task.id == task_id).first()
 
 
 # --- LIST ---
@@ -57,94 +146,228 @@ def create_task_route(
 #     current_user: User = Depends(get_current_user)
 # ):
 #     return db.query(Task).all()
-@router.get("/", response_model=list[TaskOut])
-def list_tasks(
-    year: int | None = None,
-    month: int | None = None,
+@router.get("/", response_model=TaskPage)
+async def list_tasks(
+    year: int | None = Query(None, ge=1, le=9999),
+    month: int | None = Query(None, ge=1, le=12),
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    expand: tuple[str, ...] = Depends(task_expand),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     year/month が指定されない場合は「今月」を返す。
+    次のページは next_cursor を cursor に渡して取得する。
+    expand=assignee,creator で担当者・作成者（id, username）を埋め込む。
     """
-    now = datetime.now()
-
     # デフォルト：今年・今月
-    year = year or now.year
-    month = month or now.month
+    year, month = resolve_month(year, month)
+    criteria = [in_month(Task.created_at, year, month)]
 
-    q = db.query(Task)
+    return await run_db(db, task_page, criteria, cursor, limit, expand)
 
-    q = q.filter(extract("year", Task.created_at) == year)
-    q = q.filter(extract("month", Task.created_at) == month)
 
-    return q.order_by(Task.created_at.desc()).all()
 
+# --- EXPORT ---
+@router.get("/export")
+async def export_tasks(
+    fmt: ExportFormat = Query(ExportFormat.ndjson, alias="format"),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    status: str | None = None,
+    assignee_id: int | None = None,
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    全期間のタスクを NDJSON / CSV でストリーミング出力する。
+    start/end は created_at の範囲（end は含まない）。
+    """
+    stmt = select(
+        Task.id,
+        Task.title,
+        Task.description,
+        Task.status,
+        Task.assignee_id,
+        Task.creator_id,
+        Task.due_date,
+        Task.created_at,
+        Task.updated_at,
+    ).where(date_range(Task.created_at, start, end))
+
+    if status is not None:
+        stmt = stmt.where(Task.status == status)
+    if assignee_id is not None:
+        stmt = stmt.where(Task.assignee_id == assignee_id)
 
+    return export_response(stmt.order_by(Task.created_at, Task.id), fmt, "tasks")
 
-@router.get("/{task_id}", response_model=TaskOut)
-def get_task(
+
+@router.get("/search", response_model=TaskSearchPage)
+async def search_tasks(
+    q: str = Query(..., min_length=1, max_length=200),
+    status: str | None = None,
+    assignee_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    title / description に q の語をすべて含むタスクを一致度の高い順に返す。
+    start/end は created_at の範囲（end は含まない）。
+    """
+    criteria = [date_range(Task.created_at, start, end)]
+    if status is not None:
+        criteria.append(Task.status == status)
+    if assignee_id is not None:
+        criteria.append(Task.assignee_id == assignee_id)
+
+    rows, next_cursor, searched_from = await run_db(
+        db, search_page, task_index, TASK_OUT_COLUMNS, criteria, q, cursor, limit
+    )
+    return page_response(
+        row_dicts(TASK_OUT_KEYS + ("rank",), rows), next_cursor,
+        truncated=searched_from is not None, searched_from=searched_from,
+    )
+
+
+@router.get("/changes", response_model=TaskChanges)
+async def task_changes(
+    since: str | None = Query(None, description="cursor from the previous response; omit for a full sync"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    since 以降に作成・更新されたタスクと削除されたタスクの id を古い順に返す。
+    reset が true ならカーソルが古すぎる：手元のタスクをすべて捨て、since なしから取り直す。
+    has_more が false になるまで cursor を since に渡して繰り返す。
+    """
+    page = await run_db(db, changes_page, TASK_CHANGE_COLUMNS, since, limit)
+    page["changes"] = row_dicts(TASK_CHANGE_KEYS, page["changes"])
+    return FastJSONResponse(page)
+
+
+@router.get("/{task_id}", response_model=TaskExpandedOut)
+async def get_task(
     task_id: int,
+    expand: tuple[str, ...] = Depends(task_expand),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
+    row = await run_db(db, task_row, task_id, expand)
+    if not row:
         raise HTTPException(404, "Task not found")
 
-    return task
+    return FastJSONResponse(expand_rows(TASK_OUT_KEYS, TASK_EXPANSIONS, expand, [row])[0])
 
 # --- UPDATE ---
 @router.put("/{task_id}", response_model=TaskOut)
-def update_task_route(
+async def update_task_route(
     task_id: int,
     data: TaskUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(403, "Admin only")
     
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
-        raise HTTPException(404, "Task not found")
+    def apply(db: Session):
+        # ロールアップの移動元を確定させるため行ロック
+        task = db.query(Task).filter(Task.id == task_id).with_for_update().first()
+        if not task:
+            raise HTTPException(404, "Task not found")
 
-    return update_task(db, current_user.id, task, data)
+        return update_task(db, current_user.id, task, data)
+
+    return await run_db(db, apply)
 
 
 # -----------------------
 # 全タスク削除 API
 # -----------------------
-@router.delete("/reset")
-def reset_all(
-    db: Session = Depends(get_db),
-    current_user=Depends(get_current_user),
-):
-    # 1. logs を先に削除
-    db.execute(text("DELETE FROM activity_logs"))
+# reset で 1 トランザクションに消す行数
+RESET_BATCH_SIZE = int(os.getenv("RESET_BATCH_SIZE", "5000"))
+
+
+@register("reset", exclusive=True)
+def reset_job(job) -> dict:
+    """
+    Delete every activity log, then every task, in id order,
+    RESET_BATCH_SIZE rows per transaction. Each batch locks only its own
+    rows, so reads and writes go on during the reset, and the rollup
+    moves with each task batch. Logs or tasks written while the reset
+    runs are deleted too if their batch has not been reached yet. At the
+    end the rollup is rebuilt from the tasks that are left, which also
+    clears any drift it had.
+
+    A cancel stops after the current batch and keeps what was deleted.
+    """
+    db = SessionLocal()
+    try:
+        total = db.query(func.count(ActivityLog.id)).scalar() + db.query(func.count(Task.id)).scalar()
+        job.progress(0, total)
+
+        # 変更フィードの購読者には印で「取り直し」を伝える（tombstone は 1 件ずつ書かない）。
+        # 途中で同期を始めた購読者も最後の印で取り直す
+        first = record_reset(db)
+        db.commit()
 
-    # 2. tasks を削除
-    db.execute(text("DELETE FROM tasks"))
+        done = 0
+        for delete_batch in (
+            lambda after: delete_id_batch(db, ActivityLog, after, RESET_BATCH_SIZE),
+            lambda after: delete_task_batch(db, after, RESET_BATCH_SIZE),
+        ):
+            last = 0
+            while (batch := delete_batch(last)) is not None:
+                last, n = batch
+                done += n
+                job.progress(done, total)
 
-    db.commit()
+        record_reset(db)
+        db.commit()
+        # 残ったのは reset 中に書かれたタスクだけ：集計し直す（手で書かれた分のずれもここで消える）
+        rollup.rebuild(db)
 
-    return {"message": "All tasks and logs deleted"}
+        # 最初の印より前の tombstone はもう誰も読まない
+        last = 0
+        while (batch := delete_id_batch(db, TaskTombstone, last, RESET_BATCH_SIZE, below=first.id)) is not None:
+            last = batch[0]
+    finally:
+        db.close()
+
+    hooks.notify_reset()
+    return {"message": "All tasks and logs deleted", "deleted": done}
+
+
+@router.delete("/reset", status_code=202, response_model=JobOut)
+async def reset_all(
+    current_user=Depends(get_current_user),
+):
+    # バックグラウンドジョブ（完了は GET /jobs/{id}）
+    return await submit_job("reset", {}, current_user.id)
 
 # --- DELETE ---
 @router.delete("/{task_id}", status_code=204)
-def delete_task_route(
+async def delete_task_route(
     task_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(403, "Admin only")
 
-    task = db.query(Task).filter(Task.id == task_id).first()
-    if not task:
-        raise HTTPException(404, "Task not found")
+    def apply(db: Session):
+        task = db.query(Task).filter(Task.id == task_id).with_for_update().first()
+        if not task:
+            raise HTTPException(404, "Task not found")
+
+        delete_task(db, current_user.id, task)
 
-    delete_task(db, current_user.id, task)
+    await run_db(db, apply)
     return {"message": "deleted"}
 
 
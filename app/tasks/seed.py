@@ -1,99 +1,330 @@
 # app/tasks/seed.py
+"""
+ダッシュボード用の大量タスク生成（bulk seeding engine）。
 
-from fastapi import APIRouter, Depends
+Rows are generated with NumPy one batch at a time and written with COPY
+(psycopg2 / psycopg) or a multi-row INSERT ... RETURNING elsewhere. Task
+ids are reserved from the sequence up front so each task's
+`task_created` log can be written in the same batch. Each batch commits
+on its own, together with its KPI rollup deltas.
+
+    python -m app.tasks.seed --count 1000000 --seed 42 --batch-size 50000
+"""
+import argparse
+import io
+import time
+from collections import Counter
+from datetime import date, datetime
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import insert, text
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-import random
-from app.db import get_db
-from app.models import Task,User
+
+from app.db import SessionLocal
+from app.models import Task, User, ActivityLog
 from app.tasks.router import get_current_user
-from app.models import Task, ActivityLog
+from app.kpi import rollup
+from app.tasks import hooks
+from app.tasks.hooks import TaskChange, TaskState
+from app.logs import partitions
+from app.stream import resync_event, stream_hub
+from app.jobs.runner import register, submit_job
+from app.schemas import JobOut
+
 router = APIRouter()
 
+STATUSES = ["todo", "in_progress", "done"]
+# 今月：done ≈ 30〜40%、過去：ほぼ done
+CURRENT_MONTH_WEIGHTS = [0.4, 0.3, 0.3]
+PAST_WEIGHTS = [0.05, 0.05, 0.90]
+
+DEFAULT_START = date(2023, 1, 1)
+DEFAULT_END = date(2025, 12, 31)
+DEFAULT_BATCH_SIZE = 50_000
+
+TASK_COLUMNS = (
+    "id", "title", "description", "status", "assignee_id", "creator_id",
+    "due_date", "created_at", "updated_at",
+)
+LOG_COLUMNS = ("user_id", "task_id", "action_type", "detail", "created_at")
+
+
+# ===============================
+# バッチ生成（NumPy）
+# ===============================
+def generate_batch(rng, n: int, start: date, end: date, user_ids, now: datetime) -> dict:
+    """
+    n 件分のカラムを配列で生成する。
+    - created_at は start〜end に均等分布
+    - due_date は created_at 以降 1〜40日
+    """
+    lo = np.datetime64(start, "s").astype(np.int64)
+    hi = np.datetime64(end, "s").astype(np.int64)
+    created = rng.integers(lo, hi, size=n, endpoint=True).astype("datetime64[s]")
+
+    current = np.datetime64(f"{now.year:04d}-{now.month:02d}", "M")
+    is_current = created.astype("datetime64[M]") == current
+
+    u = rng.random(n)
+    past = np.searchsorted(np.cumsum(PAST_WEIGHTS), u, side="right")
+    this_month = np.searchsorted(np.cumsum(CURRENT_MONTH_WEIGHTS), u, side="right")
+    status = np.minimum(np.where(is_current, this_month, past), len(STATUSES) - 1)
+
+    due = created + rng.integers(1, 41, size=n).astype("timedelta64[D]")
+
+    # created_at 順に並べておくと、インデックスへの挿入が局所的になり COPY が速い
+    order = np.argsort(created, kind="stable")
+    created, due, status = created[order], due[order], status[order]
+
+    return {
+        "created_at": created,
+        "due_date": due,
+        "status": status.astype(np.uint8),
+        "assignee_id": rng.choice(np.asarray(user_ids, dtype=np.int64), size=n),
+    }
+
+
+def batch_deltas(batch: dict) -> Counter:
+    """
+    KPI ロールアップの差分（月 × status × 担当者）。
+    """
+    months = batch["created_at"].astype("datetime64[M]").astype(np.int64)
+    keys = np.stack([months, batch["status"].astype(np.int64), batch["assignee_id"]], axis=1)
+    uniq, counts = np.unique(keys, axis=0, return_counts=True)
+
+    deltas = Counter()
+    for (m, s, a), c in zip(uniq.tolist(), counts.tolist()):
+        month = np.datetime64(m, "M").astype(date)
+        deltas[(month, STATUSES[s], a)] += c
+    return deltas
+
+
+def batch_changes(batch: dict, ids) -> list[TaskChange]:
+    created = batch["created_at"].astype(datetime).tolist()
+    status = [STATUSES[s] for s in batch["status"].tolist()]
+    return [
+        TaskChange(task_id, None, TaskState(c, s, a))
+        for task_id, c, s, a in zip(ids, created, status, batch["assignee_id"].tolist())
+    ]
+
+
+# ===============================
+# 書き込み
+# ===============================
+def _copy(db: Session, table: str, columns, lines: list[str]):
+    raw = db.connection().connection.dbapi_connection
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    data = "".join(lines)
+
+    cur = raw.cursor()
+    try:
+        if hasattr(cur, "copy_expert"):  # psycopg2
+            cur.copy_expert(sql, io.StringIO(data))
+        else:  # psycopg 3
+            with cur.copy(sql) as copy:
+                copy.write(data)
+    finally:
+        cur.close()
+
+
+def _supports_copy(db: Session) -> bool:
+    bind = db.get_bind()
+    return bind.dialect.name == "postgresql" and bind.dialect.driver in ("psycopg2", "psycopg")
+
+
+def insert_batch(db: Session, batch: dict, creator_id: int, first_index: int) -> list[int]:
+    """
+    Write one batch of tasks and their logs. Returns the new task ids in
+    batch order.
+    """
+    n = len(batch["created_at"])
+    created = np.datetime_as_string(batch["created_at"], unit="s").tolist()
+    due = np.datetime_as_string(batch["due_date"], unit="s").tolist()
+    status = [STATUSES[s] for s in batch["status"].tolist()]
+    assignee = batch["assignee_id"].tolist()
+    titles = [f"Seed Task {first_index + i}" for i in range(n)]
+    # updated_at は書き込んだ時刻（created_at は過去に散らすが、変更フィードには今の変更として載せる）
+    written = datetime.utcnow()
+
+    if _supports_copy(db):
+        ids = db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('tasks', 'id')) FROM generate_series(1, :n)"),
+            {"n": n},
+        ).scalars().all()
+
+        _copy(db, "tasks", TASK_COLUMNS, [
+            f"{ids[i]}\t{titles[i]}\tAuto-generated\t{status[i]}\t{assignee[i]}\t"
+            f"{creator_id}\t{due[i]}\t{created[i]}\t{written.isoformat()}\n"
+            for i in range(n)
+        ])
+        _copy(db, "activity_logs", LOG_COLUMNS, [
+            f"{creator_id}\t{ids[i]}\ttask_created\tSeeded task\t{created[i]}\n"
+            for i in range(n)
+        ])
+        return ids
+
+    # COPY が使えない場合：multi-row INSERT ... RETURNING
+    task_rows = [
+        {
+            "title": titles[i],
+            "description": "Auto-generated",
+            "status": status[i],
+            "assignee_id": assignee[i],
+            "creator_id": creator_id,
+            "due_date": datetime.fromisoformat(due[i]),
+            "created_at": datetime.fromisoformat(created[i]),
+            "updated_at": written,
+        }
+        for i in range(n)
+    ]
+    ids = db.execute(
+        insert(Task).returning(Task.id, sort_by_parameter_order=True), task_rows
+    ).scalars().all()
+
+    db.execute(insert(ActivityLog), [
+        {
+            "user_id": creator_id,
+            "task_id": task_id,
+            "action_type": "task_created",
+            "detail": "Seeded task",
+            "created_at": row["created_at"],
+        }
+        for task_id, row in zip(ids, task_rows)
+    ])
+    return ids
+
+
+def seed(
+    db: Session,
+    count: int,
+    creator_id: int,
+    rng_seed: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    start: date = DEFAULT_START,
+    end: date = DEFAULT_END,
+    progress=None,
+) -> int:
+    """
+    count 件のタスクとその task_created ログを生成する。
+    Same rng_seed + same current month -> same rows.
+    """
+    if end < start:
+        raise ValueError("end must not be before start")
+
+    rng = np.random.default_rng(rng_seed)
+    now = datetime.now()
+    user_ids = [u for (u,) in db.query(User.id).all()]
+
+    # ログの月パーティションを先に作る（default パーティションに溜めない）
+    if db.get_bind().dialect.name == "postgresql" and partitions.is_partitioned(db):
+        partitions.ensure_partitions(db, partitions.months_between(start, end))
+        db.commit()
+
+    done = 0
+    try:
+        while done < count:
+            n = min(batch_size, count - done)
+            batch = generate_batch(rng, n, start, end, user_ids, now)
+
+            ids = insert_batch(db, batch, creator_id, done)
+            rollup.apply_deltas(db, batch_deltas(batch))
+            db.commit()
+            hooks.notify(batch_changes(batch, ids))
+
+            done += n
+            if progress:
+                progress(done, count)  # ジョブの cancel はここで例外になる（コミット済みのバッチは残る）
+    finally:
+        # 生成したログは 1 件ずつ流さない：ライブフィードの購読者には取り直してもらう
+        if done:
+            stream_hub.publish([resync_event("seed")])
+    return done
+
+
+@register("seed", exclusive=True)
+def seed_job(job, count: int, creator_id: int, rng_seed: int | None, batch_size: int, start: str, end: str) -> dict:
+    # DB_MODE に関係なく同期セッション（COPY 用）。NumPy での生成もこのスレッドで行う
+    db = SessionLocal()
+    try:
+        job.progress(0, count)
+        created = seed(
+            db, count, creator_id, rng_seed, batch_size,
+            date.fromisoformat(start), date.fromisoformat(end), job.progress,
+        )
+    finally:
+        db.close()
+    return {"created": created}
+
+
 # ===============================
 # 2023〜2025 の均等分布でタスク生成
 # ===============================
-@router.post("/seed/{count}")
-def seed_tasks(
+@router.post("/seed/{count}", status_code=202, response_model=JobOut)
+async def seed_tasks(
     count: int,
-    db: Session = Depends(get_db),
+    seed_value: int | None = Query(None, alias="seed"),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=500_000),
+    start: date = DEFAULT_START,
+    end: date = DEFAULT_END,
     current_user=Depends(get_current_user),
 ):
     """
-    ダッシュボード用の大量タスク生成
-    - 2023〜2025 に均等分布
-    - 今月：done ≈ 40%
+    ダッシュボード用の大量タスク生成（バックグラウンドジョブ。進捗は GET /jobs/{id}）
+    - start〜end（デフォルト 2023〜2025）に均等分布
+    - 今月：done ≈ 30%
     - 過去：done ≈ 90%
     - due_date は created_at 以降 1〜40日
     - ActivityLog も同時生成
+    - seed を指定すると同じデータを再生成できる
     """
+    if end < start:
+        raise HTTPException(400, "end must not be before start")
 
-    now = datetime.now()
-    start_date = datetime(2023, 1, 1)
-    end_date = datetime(2025, 12, 31)
-    total_seconds = int((end_date - start_date).total_seconds())
-
-    # 全ユーザー取得
-    valid_users = db.query(User.id).all()
-    valid_users = [u[0] for u in valid_users]
-
-    for i in range(count):
-
-        # --------------------------
-        # ランダム created_at
-        # --------------------------
-        rand_sec = random.randint(0, total_seconds)
-        created_at = start_date + timedelta(seconds=rand_sec)
-
-        # --------------------------
-        # 月別の status 重みを変更
-        # --------------------------
-        if created_at.year == now.year and created_at.month == now.month:
-            # 今月：done ≈ 30〜40%
-            statuses = ["todo", "in_progress", "done"]
-            weights = [0.4, 0.3, 0.3]
-        else:
-            # 過去：ほぼ done
-            statuses = ["todo", "in_progress", "done"]
-            weights = [0.05, 0.05, 0.90]
-
-        status = random.choices(statuses, weights=weights, k=1)[0]
-
-        # due_date
-        due_date = created_at + timedelta(days=random.randint(1, 40))
-
-        # --------------------------
-        # Task 作成
-        # --------------------------
-        t = Task(
-            title=f"Seed Task {i}",
-            description="Auto-generated",
-            status=status,
-            assignee_id=random.choice(valid_users),
-            creator_id=current_user.id,
-            created_at=created_at,
-            updated_at=created_at,
-            due_date=due_date,
-        )
+    return await submit_job("seed", {
+        "count": count,
+        "creator_id": current_user.id,
+        "rng_seed": seed_value,
+        "batch_size": batch_size,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+    }, current_user.id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-seed tasks and activity logs")
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed (deterministic output)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--start", type=date.fromisoformat, default=DEFAULT_START)
+    parser.add_argument("--end", type=date.fromisoformat, default=DEFAULT_END)
+    parser.add_argument("--creator-id", type=int, default=None, help="default: first admin user")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        creator_id = args.creator_id
+        if creator_id is None:
+            creator_id = (
+                db.query(User.id).filter(User.role == "admin").order_by(User.id).limit(1).scalar()
+                or db.query(User.id).order_by(User.id).limit(1).scalar()
+            )
+        if creator_id is None:
+            parser.error("no users in the database; register one first")
+
+        t0 = time.perf_counter()
+
+        def report(done, total):
+            print(f"{done}/{total} tasks ({time.perf_counter() - t0:.1f}s)", flush=True)
+
+        seed(db, args.count, creator_id, args.seed, args.batch_size, args.start, args.end, report)
+    finally:
+        db.close()
 
-        db.add(t)
-        db.flush()  # task.id を取得するため
-
-        # --------------------------
-        # Activity Log 生成
-        # --------------------------
-        log = ActivityLog(
-            task_id=t.id,
-            user_id=current_user.id,
-            action_type="task_created",
-            detail="Seeded task",
-            created_at=created_at
-        )
-        db.add(log)
 
-    db.commit()
+if __name__ == "__main__":
+    main()
 
-    return {"message": f"{count} tasks created with logs!"}
 
 # @router.post("/seed/{count}")
 # def seed_tasks(
@@ -1,8 +1,20 @@
+from collections import Counter
+from sqlalchemy import select, insert, update, delete
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 from app.models import Task, ActivityLog
+from app.schemas import TaskCreate, TaskPatch
+from app.kpi import rollup
+from app.tasks import hooks
+from app.tasks.changes import record_deletes
+from app.tasks.hooks import TaskChange, TaskState, task_state
+from app.stream import LOG_EVENT_COLUMNS, publish_logs
 from datetime import datetime
 
 def create_log(db, user_id, task_id, action, detail=""):
+    """
+    コミットは呼び出し側で行う（タスク本体・ロールアップと同じトランザクション）。
+    """
     log = ActivityLog(
         user_id=user_id,
         task_id=task_id,
@@ -10,7 +22,6 @@ def create_log(db, user_id, task_id, action, detail=""):
         detail=detail
     )
     db.add(log)
-    db.commit()
 
 
 def create_task(db: Session, user_id: int, data):
@@ -23,27 +34,279 @@ def create_task(db: Session, user_id: int, data):
         due_date=data.due_date,
     )
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    db.flush()  # task.id / created_at を確定
 
+    rollup.record_create(db, task)
     create_log(db, user_id, task.id, "task_created", task.title)
+
+    db.commit()
+    hooks.notify([TaskChange(task.id, None, task_state(task))])
+
+    db.refresh(task)
     return task
 
 
 def update_task(db: Session, user_id: int, task: Task, data):
+    before = rollup.task_bucket(task)
+    before_state = task_state(task)
+
     for key, value in data.dict(exclude_unset=True).items():
         setattr(task, key, value)
     task.updated_at = datetime.utcnow()
 
+    after = rollup.task_bucket(task)
+    after_state = task_state(task)
+    rollup.record_move(db, before, after)
+    create_log(db, user_id, task.id, "task_updated", task.title)
+
     db.commit()
-    db.refresh(task)
+    hooks.notify([TaskChange(task.id, before_state, after_state)])
 
-    create_log(db, user_id, task.id, "task_updated", task.title)
+    db.refresh(task)
     return task
 
 def delete_task(db: Session, user_id: int, task: Task):
+    task_id, state = task.id, task_state(task)
+    rollup.record_delete(db, task)
     create_log(db, user_id, task.id, "task_deleted", task.title)
-    
+    db.flush()  # ログを task.logs に含めてから削除（task_id は NULL になる）
+
     db.delete(task)
+    record_deletes(db, [task_id], datetime.utcnow())
+    db.commit()
+    hooks.notify([TaskChange(task_id, state, None)])
+
+
+# ---------------------------
+# 一括操作（POST /tasks/bulk）
+# ---------------------------
+def _result(index, op, task_id=None, error=None):
+    return {"index": index, "op": op, "id": task_id, "ok": error is None, "error": error}
+
+
+def apply_bulk(db: Session, user_id: int, operations) -> list[dict]:
+    """
+    Apply create/update/delete operations in one transaction.
+
+    Writes are set-based: one multi-row INSERT for the creates, one UPDATE
+    per distinct patch (a mass reassign or mass close is a single
+    statement), one DELETE, and one multi-row INSERT for the activity
+    logs. Invalid items are reported in their result and skipped; each
+    task id may appear only once per request.
+    """
+    results = [None] * len(operations)
+    creates = []   # (index, TaskCreate)
+    updates = {}   # task_id -> (index, patch dict)
+    deletes = {}   # task_id -> index
+
+    # ① 検証
+    seen = set()
+    for i, op in enumerate(operations):
+        if op.op == "create":
+            try:
+                creates.append((i, TaskCreate(**(op.data or {}))))
+            except ValidationError as e:
+                results[i] = _result(i, op.op, error=str(e.errors()[0]["msg"]))
+            continue
+
+        if op.id is None:
+            results[i] = _result(i, op.op, error="id is required")
+        elif op.id in seen:
+            results[i] = _result(i, op.op, op.id, "duplicate id in batch")
+        elif op.op == "update":
+            try:
+                patch = TaskPatch(**(op.data or {})).model_dump(exclude_unset=True)
+            except ValidationError as e:
+                results[i] = _result(i, op.op, op.id, str(e.errors()[0]["msg"]))
+            else:
+                updates[op.id] = (i, patch)
+        else:
+            deletes[op.id] = i
+        seen.add(op.id)
+
+    # ② 既存行をまとめて取得（ロールアップ計算のため行ロック）
+    ids = sorted(updates.keys() | deletes.keys())
+    existing = {}
+    if ids:
+        rows = db.execute(
+            select(Task.id, Task.title, Task.status, Task.assignee_id, Task.created_at)
+            .where(Task.id.in_(ids))
+            .order_by(Task.id)
+            .with_for_update()
+        ).all()
+        existing = {r.id: r for r in rows}
+
+    for task_id in ids:
+        if task_id in existing:
+            continue
+        if task_id in updates:
+            i = updates.pop(task_id)[0]
+        else:
+            i = deletes.pop(task_id)
+        results[i] = _result(i, operations[i].op, task_id, "Task not found")
+
+    now = datetime.utcnow()
+    deltas = Counter()
+    changes = []   # コミット後に hooks へ通知
+    logs = []
+
+    # ③ create：multi-row INSERT ... RETURNING
+    if creates:
+        task_rows = [
+            {
+                "title": data.title,
+                "description": data.description,
+                "status": data.status,
+                "assignee_id": data.assignee_id,
+                "creator_id": user_id,
+                "due_date": data.due_date,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for _, data in creates
+        ]
+        new_ids = db.execute(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True), task_rows
+        ).scalars().all()
+
+        for (i, data), task_id, row in zip(creates, new_ids, task_rows):
+            deltas[rollup.bucket(now, row["status"], row["assignee_id"])] += 1
+            changes.append(TaskChange(task_id, None, TaskState(now, row["status"], row["assignee_id"])))
+            logs.append((task_id, "task_created", row["title"]))
+            results[i] = _result(i, "create", task_id)
+
+    # ④ update：同じ内容の更新は 1 文にまとめる
+    groups = {}
+    for task_id, (i, patch) in updates.items():
+        groups.setdefault(tuple(sorted(patch.items())), []).append(task_id)
+
+    for key, task_ids in groups.items():
+        patch = dict(key)
+        db.execute(
+            update(Task)
+            .where(Task.id.in_(task_ids))
+            .values(**patch, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        for task_id in task_ids:
+            old = existing[task_id]
+            before = rollup.bucket(old.created_at, old.status, old.assignee_id)
+            after = rollup.bucket(
+                old.created_at,
+                patch.get("status", old.status),
+                patch.get("assignee_id", old.assignee_id),
+            )
+            if before != after:
+                deltas[before] -= 1
+                deltas[after] += 1
+            changes.append(TaskChange(
+                task_id,
+                TaskState(old.created_at, old.status, old.assignee_id),
+                TaskState(old.created_at, patch.get("status", old.status), patch.get("assignee_id", old.assignee_id)),
+            ))
+            logs.append((task_id, "task_updated", patch.get("title", old.title)))
+
+            i = updates[task_id][0]
+            results[i] = _result(i, "update", task_id)
+
+    # ⑤ delete：既存ログの task_id は NULL にしてから削除
+    if deletes:
+        task_ids = list(deletes)
+        db.execute(
+            update(ActivityLog)
+            .where(ActivityLog.task_id.in_(task_ids))
+            .values(task_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            delete(Task)
+            .where(Task.id.in_(task_ids))
+            .execution_options(synchronize_session=False)
+        )
+        record_deletes(db, task_ids, now)
+        for task_id, i in deletes.items():
+            old = existing[task_id]
+            deltas[rollup.bucket(old.created_at, old.status, old.assignee_id)] -= 1
+            changes.append(TaskChange(task_id, TaskState(old.created_at, old.status, old.assignee_id), None))
+            logs.append((None, "task_deleted", old.title))
+            results[i] = _result(i, "delete", task_id)
+
+    # ⑥ ログ・ロールアップをまとめて反映
+    log_rows = []
+    if logs:
+        log_rows = db.execute(insert(ActivityLog).returning(*LOG_EVENT_COLUMNS), [
+            {
+                "user_id": user_id,
+                "task_id": task_id,
+                "action_type": action,
+                "detail": detail,
+                "created_at": now,
+            }
+            for task_id, action, detail in logs
+        ]).all()
+    rollup.apply_deltas(db, deltas)
+
+    db.commit()
+    hooks.notify(changes)
+    publish_logs(log_rows)
+
+    return results
+
+
+# ---------------------------
+# 全削除（DELETE /tasks/reset）：id 順のチャンクごとにコミット
+# ---------------------------
+def delete_id_batch(
+    db: Session, model, after_id: int, limit: int, below: int | None = None
+) -> tuple[int, int] | None:
+    """
+    Delete the next `limit` rows of `model` after `after_id` (and before
+    `below`, if given) by id and commit. Returns (last id, rows deleted),
+    or None when none are left.
+    """
+    query = select(model.id).where(model.id > after_id)
+    if below is not None:
+        query = query.where(model.id < below)
+    ids = db.execute(query.order_by(model.id).limit(limit)).scalars().all()
+    if not ids:
+        return None
+    deleted = db.execute(
+        delete(model)
+        .where(model.id > after_id, model.id <= ids[-1])
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return ids[-1], deleted
+
+
+def delete_task_batch(db: Session, after_id: int, limit: int) -> tuple[int, int] | None:
+    """
+    Like delete_id_batch() for tasks: the rollup moves in the same
+    transaction and the hooks hear of the deletes after the commit.
+    """
+    rows = db.execute(
+        select(Task.id, Task.created_at, Task.status, Task.assignee_id)
+        .where(Task.id > after_id)
+        .order_by(Task.id)
+        .limit(limit)
+        .with_for_update()
+    ).all()
+    if not rows:
+        return None
+
+    ids = [r.id for r in rows]
+    # reset 中に書かれたログが残っていれば切り離す
+    db.execute(
+        update(ActivityLog)
+        .where(ActivityLog.task_id.in_(ids))
+        .values(task_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(delete(Task).where(Task.id.in_(ids)).execution_options(synchronize_session=False))
+    rollup.apply_deltas(db, Counter({
+        bucket: -n for bucket, n in Counter(rollup.bucket(r.created_at, r.status, r.assignee_id) for r in rows).items()
+    }))
     db.commit()
 
+    hooks.notify([TaskChange(r.id, TaskState(r.created_at, r.status, r.assignee_id), None) for r in rows])
+    return ids[-1], len(ids)
@@ -0,0 +1,245 @@
+"""
+Opt-in traffic recorder (TRAFFIC_RECORD_FILE).
+
+TrafficRecorderMiddleware appends one JSON line per HTTP request to
+TRAFFIC_RECORD_FILE: method, path, route template, query string, the
+shape of the JSON body, whether it was authenticated, status and
+duration. bench/replay.py plays such a file back against a running
+server.
+
+Traces are sanitized before they leave the request:
+
+  * headers are not kept, only whether an Authorization header was sent;
+  * credentials (password, token, email, ...) in bodies and query
+    strings are replaced by "***";
+  * other strings become "x" repeated to their length (capped), except
+    enum-like fields (status, op, action_type) and ISO dates, which
+    replay needs verbatim to get the same code path;
+  * numbers, booleans and nulls are kept, so ids and limits replay as is.
+
+Query values follow the same rules (they are all strings there, so
+numbers and booleans are recognised by their text). Page cursors and
+the stream's event types are kept as well. Free text such as the search
+`q` is masked.
+
+Lines are written by a background thread. Requests only append to a
+bounded queue, and when it is full the trace is dropped and counted.
+TRAFFIC_RECORD_SAMPLE records that fraction of requests.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlencode
+
+from app.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+SENSITIVE_KEYS = {"password", "password_hash", "token", "access_token", "secret", "email", "authorization"}
+VERBATIM_KEYS = {"status", "op", "action_type", "format", "role", "expand"}
+MAX_STRING = 256
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([T ][\d:.]+(Z|[+-]\d{2}:?\d{2})?)?$")
+NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+# クエリだけ：カーソル（created_at と id の符号化）と SSE の種別も再生に要る
+QUERY_VERBATIM_KEYS = VERBATIM_KEYS | {"cursor", "since", "types"}
+
+
+def sanitize(value, key: str | None = None):
+    if isinstance(value, dict):
+        return {k: sanitize(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v, key) for v in value]
+    if key is not None and key.lower() in SENSITIVE_KEYS:
+        return "***"
+    if isinstance(value, str):
+        if (key is not None and key in VERBATIM_KEYS) or ISO_DATE.match(value):
+            return value
+        return "x" * min(len(value), MAX_STRING)
+    return value
+
+
+def sanitize_query_value(key: str, value: str) -> str:
+    if key.lower() in SENSITIVE_KEYS:
+        return "***"
+    if (
+        key in QUERY_VERBATIM_KEYS
+        or NUMBER.match(value)
+        or value in ("true", "false")
+        or ISO_DATE.match(value)
+    ):
+        return value
+    return "x" * min(len(value), MAX_STRING)
+
+
+def sanitize_query(query: str) -> str:
+    return urlencode([
+        (k, sanitize_query_value(k, v))
+        for k, v in parse_qsl(query, keep_blank_values=True)
+    ])
+
+
+class TrafficRecorder:
+    def __init__(self, path: str | None, sample_rate: float = 1.0, max_body: int = 65_536, max_queue: int = 10_000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.max_queue = max_queue
+
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        self.recorded = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    # ---------------------------
+    # ライフサイクル
+    # ---------------------------
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    # ---------------------------
+    # 受付・書き込み
+    # ---------------------------
+    def offer(self, record: dict):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._queue.append(record)
+            if len(self._queue) == 1:
+                self._cond.notify()
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                with self._cond:
+                    while not self._queue and not self._stopping:
+                        self._cond.wait()
+                    batch = list(self._queue)
+                    self._queue.clear()
+                    stopping = self._stopping
+
+                for record in batch:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                self.recorded += len(batch)
+
+                if stopping:
+                    return
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "sample_rate": self.sample_rate,
+                "queued": len(self._queue),
+                "recorded": self.recorded,
+                "dropped": self.dropped,
+            }
+
+
+traffic_recorder = TrafficRecorder(
+    path=os.getenv("TRAFFIC_RECORD_FILE") or None,
+    sample_rate=float(os.getenv("TRAFFIC_RECORD_SAMPLE", "1.0")),
+    max_body=int(os.getenv("TRAFFIC_RECORD_MAX_BODY", "65536")),
+)
+
+
+# ---------------------------
+# ミドルウェア
+# ---------------------------
+def body_shape(chunks: list[bytes], size: int, headers: dict, max_body: int):
+    if not size:
+        return None
+    if size > max_body:
+        return {"_truncated": size}
+    if b"json" not in headers.get(b"content-type", b""):
+        return {"_bytes": size}
+    try:
+        return sanitize(json.loads(b"".join(chunks)))
+    except ValueError:
+        return {"_bytes": size}
+
+
+class TrafficRecorderMiddleware:
+    """
+    Plain ASGI middleware, like MetricsMiddleware: the request body is
+    copied as the app reads it, and the trace is queued once the response
+    has been sent.
+    """
+
+    def __init__(self, app, recorder: TrafficRecorder = traffic_recorder):
+        self.app = app
+        self.recorder = recorder
+        self._started = time.time()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.recorder.sampled():
+            return await self.app(scope, receive, send)
+
+        chunks: list[bytes] = []
+        size = 0
+        status = 500
+        start = time.perf_counter()
+
+        async def receive_wrapper():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= self.recorder.max_body:
+                    chunks.append(body)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            headers = dict(scope.get("headers") or ())
+            self.recorder.offer({
+                "ts": round(time.time() - self._started, 3),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route_template(scope),
+                "query": sanitize_query(scope.get("query_string", b"").decode("latin-1")),
+                "auth": b"authorization" in headers,
+                "body": body_shape(chunks, size, headers, self.recorder.max_body),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            })
@@ -0,0 +1,79 @@
+"""
+Shared HTTP helpers for the bench scripts (standard library only).
+"""
+import json
+import time
+import urllib.error
+import urllib.request
+
+
+def request(
+    url: str,
+    method: str = "GET",
+    body: dict | None = None,
+    token: str | None = None,
+    timeout: float = 60,
+):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def summarize(latencies: list[float]) -> dict:
+    return {
+        "requests": len(latencies),
+        **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 1) if latencies else None for p in (50, 95, 99)},
+    }
+
+
+def login(url: str, username: str, password: str) -> str:
+    """
+    Log in, registering the user first if needed. Returns the access token.
+    """
+    body = {"username": username, "password": password}
+    status, raw = request(f"{url}/auth/login", "POST", body)
+    if status == 400:
+        request(f"{url}/auth/register", "POST", {**body, "email": f"{username}@bench.local"})
+        status, raw = request(f"{url}/auth/login", "POST", body)
+    if status != 200:
+        raise SystemExit(f"login failed: {status} {raw[:200]!r}")
+    return json.loads(raw)["access_token"]
+
+
+def run_job(url: str, path: str, method: str, token: str, timeout: float = 3600, poll: float = 0.2) -> dict:
+    """
+    Submit a background job (202) and poll GET /jobs/{id} until it ends.
+    Returns the finished job; exits unless it succeeded.
+    """
+    status, raw = request(f"{url}{path}", method, token=token)
+    if status != 202:
+        raise SystemExit(f"{method} {path} failed: {status} {raw[:200]!r}")
+    job = json.loads(raw)
+
+    deadline = time.monotonic() + timeout
+    while job["status"] in ("queued", "running"):
+        if time.monotonic() > deadline:
+            raise SystemExit(f"job {job['id']} ({job['kind']}) still {job['status']} after {timeout}s")
+        time.sleep(poll)
+        status, raw = request(f"{url}/jobs/{job['id']}", token=token)
+        if status != 200:
+            raise SystemExit(f"GET /jobs/{job['id']} failed: {status} {raw[:200]!r}")
+        job = json.loads(raw)
+
+    if job["status"] != "succeeded":
+        raise SystemExit(f"job {job['id']} ({job['kind']}) {job['status']}: {job['error']}")
+    return job
@@ -0,0 +1,104 @@
+"""
+Cold start: time from process spawn to ready, and the first requests.
+
+Each run starts a fresh uvicorn process (as bench/suite.py does) and
+polls /health/live and /health/ready from the moment it was spawned.
+Once the server is ready it sends the same authenticated GET /tasks/
+twice. The first one is the request a load balancer would route right
+after the readiness probe passed. The second one shows the warm
+latency. The report also includes the server's own startup phases
+(from /health/ready).
+
+    DATABASE_URL=postgresql://.../bench python -m bench.cold_start --runs 5
+
+Compare with the warm-up switched off:
+
+    python -m bench.cold_start --server-env DB_POOL_WARMUP=0 --server-env DB_WARMUP_QUERIES=false
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from bench.client import login, request
+from bench.suite import PASSWORD, YEAR, start_server
+
+PATH = f"/tasks/?year={YEAR}&month=6&limit=100"
+
+
+def wait_for(url: str, proc, deadline: float) -> float:
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode}")
+        try:
+            if request(url, timeout=2)[0] == 200:
+                return time.monotonic()
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise SystemExit(f"{url} did not answer in time")
+
+
+def timed(url: str, token: str) -> float:
+    start = time.perf_counter()
+    status, body = request(url, token=token)
+    elapsed = time.perf_counter() - start
+    if status != 200:
+        raise SystemExit(f"{url}: {status} {body[:200]!r}")
+    return elapsed
+
+
+def one_run(args, token: str) -> dict:
+    spawned = time.monotonic()
+    proc, url = start_server(args, wait=False)
+    try:
+        deadline = spawned + args.startup_timeout
+        live = wait_for(f"{url}/health/live", proc, deadline)
+        ready = wait_for(f"{url}/health/ready", proc, deadline)
+        first = timed(f"{url}{PATH}", token)
+        second = timed(f"{url}{PATH}", token)
+        startup = json.loads(request(f"{url}/health/ready")[1])["startup"]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+    return {
+        "live_s": round(live - spawned, 3),
+        "ready_s": round(ready - spawned, 3),
+        "first_request_ms": round(first * 1000, 1),
+        "second_request_ms": round(second * 1000, 1),
+        "server": startup,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--username", default="bench")
+    args = parser.parse_args()
+
+    # トークンは別のサーバーで取っておく（login 自体を初回リクエストにしない）
+    proc, url = start_server(args)
+    try:
+        token = login(url, args.username, PASSWORD)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+    runs = []
+    for i in range(args.runs):
+        print(f"run {i + 1}/{args.runs}", file=sys.stderr)
+        runs.append(one_run(args, token))
+
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ("live_s", "ready_s", "first_request_ms", "second_request_ms")
+    }
+    print(json.dumps({"server_env": args.server_env, "median": summary, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
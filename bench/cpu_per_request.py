@@ -0,0 +1,114 @@
+"""
+Server CPU time per request for the list and export endpoints.
+
+Starts the app (as bench/suite.py does) or attaches to --url/--pid. It
+sends --requests sequential requests per endpoint and reads the server
+process's CPU time (user + system, from /proc/<pid>/stat) before and
+after. Sequential requests keep the number free of client-side
+contention. CPU per request is the delta divided by the request count.
+
+    DATABASE_URL=postgresql://.../bench python -m bench.cpu_per_request --seed-count 100000
+
+--seed-count empties the database and seeds it first, like the suite.
+Linux only (/proc).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from bench.client import login, request
+from bench.suite import PASSWORD, YEAR, make_admin, seed_volume, start_server
+
+MONTH = 6
+LIMIT = 1000
+
+ENDPOINTS = {
+    "list_tasks": f"/tasks/?year={YEAR}&month={MONTH}&limit={LIMIT}",
+    "get_logs": f"/logs/?year={YEAR}&month={MONTH}&limit={LIMIT}",
+    "logs_by_task": "/logs/by-task/{task_id}?limit=" + str(LIMIT),
+    "export_tasks": f"/tasks/export?start={YEAR}-{MONTH:02d}-01&end={YEAR}-{MONTH + 1:02d}-01",
+    "export_logs": f"/logs/export?start={YEAR}-{MONTH:02d}-01&end={YEAR}-{MONTH + 1:02d}-01",
+}
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime, stime（fields[11], fields[12]：")" の後ろから数えた位置）
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def measure(url: str, pid: int, token: str, path: str, args) -> dict:
+    for _ in range(args.warmup):
+        request(f"{url}{path}", token=token, timeout=600)
+
+    sizes = []
+    cpu_before = cpu_seconds(pid)
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        status, body = request(f"{url}{path}", token=token, timeout=600)
+        if status != 200:
+            raise SystemExit(f"{path}: {status} {body[:200]!r}")
+        sizes.append(len(body))
+    wall = time.perf_counter() - start
+    cpu = cpu_seconds(pid) - cpu_before
+
+    return {
+        "cpu_ms_per_request": round(cpu / args.requests * 1000, 2),
+        "wall_ms_per_request": round(wall / args.requests * 1000, 2),
+        "bytes_per_response": sum(sizes) // len(sizes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="running server (needs --pid)")
+    parser.add_argument("--pid", type=int, help="process id of the --url server")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed-count", type=int, help="reset and seed this many tasks first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--username", default="bench")
+    args = parser.parse_args()
+
+    if args.url and not args.pid:
+        parser.error("--url needs --pid (CPU time is read from /proc/<pid>)")
+
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        server, url = start_server(args)
+        pid = server.pid
+
+    try:
+        token = login(url, args.username, PASSWORD)
+        if args.seed_count:
+            if server is not None:
+                make_admin(args.username)
+            print(f"seeding {args.seed_count}", file=sys.stderr)
+            seed_volume(url, token, args.seed_count, args)
+
+        status, raw = request(f"{url}/tasks/?year={YEAR}&month={MONTH}&limit=1", token=token)
+        items = json.loads(raw)["items"] if status == 200 else []
+        if not items:
+            raise SystemExit(f"no tasks in {YEAR}-{MONTH:02d}; pass --seed-count")
+        task_id = items[0]["id"]
+
+        report = {}
+        for name, path in ENDPOINTS.items():
+            print(f"{name}", file=sys.stderr)
+            report[name] = measure(url, pid, token, path.format(task_id=task_id), args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+EXPLAIN check for the month-scoped queries.
+
+Seeds `tasks` / `activity_logs` up to --rows rows (default 1M) with
+generate_series, runs ANALYZE, then EXPLAINs the queries used by
+/tasks/, /logs/ and /kpi/* for one month and fails if any of them
+falls back to a sequential scan on tasks or activity_logs, or if a
+month query on activity_logs reads more than one partition.
+
+    DATABASE_URL=postgresql://... python -m bench.explain_month_queries --rows 1000000
+
+Run it against a scratch database: seeded rows are not removed.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+from sqlalchemy import create_engine, text
+
+from app.db import Base
+from app.filters import month_params
+from app.logs import partitions
+import app.models  # noqa: F401  (register tables on Base.metadata)
+
+
+QUERIES = {
+    # /tasks/ (first page and a deep keyset page)
+    "list_tasks": """
+        SELECT * FROM tasks
+        WHERE created_at >= :start AND created_at < :end
+        ORDER BY created_at DESC, id DESC
+        LIMIT 101
+    """,
+    "list_tasks_deep": """
+        SELECT * FROM tasks
+        WHERE created_at >= :start AND created_at < :end
+          AND (created_at, id) < (:start + (:end - :start) / 2, 0)
+        ORDER BY created_at DESC, id DESC
+        LIMIT 101
+    """,
+    # month aggregates over tasks (KPI before the rollup, ad-hoc reports)
+    "kpi_monthly": """
+        SELECT status, COUNT(*) FROM tasks
+        WHERE created_at >= :start AND created_at < :end
+        GROUP BY status
+    """,
+    "kpi_by_user": """
+        SELECT assignee_id, COUNT(*) FROM tasks
+        WHERE created_at >= :start AND created_at < :end
+        GROUP BY assignee_id
+    """,
+    # /logs/
+    "get_logs": """
+        SELECT * FROM activity_logs
+        WHERE created_at >= :start AND created_at < :end
+        ORDER BY created_at DESC, id DESC
+        LIMIT 101
+    """,
+    # /logs/?task_id=, /logs/by-task/{task_id}
+    "logs_by_task": """
+        SELECT * FROM activity_logs
+        WHERE task_id = :task_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT 101
+    """,
+}
+
+WATCHED_TABLES = {"tasks", "activity_logs"}
+
+# activity_logs の月クエリ：1 パーティションに絞り込まれること
+PRUNED_QUERIES = {"get_logs"}
+
+
+def watched_table(relation: str | None) -> str | None:
+    """
+    tasks / activity_logs for the table itself or one of its partitions.
+    """
+    if relation is None:
+        return None
+    for table in WATCHED_TABLES:
+        if relation == table or relation.startswith(table + "_"):
+            return table
+    return None
+
+
+def seed(conn, rows: int):
+    have = conn.execute(text("SELECT COUNT(*) FROM tasks")).scalar()
+    if have >= rows:
+        return
+
+    user_id = conn.execute(text("SELECT MIN(id) FROM users")).scalar()
+    if user_id is None:
+        user_id = conn.execute(text("""
+            INSERT INTO users (username, email, password_hash, role)
+            VALUES ('explain', 'explain@example.com', '', 'admin')
+            RETURNING id
+        """)).scalar()
+
+    missing = rows - have
+    print(f"seeding {missing} tasks + logs ...", file=sys.stderr)
+
+    if partitions.is_partitioned(conn):
+        partitions.ensure_partitions(conn, partitions.months_between(date(2023, 1, 1), date(2025, 12, 31)))
+
+    # 2023-01-01 〜 2025-12-31 に均等分布
+    conn.execute(text("""
+        INSERT INTO tasks (title, description, status, assignee_id, creator_id,
+                           due_date, created_at, updated_at)
+        SELECT 'Explain Task ' || g,
+               'Auto-generated',
+               (ARRAY['todo', 'in_progress', 'done'])[1 + (g % 3)],
+               :user_id,
+               :user_id,
+               ts + INTERVAL '7 days',
+               ts,
+               ts
+        FROM (
+            SELECT g, TIMESTAMP '2023-01-01' + random() * INTERVAL '1095 days' AS ts
+            FROM generate_series(1, :n) AS g
+        ) s
+    """), {"n": missing, "user_id": user_id})
+
+    conn.execute(text("""
+        INSERT INTO activity_logs (user_id, task_id, action_type, detail, created_at)
+        SELECT creator_id, id, 'task_created', 'Seeded task', created_at
+        FROM tasks
+        WHERE id > COALESCE((SELECT MAX(task_id) FROM activity_logs), 0)
+    """))
+
+
+def scanned_nodes(plan: dict):
+    """
+    Yield (node type, relation, index) for every node of a JSON plan.
+    """
+    yield plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name")
+    for child in plan.get("Plans", []):
+        yield from scanned_nodes(child)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--month", type=int, default=6)
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        seed(conn, args.rows)
+
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE tasks"))
+        conn.execute(text("ANALYZE activity_logs"))
+
+    params = month_params(args.year, args.month)
+    with engine.connect() as conn:
+        params["task_id"] = conn.execute(text("SELECT MAX(id) FROM tasks")).scalar()
+        # ほぼ空のパーティション（先の月・default）は Seq Scan が正解
+        tiny = set(conn.execute(text("SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples < 1000")).scalars())
+
+        failed = []
+        for name, sql in QUERIES.items():
+            row = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+            plan = (row if isinstance(row, list) else json.loads(row))[0]["Plan"]
+
+            nodes = list(scanned_nodes(plan))
+            seq = [rel for node, rel, _ in nodes if node == "Seq Scan" and watched_table(rel) and rel not in tiny]
+            scans = [f"{node} ({idx or rel})" for node, rel, idx in nodes if rel or idx]
+            log_partitions = {rel for _, rel, _ in nodes if watched_table(rel) == "activity_logs"}
+            unpruned = name in PRUNED_QUERIES and len(log_partitions) > 1
+
+            status = "FAIL" if seq or unpruned else "ok"
+            print(f"{status:4}  {name:16} {', '.join(scans)}")
+            if seq or unpruned:
+                failed.append(name)
+
+    if failed:
+        print(f"sequential scans or unpruned partitions in: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Login throughput and its cost to concurrent task requests.
+
+Against a running server, measures GET /tasks/ latency twice for
+--duration seconds each:
+
+  1. baseline   : --probes clients calling GET /tasks/ only
+  2. login burst: the same probes while --logins clients call
+                  POST /auth/login in a loop
+
+and reports login throughput (200s and 503s per second) plus task
+latency percentiles for both phases.
+
+    python -m bench.login_bench --url http://localhost:8000 --logins 32
+
+Compare the hashing modes by restarting the server between runs:
+
+    HASH_WORKERS=4                        # process pool (default: CPU count)
+    HASH_WORKERS=0 HASH_MAX_PENDING=10000 # old behaviour: threadpool, no limit
+
+Only the standard library is used, so it runs from any checkout.
+"""
+import argparse
+import json
+import threading
+import time
+
+from bench.client import login, request, summarize
+
+
+def run_phase(args, token: str, logins: int) -> dict:
+    stop = time.monotonic() + args.duration
+    task_latencies: list[float] = []
+    login_latencies: list[float] = []
+    login_codes: dict[int, int] = {}
+    lock = threading.Lock()
+
+    def probe():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            status, _ = request(f"{args.url}/tasks/?limit=20", token=token)
+            elapsed = time.perf_counter() - start
+            if status == 200:
+                with lock:
+                    task_latencies.append(elapsed)
+
+    def hammer():
+        body = {"username": args.username, "password": args.password}
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            status, _ = request(f"{args.url}/auth/login", "POST", body)
+            elapsed = time.perf_counter() - start
+            with lock:
+                login_codes[status] = login_codes.get(status, 0) + 1
+                if status == 200:
+                    login_latencies.append(elapsed)
+
+    threads = [threading.Thread(target=probe) for _ in range(args.probes)]
+    threads += [threading.Thread(target=hammer) for _ in range(logins)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result = {"tasks": summarize(task_latencies)}
+    if logins:
+        result["logins"] = {
+            "ok_per_s": round(login_codes.get(200, 0) / args.duration, 1),
+            "rejected_per_s": round(login_codes.get(503, 0) / args.duration, 1),
+            "status_counts": login_codes,
+            **summarize(login_latencies),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--probes", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=32)
+    args = parser.parse_args()
+
+    token = login(args.url, args.username, args.password)
+    report = {
+        "baseline": run_phase(args, token, logins=0),
+        "login_burst": run_phase(args, token, logins=args.logins),
+    }
+
+    base = report["baseline"]["tasks"]["p99_ms"]
+    burst = report["login_burst"]["tasks"]["p99_ms"]
+    if base and burst:
+        report["task_p99_slowdown"] = round(burst / base, 2)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
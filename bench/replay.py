@@ -0,0 +1,264 @@
+"""
+Replay recorded traffic against a running server.
+
+Reads traces written by the traffic recorder (TRAFFIC_RECORD_FILE, see
+app/traffic.py), or the requests of a REST Client `.http` file, and sends
+them to --url:
+
+  * closed loop (default): --concurrency clients, each sending its next
+    request as soon as the previous one returns;
+  * open loop (--rps R): requests start at a fixed rate on --concurrency
+    workers. Latency is measured from the scheduled start, so a server
+    that falls behind shows up as latency instead of a lower send rate.
+
+Token substitution: traces only record whether a request was
+authenticated. Those requests get a token for --username (registered on
+first use), and username/password/email in /auth bodies are replaced by
+the same credentials.
+
+Reports throughput, latency percentiles and error rates overall and per
+route template, as JSON on stdout (and to --output). A response is
+counted as an error when it is a 5xx or the connection failed; a status
+different from the recorded one counts as a mismatch.
+
+    TRAFFIC_RECORD_FILE=traffic.jsonl uvicorn app.main:app   # record
+    python -m bench.replay traffic.jsonl --url http://localhost:8000 --concurrency 16
+    python -m bench.replay traffic.jsonl --rps 200 --loops 5
+    python -m bench.replay --http-file .http --loops 20
+
+DELETE /tasks/reset and the seed endpoint are skipped unless --exclude
+is overridden. Only the standard library is used.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.client import login, request, summarize
+
+DEFAULT_EXCLUDE = "/tasks/reset,/tasks/seed,/metrics,/docs,/openapi.json"
+CREDENTIAL_FIELDS = ("username", "password", "email")
+
+
+# ---------------------------
+# 読み込み
+# ---------------------------
+def load_traces(path: str) -> list[dict]:
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                traces.append(json.loads(line))
+    return traces
+
+
+def load_http_file(path: str) -> list[dict]:
+    """
+    Requests of a REST Client file (blocks separated by ###, @VAR = value).
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    variables = dict(re.findall(r"^@(\w+)\s*=\s*(.*?)\s*$", text, re.M))
+    traces = []
+    for block in re.split(r"^###.*$", text, flags=re.M):
+        lines = [l for l in block.strip().splitlines() if not l.startswith("@")]
+        if not lines:
+            continue
+        match = re.match(r"^(GET|POST|PUT|PATCH|DELETE)\s+(\S+)", lines[0])
+        if not match:
+            continue
+        method, target = match.groups()
+        target = re.sub(r"\{\{BASE\}\}", "", target)
+        target = re.sub(r"\{\{(\w+)\}\}", lambda m: variables.get(m.group(1), ""), target)
+        path, _, query = target.partition("?")
+
+        headers, body_lines, in_body = {}, [], False
+        for line in lines[1:]:
+            if in_body:
+                body_lines.append(line)
+            elif not line.strip():
+                in_body = True
+            else:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        body = "\n".join(body_lines).strip()
+        traces.append({
+            "method": method,
+            "path": path,
+            "route": path,
+            "query": query,
+            "auth": "authorization" in headers,
+            "body": json.loads(body) if body else None,
+            "status": None,
+        })
+    return traces
+
+
+def matches(trace: dict, prefixes: list[str]) -> bool:
+    return any(trace["path"].startswith(p) for p in prefixes)
+
+
+# ---------------------------
+# 送信
+# ---------------------------
+def prepare(trace: dict, args) -> tuple[str, str, dict | None]:
+    body = trace.get("body")
+    if isinstance(body, dict) and ("_bytes" in body or "_truncated" in body):
+        body = None
+    if trace["path"].startswith("/auth/") and isinstance(body, dict):
+        credentials = {"username": args.username, "password": args.password, "email": f"{args.username}@bench.local"}
+        body = {k: credentials[k] if k in CREDENTIAL_FIELDS else v for k, v in body.items()}
+
+    url = f"{args.url}{trace['path']}"
+    if trace.get("query"):
+        url += "?" + trace["query"]
+    return trace["method"], url, body
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes: dict[str, dict] = {}
+
+    def add(self, trace: dict, status: int | None, seconds: float):
+        key = f"{trace['method']} {trace.get('route') or trace['path']}"
+        with self._lock:
+            r = self.routes.setdefault(key, {"latencies": [], "errors": 0, "non_2xx": 0, "mismatches": 0})
+            r["latencies"].append(seconds)
+            if status is None or status >= 500:
+                r["errors"] += 1
+            if status is None or not 200 <= status < 300:
+                r["non_2xx"] += 1
+            if trace.get("status") is not None and status != trace["status"]:
+                r["mismatches"] += 1
+
+    def report(self, wall: float) -> dict:
+        def summary(latencies, errors, non_2xx, mismatches):
+            n = len(latencies)
+            return {
+                **summarize(latencies),
+                "rps": round(n / wall, 1) if wall else None,
+                "error_rate": round(errors / n, 4) if n else 0.0,
+                "non_2xx_rate": round(non_2xx / n, 4) if n else 0.0,
+                "mismatch_rate": round(mismatches / n, 4) if n else 0.0,
+            }
+
+        routes = {
+            key: summary(r["latencies"], r["errors"], r["non_2xx"], r["mismatches"])
+            for key, r in sorted(self.routes.items())
+        }
+        overall = summary(
+            [x for r in self.routes.values() for x in r["latencies"]],
+            sum(r["errors"] for r in self.routes.values()),
+            sum(r["non_2xx"] for r in self.routes.values()),
+            sum(r["mismatches"] for r in self.routes.values()),
+        )
+        return {"wall_s": round(wall, 2), "overall": overall, "routes": routes}
+
+
+def send(trace: dict, args, token: str, results: Results, scheduled: float | None = None):
+    method, url, body = prepare(trace, args)
+    start = time.perf_counter() if scheduled is None else scheduled
+    try:
+        status, _ = request(url, method, body, token if trace.get("auth") else None, timeout=args.timeout)
+    except OSError:
+        status = None
+    results.add(trace, status, time.perf_counter() - start)
+
+
+def closed_loop(traces: list[dict], args, token: str, results: Results):
+    it = iter(traces)
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                trace = next(it, None)
+            if trace is None:
+                return
+            send(trace, args, token, results)
+
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def open_loop(traces: list[dict], args, token: str, results: Results):
+    interval = 1.0 / args.rps
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        t0 = time.perf_counter()
+        for i, trace in enumerate(traces):
+            scheduled = t0 + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, trace, args, token, results, scheduled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("traces", nargs="?", help="JSONL file written by the traffic recorder")
+    parser.add_argument("--http-file", help="replay a REST Client .http file instead")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rps", type=float, help="open loop at this request rate")
+    parser.add_argument("--loops", type=int, default=1, help="times to play the traces")
+    parser.add_argument("--limit", type=int, help="stop after this many requests")
+    parser.add_argument("--include", default="", help="comma-separated path prefixes to keep")
+    parser.add_argument("--exclude", default=DEFAULT_EXCLUDE, help="comma-separated path prefixes to skip")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    if bool(args.traces) == bool(args.http_file):
+        parser.error("give either a trace file or --http-file")
+
+    traces = load_http_file(args.http_file) if args.http_file else load_traces(args.traces)
+    include = [p for p in args.include.split(",") if p]
+    exclude = [p for p in args.exclude.split(",") if p]
+    traces = [
+        t for t in traces
+        if not matches(t, exclude) and (not include or matches(t, include))
+    ]
+    traces = traces * args.loops
+    if args.limit:
+        traces = traces[:args.limit]
+    if not traces:
+        raise SystemExit("nothing to replay")
+
+    token = login(args.url, args.username, args.password)
+    results = Results()
+
+    started = time.perf_counter()
+    if args.rps:
+        open_loop(traces, args, token, results)
+    else:
+        closed_loop(traces, args, token, results)
+    wall = time.perf_counter() - started
+
+    report = {
+        "mode": f"open loop {args.rps} rps" if args.rps else f"closed loop x{args.concurrency}",
+        "requests": len(traces),
+        **results.report(wall),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if report["overall"]["error_rate"]:
+        print(f"{report['overall']['error_rate']:.2%} of requests failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
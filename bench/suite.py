@@ -0,0 +1,413 @@
+"""
+Endpoint benchmark suite with regression thresholds.
+
+For each --volumes entry (default 10k and 100k tasks; add 1000000 for
+the full run) the suite:
+
+  1. empties the database (DELETE /tasks/reset) and times
+     POST /tasks/seed/{n}?seed=<--seed> as `seed_tasks` (both run as
+     background jobs; the time runs from submit to job finished),
+  2. runs every scenario below with --concurrency clients for
+     --requests requests (after --warmup unmeasured ones),
+  3. records p50/p95/p99 latency, throughput and errors per scenario
+     (status_counts; 0 = no HTTP response: refused, reset or timed out).
+
+Scenarios: list_tasks, get_task, get_logs, logs_by_task, every /kpi
+endpoint, create_task, update_task and login. Request parameters come
+from a seeded RNG, so two runs on the same data send the same requests.
+
+By default the suite starts its own server (uvicorn app.main:app) on a
+free port against DATABASE_URL. --server-env passes settings to it:
+
+    DATABASE_URL=postgresql://.../bench python -m bench.suite \\
+        --volumes 10000,100000,1000000 --server-env KPI_ENGINE=columnar
+
+Use --url to measure a server that is already running instead.
+
+THE DATABASE IS TRUNCATED for every volume. Point it at a scratch
+database.
+
+Results go to --output as JSON (default bench/results/<timestamp>.json).
+The run fails (exit 1) when a scenario exceeds a limit in --thresholds
+(default bench/thresholds.json), or when --baseline is given and a p95
+is more than --max-regression times the baseline's.
+
+update_task needs an admin. When the suite starts the server it makes
+--username an admin directly in DATABASE_URL; with --url, an existing
+non-admin user gets the scenario reported as skipped. With --url only
+the standard library is needed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from bench.client import login, request, run_job, summarize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# シードデータ（2023〜2025）の中の月
+YEAR = 2024
+PASSWORD = "bench-password"
+
+
+# ---------------------------
+# シナリオ（method, path, body を返す）
+# ---------------------------
+def list_tasks(ctx, rng):
+    return "GET", f"/tasks/?year={YEAR}&month={rng.randint(1, 12)}&limit=50", None
+
+
+def get_task(ctx, rng):
+    return "GET", f"/tasks/{rng.choice(ctx['task_ids'])}", None
+
+
+def get_logs(ctx, rng):
+    return "GET", f"/logs/?year={YEAR}&month={rng.randint(1, 12)}&limit=50", None
+
+
+def logs_by_task(ctx, rng):
+    return "GET", f"/logs/by-task/{rng.choice(ctx['task_ids'])}", None
+
+
+def search_tasks(ctx, rng):
+    # シードのタスク名は "Seed Task N"：語の組み合わせで絞り込む
+    return "GET", f"/tasks/search?q=seed+task+{rng.randint(0, ctx['volume'] - 1)}&limit=50", None
+
+
+def search_logs(ctx, rng):
+    # すべてのシードログに一致する語（候補数の上限まで走査する最悪側）
+    return "GET", "/logs/search?q=seeded&limit=50", None
+
+
+def kpi(path):
+    def scenario(ctx, rng):
+        return "GET", f"/kpi/{path}?year={YEAR}&month={rng.randint(1, 12)}", None
+    return scenario
+
+
+def kpi_range(ctx, rng):
+    start = date(YEAR, 1, 1) + timedelta(days=rng.randint(0, 300))
+    end = start + timedelta(days=rng.randint(1, 60))
+    return "GET", f"/kpi/range?start={start}&end={end}", None
+
+
+def kpi_monthly_trend(ctx, rng):
+    return "GET", "/kpi/monthly-trend", None
+
+
+def create_task(ctx, rng):
+    return "POST", "/tasks/", {"title": f"bench {rng.random():.6f}", "status": "todo"}
+
+
+def update_task(ctx, rng):
+    task_id = rng.choice(ctx["task_ids"])
+    status = rng.choice(["todo", "in_progress", "done"])
+    return "PUT", f"/tasks/{task_id}", {"title": f"bench {task_id}", "status": status}
+
+
+def login_request(ctx, rng):
+    return "POST", "/auth/login", {"username": ctx["username"], "password": PASSWORD}
+
+
+# name -> (request builder, share of --requests)
+# login は Argon2 で 1 回が重いので件数を絞る
+ADMIN_ONLY = {"update_task"}
+SCENARIOS = {
+    "list_tasks": (list_tasks, 1.0),
+    "get_task": (get_task, 1.0),
+    "get_logs": (get_logs, 1.0),
+    "logs_by_task": (logs_by_task, 1.0),
+    "search_tasks": (search_tasks, 1.0),
+    "search_logs": (search_logs, 1.0),
+    "kpi_dashboard": (kpi("dashboard"), 1.0),
+    "kpi_monthly": (kpi("monthly"), 1.0),
+    "kpi_by_user": (kpi("by-user"), 1.0),
+    "kpi_monthly_trend": (kpi_monthly_trend, 1.0),
+    "kpi_completion_rate": (kpi("completion-rate"), 1.0),
+    "kpi_range": (kpi_range, 1.0),
+    "create_task": (create_task, 1.0),
+    "update_task": (update_task, 1.0),
+    "login": (login_request, 0.25),
+}
+
+
+def run_scenario(url: str, token: str, ctx: dict, builder, count: int, args, seed: int) -> dict:
+    rng = random.Random(seed)
+    calls = [builder(ctx, rng) for _ in range(args.warmup + count)]
+    for method, path, body in calls[:args.warmup]:
+        request(f"{url}{path}", method, body, token)
+
+    measured = iter(calls[args.warmup:])
+    latencies: list[float] = []
+    errors: dict[int, int] = {}
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                call = next(measured, None)
+            if call is None:
+                return
+            method, path, body = call
+            start = time.perf_counter()
+            try:
+                status, _ = request(f"{url}{path}", method, body, token)
+            except OSError:
+                # 接続拒否・リセット・タイムアウト：スレッドを落とさずエラー（status 0）として数える
+                status = 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                if 200 <= status < 300:
+                    latencies.append(elapsed)
+                else:
+                    errors[status] = errors.get(status, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    total = len(latencies) + sum(errors.values())
+    return {
+        **summarize(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+        "rps": round(total / wall, 1) if wall else None,
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+        "status_counts": errors,
+    }
+
+
+def seed_volume(url: str, token: str, volume: int, args) -> dict:
+    run_job(url, "/tasks/reset", "DELETE", token, timeout=600)
+
+    # 投入から完了まで（GET /jobs/{id} のポーリング間隔ぶんの誤差を含む）
+    start = time.perf_counter()
+    run_job(url, f"/tasks/seed/{volume}?seed={args.seed}", "POST", token, timeout=3600)
+    elapsed = time.perf_counter() - start
+    return {"seconds": round(elapsed, 2), "rows_per_s": round(volume / elapsed, 1)}
+
+
+def task_ids(url: str, token: str) -> list[int]:
+    ids = []
+    for month in range(1, 13):
+        status, raw = request(f"{url}/tasks/?year={YEAR}&month={month}&limit=100", token=token)
+        if status == 200:
+            ids += [t["id"] for t in json.loads(raw)["items"]]
+    if not ids:
+        raise SystemExit("no seeded tasks found")
+    return sorted(ids)
+
+
+def run_volume(url: str, token: str, username: str, volume: int, args) -> dict:
+    print(f"[{volume}] seeding", file=sys.stderr)
+    results = {"seed_tasks": seed_volume(url, token, volume, args)}
+    ctx = {"task_ids": task_ids(url, token), "username": username, "volume": volume}
+    is_admin = request(f"{url}/admin/db/pool", token=token)[0] == 200
+
+    for i, (name, (builder, share)) in enumerate(SCENARIOS.items()):
+        if args.only and name not in args.only:
+            continue
+        if name in ADMIN_ONLY and not is_admin:
+            results[name] = {"skipped": f"{username} is not an admin"}
+            continue
+        count = max(1, int(args.requests * share))
+        print(f"[{volume}] {name} x{count}", file=sys.stderr)
+        results[name] = run_scenario(url, token, ctx, builder, count, args, args.seed + i)
+    return results
+
+
+# ---------------------------
+# 閾値・ベースライン比較
+# ---------------------------
+def load_thresholds(path: str | None) -> dict:
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def limits_for(thresholds: dict, name: str, volume: int) -> dict:
+    # "*" < シナリオ名 < "シナリオ名@件数" の順で上書き
+    limits = {}
+    for key in ("*", name, f"{name}@{volume}"):
+        limits.update(thresholds.get(key, {}))
+    return limits
+
+
+def check(report: dict, thresholds: dict, baseline: dict | None, max_regression: float) -> list[str]:
+    failures = []
+    for volume, scenarios in report["volumes"].items():
+        for name, result in scenarios.items():
+            if "skipped" in result:
+                continue
+            if name == "seed_tasks":
+                limits = limits_for(thresholds, name, int(volume))
+                if "max_seconds" in limits and result["seconds"] > limits["max_seconds"]:
+                    failures.append(f"{name}@{volume}: {result['seconds']}s > {limits['max_seconds']}s")
+                continue
+
+            for key, limit in limits_for(thresholds, name, int(volume)).items():
+                if key == "min_rps":
+                    if result["rps"] is not None and result["rps"] < limit:
+                        failures.append(f"{name}@{volume}: rps {result['rps']} < {limit}")
+                elif result.get(key) is not None and result[key] > limit:
+                    failures.append(f"{name}@{volume}: {key} {result[key]} > {limit}")
+
+            base = (baseline or {}).get("volumes", {}).get(volume, {}).get(name)
+            if base and base.get("p95_ms") and result.get("p95_ms"):
+                ratio = result["p95_ms"] / base["p95_ms"]
+                if ratio > max_regression:
+                    failures.append(
+                        f"{name}@{volume}: p95 {result['p95_ms']}ms is {ratio:.2f}x baseline {base['p95_ms']}ms"
+                    )
+    return failures
+
+
+# ---------------------------
+# サーバー起動
+# ---------------------------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, wait: bool = True) -> tuple[subprocess.Popen, str]:
+    if not os.getenv("DATABASE_URL"):
+        raise SystemExit("DATABASE_URL is not set (or pass --url to use a running server)")
+
+    env = dict(os.environ)
+    env.setdefault("DB_MIGRATE", "upgrade")
+    for item in args.server_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    if not wait:
+        return proc, url
+
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode}")
+        try:
+            if request(f"{url}/health/ready", timeout=2)[0] == 200:
+                return proc, url
+        except OSError:
+            pass
+        time.sleep(0.2)
+
+    proc.terminate()
+    raise SystemExit("server did not start in time")
+
+
+def make_admin(username: str):
+    # サーバーと同じ DB に直接つなぐ（--url のときは使わない）
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE users SET role = 'admin' WHERE username = :u"), {"u": username})
+    finally:
+        engine.dispose()
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--volumes", default="10000,100000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--only", type=lambda s: set(s.split(",")), help="comma-separated scenario names")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--output")
+    parser.add_argument("--thresholds", default=os.path.join(HERE, "thresholds.json"))
+    parser.add_argument("--baseline", help="earlier result JSON to compare p95 against")
+    parser.add_argument("--max-regression", type=float, default=1.5)
+    args = parser.parse_args()
+
+    volumes = [int(v) for v in args.volumes.split(",")]
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(args)
+
+    try:
+        token = login(url, args.username, PASSWORD)
+        if server is not None:
+            make_admin(args.username)
+        report = {
+            "meta": {
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "server": url if args.url else "uvicorn (started by the suite)",
+                "server_env": args.server_env,
+                "seed": args.seed,
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "concurrency": args.concurrency,
+            },
+            "volumes": {str(v): run_volume(url, token, args.username, v, args) for v in volumes},
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report["failures"] = check(report, load_thresholds(args.thresholds), baseline, args.max_regression)
+
+    output = args.output or os.path.join(HERE, "results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report["volumes"], indent=2))
+    print(f"results: {output}", file=sys.stderr)
+    for failure in report["failures"]:
+        print(f"FAIL {failure}", file=sys.stderr)
+    if report["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
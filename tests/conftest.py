@@ -0,0 +1,62 @@
+"""
+Tests run against a throwaway SQLite database, so no Postgres is needed:
+
+    pip install pytest
+    python -m pytest -q
+
+The app reads its settings when it is imported, so the environment is
+set here, before anything from `app` is imported. Postgres-only paths
+(partitions, GROUPING SETS, LISTEN/NOTIFY) are covered by bench/.
+"""
+import os
+import tempfile
+import time
+
+import pytest
+
+DB_DIR = tempfile.mkdtemp(prefix="efficient-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DB_DIR, 'app.db')}"
+os.environ["DB_MODE"] = "sync"
+os.environ["DB_MIGRATE"] = "upgrade"
+os.environ["KPI_ENGINE"] = "columnar"   # SQL 版は GROUPING SETS（Postgres のみ）
+os.environ["HASH_WORKERS"] = "0"
+os.environ["ARGON2_TIME_COST"] = "1"
+os.environ["ARGON2_MEMORY_COST"] = "1024"
+os.environ["ARGON2_PARALLELISM"] = "1"
+os.environ["LOG_BUFFER_FLUSH_INTERVAL"] = "0.05"
+os.environ["JOBS_HEARTBEAT_INTERVAL"] = "0.05"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def headers(client):
+    body = {"username": "admin", "email": "admin@test.local", "password": "pw"}
+    assert client.post("/auth/register", json=body).status_code == 200
+
+    from app.db import engine
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE users SET role = 'admin' WHERE username = 'admin'"))
+
+    r = client.post("/auth/login", json={"username": "admin", "password": "pw"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def wait_job(client, headers, job: dict, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while job["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline, job
+        time.sleep(0.02)
+        job = client.get(f"/jobs/{job['id']}", headers=headers).json()
+    return job
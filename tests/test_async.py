@@ -0,0 +1,78 @@
+"""
+The async request path (DB_MODE, app/db.py): every route is a coroutine,
+run_db() keeps blocking session work off the event loop, and the
+settings that select the mode. The AsyncSession / asyncpg side itself
+needs Postgres and is covered by bench/.
+"""
+import asyncio
+import inspect
+import threading
+import time
+
+import pytest
+
+
+def test_every_route_is_async():
+    from app.auth.router import router as auth
+    from app.kpi.router import router as kpi
+    from app.logs.router import router as logs
+    from app.tasks.router import router as tasks
+    from app.tasks.seed import router as seed
+
+    routes = [(r.path, r.endpoint) for router in (tasks, seed, logs, kpi, auth) for r in router.routes]
+    assert len(routes) > 20
+    assert [path for path, endpoint in routes if not inspect.iscoroutinefunction(endpoint)] == []
+
+
+def test_run_db_runs_sessions_off_the_event_loop():
+    from app.db import SessionLocal, run_db
+
+    def work(db, seconds):
+        time.sleep(seconds)  # 同期 DB 呼び出しの代わり
+        return threading.get_ident()
+
+    async def main():
+        loop_thread = threading.get_ident()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick = asyncio.create_task(ticker())
+        sessions = [SessionLocal(), SessionLocal()]
+        try:
+            t0 = time.perf_counter()
+            threads = await asyncio.gather(*(run_db(db, work, 0.2) for db in sessions))
+            elapsed = time.perf_counter() - t0
+        finally:
+            tick.cancel()
+            for db in sessions:
+                db.close()
+        return loop_thread, threads, elapsed, ticks
+
+    loop_thread, threads, elapsed, ticks = asyncio.run(main())
+    assert loop_thread not in threads
+    assert elapsed < 0.35  # 2 件は並行に進む
+    assert ticks >= 5      # その間もイベントループは止まらない
+
+
+def test_async_database_url():
+    from app.db import async_database_url
+
+    assert async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("postgres://db/app") == "postgresql+asyncpg://db/app"
+    assert async_database_url("sqlite:///app.db") == "sqlite:///app.db"
+
+
+def test_db_mode_is_validated(monkeypatch):
+    from app.config import DatabaseSettings
+
+    monkeypatch.setenv("DB_MODE", "async")
+    assert DatabaseSettings.from_env().mode == "async"
+    monkeypatch.setenv("DB_MODE", "threads")
+    with pytest.raises(RuntimeError, match="DB_MODE"):
+        DatabaseSettings.from_env()
@@ -0,0 +1,99 @@
+"""
+The principal cache in get_current_user: a hit needs neither the token
+signature nor the users row, a committed role or password change drops
+the user's entries (a rolled-back one does not), and a principal read
+before such a change is not cached afterwards.
+"""
+from sqlalchemy import text
+
+
+def login(client, username: str) -> tuple[int, str]:
+    body = {"username": username, "email": f"{username}@test.local", "password": "pw"}
+    assert client.post("/auth/register", json=body).status_code == 200
+    r = client.post("/auth/login", json={"username": username, "password": "pw"})
+    token = r.json()["access_token"]
+
+    from app.db import engine
+
+    with engine.connect() as conn:
+        user_id = conn.execute(text("SELECT id FROM users WHERE username = :u"), {"u": username}).scalar()
+    return user_id, token
+
+
+def test_hit_skips_token_and_user_lookup(client):
+    from app.auth.principal import Principal, principal_cache
+    from app.db import engine
+
+    user_id, token = login(client, "cached")
+    auth = {"Authorization": f"Bearer {token}"}
+    assert client.get("/tasks/", headers=auth).status_code == 200
+    assert principal_cache.get(token) == Principal(user_id, "cached", "user")
+
+    # users の行が無くても通る：DB を読んでいない
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+    hits = principal_cache.stats()["hits"]
+    assert client.get("/tasks/", headers=auth).status_code == 200
+    assert principal_cache.stats()["hits"] == hits + 1
+
+    # 署名を検証していない：キャッシュにあれば JWT でなくても通る
+    principal_cache.set("not-a-jwt", Principal(user_id, "cached", "user"))
+    assert client.get("/tasks/", headers={"Authorization": "Bearer not-a-jwt"}).status_code == 200
+    assert client.get("/tasks/", headers={"Authorization": "Bearer not-a-jwt-either"}).status_code == 401
+
+
+def test_role_and_password_changes_invalidate_after_commit(client):
+    from app.auth.principal import principal_cache
+    from app.db import SessionLocal
+    from app.models import User
+
+    user_id, token = login(client, "promoted")
+    auth = {"Authorization": f"Bearer {token}"}
+
+    for column, value in (("role", "admin"), ("password_hash", "changed")):
+        assert client.get("/tasks/", headers=auth).status_code == 200
+        assert principal_cache.get(token) is not None
+
+        db = SessionLocal()
+        try:
+            # 取り消した変更は無効化しない（後の無関係なコミットでも）
+            setattr(db.get(User, user_id), column, value)
+            db.flush()
+            db.rollback()
+            db.get(User, user_id).email = f"{column}@test.local"
+            db.commit()
+            assert principal_cache.get(token) is not None
+
+            setattr(db.get(User, user_id), column, value)
+            db.flush()
+            assert principal_cache.get(token) is not None  # コミット前
+            db.commit()
+            assert principal_cache.get(token) is None
+        finally:
+            db.close()
+
+    assert client.get("/tasks/", headers=auth).status_code == 200
+    assert principal_cache.get(token).role == "admin"
+
+
+def test_stale_set_ignored(client):
+    from app.auth.principal import Principal, principal_cache
+    from app.db import SessionLocal
+    from app.models import User
+
+    user_id, token = login(client, "demoted")
+
+    # 旧い行を読んだリクエスト：世代を読んだ後に権限変更がコミットされる
+    generation = principal_cache.generation(user_id)
+    db = SessionLocal()
+    try:
+        db.get(User, user_id).role = "admin"
+        db.commit()
+    finally:
+        db.close()
+
+    principal_cache.set(token, Principal(user_id, "demoted", "user"), generation=generation)
+    assert principal_cache.get(token) is None
+
+    principal_cache.set(token, Principal(user_id, "demoted", "admin"), generation=principal_cache.generation(user_id))
+    assert principal_cache.get(token).role == "admin"
@@ -0,0 +1,141 @@
+"""
+The bench suite's own logic (bench/suite.py, bench/client.py): threshold
+layering, pass/fail against thresholds and a baseline, percentiles, and
+run_scenario's request accounting against a local stub server.
+"""
+import random
+import threading
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bench.client import percentile, summarize
+from bench.suite import SCENARIOS, check, limits_for, run_scenario
+
+THRESHOLDS = {
+    "*": {"p95_ms": 500, "error_rate": 0},
+    "login": {"p95_ms": 3000},
+    "seed_tasks": {"max_seconds": 60},
+    "seed_tasks@1000000": {"max_seconds": 600},
+    "create_task": {"min_rps": 100},
+}
+
+
+def result(**kw):
+    return {"p95_ms": 10.0, "rps": 1000.0, "error_rate": 0.0, **kw}
+
+
+def report(scenarios, volume="10000"):
+    return {"volumes": {volume: scenarios}}
+
+
+def test_limits_layer_from_wildcard_to_volume():
+    assert limits_for(THRESHOLDS, "get_task", 10000) == {"p95_ms": 500, "error_rate": 0}
+    assert limits_for(THRESHOLDS, "login", 10000) == {"p95_ms": 3000, "error_rate": 0}
+    assert limits_for(THRESHOLDS, "seed_tasks", 10000)["max_seconds"] == 60
+    assert limits_for(THRESHOLDS, "seed_tasks", 1000000)["max_seconds"] == 600
+
+
+def test_check_passes_within_limits():
+    scenarios = {
+        "seed_tasks": {"seconds": 30, "rows_per_s": 333.3},
+        "get_task": result(),
+        "login": result(p95_ms=2500.0),
+        "update_task": {"skipped": "bench is not an admin"},
+    }
+    assert check(report(scenarios), THRESHOLDS, None, 1.5) == []
+
+
+def test_check_reports_each_exceeded_limit():
+    scenarios = {
+        "seed_tasks": {"seconds": 90, "rows_per_s": 111.1},
+        "get_task": result(p95_ms=600.0),
+        "list_tasks": result(error_rate=0.01),
+        "create_task": result(rps=50.0),
+    }
+    failures = check(report(scenarios), THRESHOLDS, None, 1.5)
+
+    assert len(failures) == 4
+    assert "seed_tasks@10000: 90s > 60s" in failures
+    assert "get_task@10000: p95_ms 600.0 > 500" in failures
+    assert "list_tasks@10000: error_rate 0.01 > 0" in failures
+    assert "create_task@10000: rps 50.0 < 100" in failures
+
+
+def test_check_compares_p95_with_baseline():
+    baseline = report({"get_task": result(p95_ms=10.0), "list_tasks": result(p95_ms=10.0)})
+    current = report({"get_task": result(p95_ms=14.0), "list_tasks": result(p95_ms=16.0)})
+
+    failures = check(current, {}, baseline, 1.5)
+    assert len(failures) == 1
+    assert failures[0].startswith("list_tasks@10000: p95 16.0ms is 1.60x baseline")
+
+    # ベースラインに無いシナリオ・件数は比較しない
+    assert check(report({"get_task": result(p95_ms=99.0)}, "100000"), {}, baseline, 1.5) == []
+
+
+def test_percentile_and_summary():
+    values = [i / 1000 for i in range(1, 101)]   # 1..100 ms
+    assert percentile(values, 50) == 0.051
+    assert percentile(values, 99) == 0.1
+    assert percentile([], 95) is None
+
+    assert summarize(values) == {"requests": 100, "p50_ms": 51.0, "p95_ms": 96.0, "p99_ms": 100.0}
+    assert summarize([]) == {"requests": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+
+
+def test_scenarios_are_deterministic_per_seed():
+    ctx = {"task_ids": list(range(1, 500)), "username": "bench", "volume": 10000}
+    for name, (builder, _) in SCENARIOS.items():
+        a, b = random.Random(7), random.Random(7)
+        assert [builder(ctx, a) for _ in range(20)] == [builder(ctx, b) for _ in range(20)], name
+
+
+@pytest.fixture
+def stub_url():
+    # /ok は 200、それ以外は 503 を返すだけのサーバー
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200 if self.path.startswith("/ok") else 503)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_run_scenario_counts_latencies_and_errors(stub_url):
+    def builder(ctx, rng):
+        return "GET", "/ok" if rng.random() < 0.5 else "/fail", None
+
+    args = Namespace(warmup=3, concurrency=4)
+    out = run_scenario(stub_url, "token", {}, builder, 40, args, seed=1)
+
+    # warmup は数えない
+    rng = random.Random(1)
+    paths = [builder({}, rng)[1] for _ in range(43)][3:]
+    assert out["requests"] == paths.count("/ok")
+    assert out["status_counts"] == {503: paths.count("/fail")}
+    assert out["errors"] == paths.count("/fail")
+    assert out["error_rate"] == round(paths.count("/fail") / 40, 4)
+
+
+def test_run_scenario_counts_refused_connections():
+    # 誰も listen していないポートへ送る：スレッドは落ちず status 0 として数える
+    from bench.suite import free_port
+
+    url = f"http://127.0.0.1:{free_port()}"
+    args = Namespace(warmup=0, concurrency=2)
+    out = run_scenario(url, "token", {}, lambda ctx, rng: ("GET", "/ok", None), 5, args, seed=1)
+
+    assert out["status_counts"] == {0: 5}
+    assert out["error_rate"] == 1.0
+    assert out["requests"] == 0
@@ -0,0 +1,100 @@
+"""
+POST /tasks/bulk: mixed create / update / delete in one transaction,
+per-item errors that skip only their item, the rollup kept in step, and
+the task hooks called once, after the commit.
+"""
+from collections import Counter
+
+from sqlalchemy import text
+
+
+def create(client, headers, title: str, **fields) -> int:
+    return client.post("/tasks/", json={"title": title, **fields}, headers=headers).json()["id"]
+
+
+def rollup_matches_tasks():
+    from app.db import engine
+
+    with engine.connect() as conn:
+        stored = Counter({
+            (status, assignee_id): count
+            for status, assignee_id, count in conn.execute(text(
+                "SELECT status, assignee_id, SUM(count) FROM task_month_stats GROUP BY status, assignee_id"
+            ))
+            if count
+        })
+        actual = Counter(
+            (status, assignee_id or 0)
+            for status, assignee_id in conn.execute(text("SELECT status, assignee_id FROM tasks"))
+        )
+    return stored == actual
+
+
+def test_mixed_operations_and_partial_failure(client, headers):
+    keep = create(client, headers, "bulk keep")
+    close = create(client, headers, "bulk close")
+    gone = create(client, headers, "bulk gone")
+
+    operations = [
+        {"op": "create", "data": {"title": "bulk new", "status": "in_progress"}},
+        {"op": "create", "data": {"description": "no title"}},
+        {"op": "update", "id": keep, "data": {"title": "bulk kept"}},
+        {"op": "update", "id": close, "data": {"status": "done"}},
+        {"op": "update", "id": close, "data": {"status": "todo"}},
+        {"op": "update", "id": keep + 100_000, "data": {"status": "done"}},
+        {"op": "update", "id": gone, "data": {"title": None}},
+        {"op": "delete", "id": gone},
+        {"op": "delete"},
+    ]
+    r = client.post("/tasks/bulk", json={"operations": operations}, headers=headers)
+    assert r.status_code == 200, r.text
+    results = r.json()["results"]
+
+    assert [item["index"] for item in results] == list(range(len(operations)))
+    assert [item["ok"] for item in results] == [True, False, True, True, False, False, False, False, False]
+    assert results[4]["error"] == "duplicate id in batch"
+    assert results[5]["error"] == "Task not found"
+    assert results[8]["error"] == "id is required"
+    # null の title は拒否され、同じ id の delete は重複として飛ばされる
+    assert results[7]["error"] == "duplicate id in batch"
+
+    new = results[0]["id"]
+    assert client.get(f"/tasks/{new}", headers=headers).json()["status"] == "in_progress"
+    assert client.get(f"/tasks/{keep}", headers=headers).json()["title"] == "bulk kept"
+    assert client.get(f"/tasks/{close}", headers=headers).json()["status"] == "done"
+    assert client.get(f"/tasks/{gone}", headers=headers).json()["title"] == "bulk gone"
+
+    r = client.post("/tasks/bulk", json={"operations": [{"op": "delete", "id": gone}]}, headers=headers)
+    assert r.json()["results"][0]["ok"]
+    assert client.get(f"/tasks/{gone}", headers=headers).status_code == 404
+    assert rollup_matches_tasks()
+
+
+def test_hooks_fire_once_after_commit(client, headers):
+    from app.db import engine
+    from app.tasks import hooks
+
+    task_id = create(client, headers, "bulk hooked")
+    seen = []
+
+    def listener(changes):
+        # コミット済み：別の接続から見える
+        with engine.connect() as conn:
+            visible = set(conn.execute(text("SELECT id FROM tasks")).scalars())
+        seen.append([(c.id, c.before is None, c.after is None, c.id in visible) for c in changes])
+
+    hooks.on_change(listener)
+    try:
+        r = client.post("/tasks/bulk", json={"operations": [
+            {"op": "create", "data": {"title": "bulk hooked new"}},
+            {"op": "update", "id": task_id, "data": {"status": "done"}},
+        ]}, headers=headers)
+        new = r.json()["results"][0]["id"]
+        r = client.post("/tasks/bulk", json={"operations": [{"op": "delete", "id": new}]}, headers=headers)
+    finally:
+        hooks._change_listeners.remove(listener)
+
+    assert seen == [
+        [(new, True, False, True), (task_id, False, False, True)],
+        [(new, False, True, False)],
+    ]
@@ -0,0 +1,124 @@
+"""
+The change feed (GET /tasks/changes): commit-ordered cursor, tombstones,
+and the restart response after a reset, a prune or an old cursor.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from conftest import wait_job
+
+
+def sync(client, headers, since: str | None) -> tuple[dict, set, set, str | None]:
+    """
+    Follow the cursor until has_more is false. Returns the last page,
+    the changed ids, the deleted ids and the cursor to store.
+    """
+    changed, deleted = set(), set()
+    while True:
+        params = {"limit": 2}
+        if since:
+            params["since"] = since
+        page = client.get("/tasks/changes", params=params, headers=headers).json()
+        if page["reset"]:
+            return page, changed, deleted, since
+        changed |= {task["id"] for task in page["changes"]}
+        deleted |= set(page["deleted"])
+        since = page["cursor"]
+        if not page["has_more"]:
+            return page, changed, deleted, since
+
+
+def create(client, headers, title: str) -> int:
+    return client.post("/tasks/", json={"title": title}, headers=headers).json()["id"]
+
+
+def test_cursor_round_trip(client, headers):
+    ids = [create(client, headers, f"feed {i}") for i in range(5)]
+    _, changed, _, cursor = sync(client, headers, None)
+    assert set(ids) <= changed
+
+    # 何も無ければカーソルはそのまま
+    page, changed, deleted, same = sync(client, headers, cursor)
+    assert (changed, deleted, same) == (set(), set(), cursor)
+
+    client.put(f"/tasks/{ids[0]}", json={"title": "feed renamed", "status": "todo"}, headers=headers)
+    client.delete(f"/tasks/{ids[1]}", headers=headers)
+    new = create(client, headers, "feed new")
+
+    page, changed, deleted, cursor = sync(client, headers, cursor)
+    assert not page["reset"]
+    assert changed == {ids[0], new}
+    assert deleted == {ids[1]}
+
+
+def test_recreated_id_is_not_reported_deleted(client, headers):
+    _, _, _, cursor = sync(client, headers, None)
+
+    gone = create(client, headers, "feed gone")
+    client.delete(f"/tasks/{gone}", headers=headers)
+    # SQLite は最大の rowid を削除後に再利用する：同じ id の別タスク
+    again = create(client, headers, "feed again")
+    assert again == gone
+
+    # 変更を先、削除を後に当てるクライアントが again を消さない
+    page = client.get("/tasks/changes", params={"since": cursor, "limit": 100}, headers=headers).json()
+    assert [task["id"] for task in page["changes"]] == [again]
+    assert page["deleted"] == []
+
+
+def test_prune_restarts_older_cursors(client, headers):
+    from app.db import SessionLocal
+    from app.tasks.changes import prune_tombstones
+
+    ids = [create(client, headers, f"prune {i}") for i in range(3)]
+    _, _, _, old = sync(client, headers, None)
+    client.delete(f"/tasks/{ids[0]}", headers=headers)
+    _, _, deleted, middle = sync(client, headers, old)
+    assert deleted == {ids[0]}
+    client.delete(f"/tasks/{ids[1]}", headers=headers)
+    _, _, _, latest = sync(client, headers, middle)
+
+    db = SessionLocal()
+    try:
+        assert prune_tombstones(db, datetime.utcnow() + timedelta(days=1)) >= 0
+        db.commit()
+    finally:
+        db.close()
+
+    # 最後の tombstone より前のカーソルは消えた削除を見逃しうる
+    assert sync(client, headers, old)[0]["reset"]
+    assert sync(client, headers, middle)[0]["reset"]
+    page, changed, deleted, cursor = sync(client, headers, latest)
+    assert not page["reset"] and cursor == latest
+
+    # since なしから取り直せば印は返らない
+    page, changed, _, _ = sync(client, headers, None)
+    assert not page["reset"]
+    assert ids[2] in changed and ids[0] not in changed
+
+
+def test_reset_and_legacy_cursor(client, headers):
+    create(client, headers, "before reset")
+    _, _, _, cursor = sync(client, headers, None)
+
+    job = client.delete("/tasks/reset", headers=headers).json()
+    assert wait_job(client, headers, job)["status"] == "succeeded"
+
+    page = client.get("/tasks/changes", params={"since": cursor}, headers=headers).json()
+    assert page == {"reset": True, "changes": [], "deleted": [], "cursor": None, "has_more": True}
+
+    after = create(client, headers, "after reset")
+    page, changed, _, _ = sync(client, headers, None)
+    assert not page["reset"] and changed == {after}
+
+    # 0003 より前の (updated_at, id) 形式
+    legacy = base64.urlsafe_b64encode(json.dumps(["2025-06-01T00:00:00", 3]).encode()).decode()
+    assert sync(client, headers, legacy)[0]["reset"]
+    # 形の合わない JSON も 400（2 要素の dict、要素数違い、リスト以外）
+    for payload in ({"a": 1, "b": 2}, [1], [1, 2, 3, 4], 7, "x"):
+        since = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        r = client.get("/tasks/changes", params={"since": since}, headers=headers)
+        assert r.status_code == 400, (payload, r.text)
+    r = client.get("/tasks/changes", params={"since": "not a cursor"}, headers=headers)
+    assert r.status_code == 400
@@ -0,0 +1,77 @@
+"""
+Streaming exports (GET /tasks/export, GET /logs/export): NDJSON and CSV,
+rows in (created_at, id) order across several yield_per chunks, and the
+date range and column filters.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+# 他のテストが書かない月
+START, END = datetime(2031, 2, 1), datetime(2031, 3, 1)
+
+
+def insert_rows() -> tuple[list[dict], int, int]:
+    """
+    Seven tasks in February 2031, and one log per task, all on the first task.
+    """
+    from app.db import engine
+    from app.models import ActivityLog, Task, User
+
+    with engine.begin() as conn:
+        user_id = conn.execute(select(User.id).where(User.username == "admin")).scalar()
+        tasks = []
+        for day, status in ((3, "todo"), (1, "done"), (9, "done"), (9, "todo"), (28, "in_progress"), (2, "done"), (15, "todo")):
+            created = datetime(2031, 2, day)
+            values = {"title": f"export {day}", "status": status, "creator_id": user_id,
+                      "assignee_id": user_id if status == "done" else None, "created_at": created, "updated_at": created}
+            values["id"] = conn.execute(insert(Task).values(**values)).inserted_primary_key[0]
+            tasks.append(values)
+        # 範囲外（end は含まない）
+        conn.execute(insert(Task).values(title="export out", status="done", creator_id=user_id, created_at=END, updated_at=END))
+        log_task = tasks[0]["id"]
+        for task in tasks:
+            conn.execute(insert(ActivityLog).values(
+                user_id=user_id, task_id=log_task, action_type="note", detail=task["title"], created_at=task["created_at"]
+            ))
+    return sorted(tasks, key=lambda t: (t["created_at"], t["id"])), user_id, log_task
+
+
+def test_exports_stream_every_row_in_order(client, headers, monkeypatch):
+    from app import export
+
+    monkeypatch.setattr(export, "CHUNK_ROWS", 3)
+    tasks, user_id, log_task = insert_rows()
+    window = {"start": START.isoformat(), "end": END.isoformat()}
+
+    r = client.get("/tasks/export", params=window, headers=headers)
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert r.headers["content-disposition"] == 'attachment; filename="tasks.ndjson"'
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["id"] for row in rows] == [t["id"] for t in tasks]
+    assert rows[0]["created_at"] == tasks[0]["created_at"].isoformat()
+
+    r = client.get("/tasks/export", params={**window, "format": "csv"}, headers=headers)
+    assert r.headers["content-type"].startswith("text/csv")
+    header, *lines = list(csv.reader(io.StringIO(r.text)))
+    assert header[0] == "id" and "status" in header
+    assert [int(line[0]) for line in lines] == [t["id"] for t in tasks]
+    status = header.index("status")
+    assert [line[status] for line in lines] == [t["status"] for t in tasks]
+
+    params = {**window, "status": "done", "assignee_id": user_id}
+    rows = [json.loads(line) for line in client.get("/tasks/export", params=params, headers=headers).text.splitlines()]
+    assert [row["id"] for row in rows] == [t["id"] for t in tasks if t["status"] == "done"]
+
+    r = client.get("/logs/export", params={**window, "task_id": log_task}, headers=headers)
+    assert [json.loads(line)["detail"] for line in r.text.splitlines()] == [t["title"] for t in tasks]
+    r = client.get("/logs/export", params={**window, "task_id": log_task, "format": "csv"}, headers=headers)
+    assert r.headers["content-disposition"] == 'attachment; filename="activity_logs.csv"'
+    assert len(r.text.splitlines()) == len(tasks) + 1
+
+
+def test_export_rejects_unknown_format(client, headers):
+    assert client.get("/tasks/export", params={"format": "xml"}, headers=headers).status_code == 422
@@ -0,0 +1,66 @@
+"""
+Argon2 hashing off the request threadpool (app/auth/hasher.py): the
+admission limit, 503 + Retry-After from the auth routes when it is
+reached, and hashing in worker processes.
+"""
+import asyncio
+import threading
+
+import pytest
+
+
+def test_submit_rejects_past_max_pending():
+    from app.auth.hasher import HashPool, HashPoolBusy
+
+    pool = HashPool(workers=0, max_pending=2)
+    release = threading.Event()
+
+    async def main():
+        running = [asyncio.create_task(pool.submit(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert pool.stats()["pending"] == 2
+
+        # 満杯：待たせずにすぐ断る
+        with pytest.raises(HashPoolBusy) as e:
+            await pool.submit(release.wait, 5)
+        assert e.value.retry_after >= 1
+
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(main())
+    stats = pool.stats()
+    assert (stats["mode"], stats["pending"], stats["completed"], stats["rejected"]) == ("thread", 0, 2, 1)
+
+
+def test_login_gets_503_when_the_pool_is_full(client, headers, monkeypatch):
+    from app.auth.hasher import hash_pool
+
+    monkeypatch.setattr(hash_pool, "max_pending", 0)
+    r = client.post("/auth/login", json={"username": "admin", "password": "pw"})
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
+    body = {"username": "busy", "email": "busy@test.local", "password": "pw"}
+    assert client.post("/auth/register", json=body).status_code == 503
+
+    monkeypatch.undo()
+    assert client.post("/auth/login", json={"username": "admin", "password": "pw"}).status_code == 200
+
+
+def test_process_workers_hash_and_verify():
+    from app.auth.hasher import HashPool
+
+    pool = HashPool(workers=1, max_pending=4)
+    pool.start()
+    try:
+        async def main():
+            hashed = await pool.hash_password("s3cret")
+            return hashed, await pool.verify_and_update("s3cret", hashed), await pool.verify_and_update("wrong", hashed)
+
+        hashed, (ok, _), (bad, _) = asyncio.run(main())
+        assert hashed.startswith("$argon2")
+        assert ok and not bad
+        assert pool.stats()["mode"] == "process"
+    finally:
+        pool.stop()
+    assert pool.stats()["mode"] == "thread"
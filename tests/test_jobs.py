@@ -0,0 +1,106 @@
+"""
+Job heartbeat and the reaping of jobs whose worker died.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from conftest import wait_job
+
+
+def test_heartbeat_moves_updated_at_without_progress(client, headers):
+    from app.db import engine
+    from app.jobs.runner import job_runner, register
+    from app.models import Job
+
+    release = threading.Event()
+
+    # progress() を呼ばないジョブ（reset / rollup_rebuild と同じ）
+    @register("test_block")
+    def block(job):
+        release.wait(10)
+        return {}
+
+    job = job_runner.submit("test_block")
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            with engine.connect() as conn:
+                row = conn.execute(select(Job.status, Job.started_at, Job.updated_at).where(Job.id == job["id"])).first()
+            if row.status == "running" and row.updated_at > row.started_at + timedelta(seconds=0.1):
+                break
+            assert time.monotonic() < deadline, row
+            time.sleep(0.05)
+    finally:
+        release.set()
+    assert wait_job(client, headers, job)["status"] == "succeeded"
+
+
+def test_stale_job_does_not_block_exclusive_submit(client, headers):
+    from app.db import engine
+    from app.jobs.runner import job_runner
+    from app.models import Job
+
+    # 落ちたプロセスが残した running の reset
+    old = datetime.utcnow() - timedelta(seconds=job_runner.stale_after + 1)
+    with engine.begin() as conn:
+        stale = conn.execute(
+            insert(Job)
+            .values(kind="reset", status="running", params={}, done=0, cancel_requested=False,
+                    created_at=old, started_at=old, updated_at=old)
+            .returning(Job.id)
+        ).scalar()
+
+    r = client.post("/tasks/seed/5", headers=headers)
+    assert r.status_code == 202, r.text
+    assert wait_job(client, headers, r.json())["status"] == "succeeded"
+
+    lost = client.get(f"/jobs/{stale}", headers=headers).json()
+    assert lost["status"] == "failed" and lost["error"].startswith("worker lost")
+
+    # 新しい running は生きているとみなす
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        fresh = conn.execute(
+            insert(Job)
+            .values(kind="reset", status="running", params={}, done=0, cancel_requested=False,
+                    created_at=now, started_at=now, updated_at=now)
+            .returning(Job.id)
+        ).scalar()
+    try:
+        assert client.post("/tasks/seed/5", headers=headers).status_code == 409
+    finally:
+        with engine.begin() as conn:
+            conn.execute(Job.__table__.update().where(Job.id == fresh).values(status="cancelled"))
+
+
+def test_reset_deletes_in_batches(client, headers, monkeypatch):
+    from app.db import engine
+    from app.models import ActivityLog, Task, TaskMonthStat
+    from app.tasks import router
+
+    job = client.post("/tasks/seed/50", headers=headers).json()
+    assert wait_job(client, headers, job)["status"] == "succeeded"
+    with engine.connect() as conn:
+        rows = conn.execute(select(func.count(Task.id))).scalar() + conn.execute(select(func.count(ActivityLog.id))).scalar()
+    page = client.get("/tasks/changes", params={"limit": 1000}, headers=headers).json()
+    while page["has_more"]:
+        cursor = page["cursor"]
+        page = client.get("/tasks/changes", params={"since": cursor, "limit": 1000}, headers=headers).json()
+    cursor = page["cursor"]
+
+    monkeypatch.setattr(router, "RESET_BATCH_SIZE", 7)
+    job = wait_job(client, headers, client.delete("/tasks/reset", headers=headers).json())
+    assert job["status"] == "succeeded"
+    assert job["done"] == job["total"] == job["result"]["deleted"] == rows
+
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count(Task.id))).scalar() == 0
+        assert conn.execute(select(func.count(ActivityLog.id))).scalar() == 0
+        assert conn.execute(select(func.count()).select_from(TaskMonthStat)).scalar() == 0
+    assert client.get("/kpi/range", headers=headers).json()["total"] == 0
+    # reset 前のカーソルは取り直し
+    page = client.get("/tasks/changes", params={"since": cursor, "limit": 1000}, headers=headers).json()
+    assert page["reset"]
@@ -0,0 +1,294 @@
+"""
+The columnar KPI engine against a brute-force count of the tasks table,
+under random creates, updates and deletes: through the API (task hooks)
+and as plain SQL, the way another process would write. SQLite has no
+DATE_TRUNC / EXTRACT, so these also cover KPI on such a backend. The
+result cache is checked on its own: a write drops the months it touched,
+and a load that raced a write is not stored. The task_month_stats rollup
+is checked against the same count after writes through the service.
+/kpi/dashboard is checked to be the union of the single-section
+endpoints, filled by one aggregate query.
+"""
+import random
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+STATUSES = ("todo", "in_progress", "done")
+
+
+def brute_force(start: date | None, end: date | None) -> tuple[dict, dict, list]:
+    from app.db import engine
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT created_at, status, assignee_id FROM tasks")).all()
+
+    by_status, by_assignee, by_month = Counter(), Counter(), Counter()
+    for created_at, status, assignee_id in rows:
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        by_month[created_at.date().replace(day=1)] += 1
+        if (start is None or created_at.date() >= start) and (end is None or created_at.date() < end):
+            by_status[status] += 1
+            by_assignee[assignee_id] += 1
+    return dict(by_status), dict(by_assignee), sorted(by_month.items())
+
+
+def assert_matches(rng: random.Random):
+    from app.db import SessionLocal
+    from app.kpi.columnar import columnar_kpi
+
+    db = SessionLocal()
+    try:
+        columnar_kpi.refresh(db)
+    finally:
+        db.close()
+
+    windows = [(None, None)]
+    for _ in range(5):
+        a = date(2024, 1, 1) + timedelta(days=rng.randrange(1100))
+        windows.append((a, a + timedelta(days=rng.randrange(1, 400))))
+    for start, end in windows:
+        by_status, by_assignee, by_month = brute_force(start, end)
+        assert columnar_kpi.range_counts(start, end) == (by_status, by_assignee), (start, end)
+    assert columnar_kpi.monthly_totals() == by_month
+
+
+def test_columnar_matches_brute_force(client, headers):
+    from app.db import engine
+
+    rng = random.Random(16)
+    for i in range(2):
+        body = {"username": f"kpi{i}", "email": f"kpi{i}@test.local", "password": "pw"}
+        assert client.post("/auth/register", json=body).status_code == 200
+    with engine.connect() as conn:
+        users = [None] + list(conn.execute(text("SELECT id FROM users")).scalars())
+    creator = users[1]
+
+    def random_created() -> datetime:
+        return datetime(2024, 1, 1) + timedelta(seconds=rng.randrange(3 * 365 * 86_400))
+
+    ids = []
+    for _ in range(8):
+        # API：hooks 経由で反映
+        for _ in range(rng.randrange(1, 6)):
+            body = {"title": "kpi", "status": rng.choice(STATUSES), "assignee_id": rng.choice(users)}
+            ids.append(client.post("/tasks/", json=body, headers=headers).json()["id"])
+        for task_id in rng.sample(ids, min(2, len(ids))):
+            body = {"title": "kpi", "status": rng.choice(STATUSES), "assignee_id": rng.choice(users)}
+            client.put(f"/tasks/{task_id}", json=body, headers=headers)
+        if ids and rng.random() < 0.5:
+            client.delete(f"/tasks/{ids.pop(rng.randrange(len(ids)))}", headers=headers)
+
+        # SQL：別プロセスの書き込みと同じく変更フィードからだけ見える
+        with engine.begin() as conn:
+            for _ in range(rng.randrange(1, 20)):
+                created = random_created()
+                ids.append(conn.execute(
+                    text(
+                        "INSERT INTO tasks (title, status, assignee_id, creator_id, created_at, updated_at) "
+                        "VALUES ('kpi', :s, :a, :u, :c, :c) RETURNING id"
+                    ),
+                    {"s": rng.choice(STATUSES), "a": rng.choice(users), "u": creator, "c": created},
+                ).scalar())
+            for task_id in rng.sample(ids, min(5, len(ids))):
+                conn.execute(
+                    text("UPDATE tasks SET status = :s, assignee_id = :a, created_at = :c WHERE id = :id"),
+                    {"s": rng.choice(STATUSES), "a": rng.choice(users), "c": random_created(), "id": task_id},
+                )
+            for task_id in rng.sample(ids, min(3, len(ids))):
+                ids.remove(task_id)
+                conn.execute(text("DELETE FROM tasks WHERE id = :id"), {"id": task_id})
+                conn.execute(
+                    text("INSERT INTO task_tombstones (task_id, deleted_at) VALUES (:id, :now)"),
+                    {"id": task_id, "now": datetime.utcnow()},
+                )
+
+        assert_matches(rng)
+
+
+def test_kpi_endpoints_without_date_functions(client, headers):
+    from app.db import engine
+
+    assert engine.dialect.name == "sqlite"
+    client.post("/tasks/", json={"title": "kpi now", "status": "done"}, headers=headers)
+
+    for year, month in ((2024, 2), (2025, 7), (2026, 1), (datetime.utcnow().year, datetime.utcnow().month)):
+        start = date(year, month, 1)
+        end = (start + timedelta(days=31)).replace(day=1)
+        by_status, by_assignee, by_month = brute_force(start, end)
+        params = {"year": year, "month": month}
+
+        dashboard = client.get("/kpi/dashboard", params=params, headers=headers).json()
+        assert {row["status"]: row["count"] for row in dashboard["monthly"] if row["count"]} == by_status
+        assert {row["user"]: row["count"] for row in dashboard["by_user"]["data"]} == by_assignee
+        assert dashboard["monthly_trend"] == [{"month": m.strftime("%Y-%m"), "count": n} for m, n in by_month]
+
+        rate = client.get("/kpi/completion-rate", params=params, headers=headers).json()
+        assert rate["total"] == sum(by_status.values()) and rate["done"] == by_status.get("done", 0)
+        for path in ("/kpi/monthly", "/kpi/by-user", "/kpi/monthly-trend"):
+            assert client.get(path, params=params, headers=headers).status_code == 200
+
+
+def test_month_scoped_endpoints_reject_out_of_range_years(client, headers):
+    paths = ("/tasks/", "/logs/", "/kpi/dashboard", "/kpi/monthly", "/kpi/by-user", "/kpi/completion-rate")
+    for path in paths:
+        for year, month in ((1, 1), (9998, 12), (9999, 1), (9999, 11)):
+            r = client.get(path, params={"year": year, "month": month}, headers=headers)
+            assert r.status_code == 200, (path, year, month, r.text)
+        # 9999-12 の終わり（10000-01-01）は datetime で表せない
+        for year, month in ((0, 1), (9999, 12), (10000, 1)):
+            r = client.get(path, params={"year": year, "month": month}, headers=headers)
+            assert r.status_code == 422, (path, year, month, r.text)
+
+    for year in (0, 10000):
+        assert client.get(f"/logs/archive/{year}/1", headers=headers).status_code == 422
+
+
+def test_kpi_cache_invalidated_by_writes(client, headers):
+    from app.kpi.cache import kpi_cache
+    from app.kpi.service import cache_key, cache_scope
+
+    task = client.post("/tasks/", json={"title": "cache target"}, headers=headers).json()
+    year, month = int(task["created_at"][:4]), int(task["created_at"][5:7])
+    other = (year - 1, month)
+
+    kpi_cache.clear()
+    for section in ("monthly", "monthly_trend"):
+        for y, m in ((year, month), other):
+            kpi_cache.set(cache_key(section, y, m), [section], cache_scope(section, y, m))
+
+    # 題名だけの更新は KPI に関係しない：何も落とさない
+    client.put(f"/tasks/{task['id']}", json={"title": "cache renamed", "status": "todo"}, headers=headers)
+    assert kpi_cache.get(cache_key("monthly", year, month)) == ["monthly"]
+
+    client.put(f"/tasks/{task['id']}", json={"title": "cache renamed", "status": "done"}, headers=headers)
+    assert kpi_cache.get(cache_key("monthly", year, month)) is None
+    assert kpi_cache.get(cache_key("monthly_trend", year, month)) is None  # 全月にまたがる
+    assert kpi_cache.get(cache_key("monthly", *other)) == ["monthly"]
+
+
+def test_kpi_cache_drops_a_load_that_raced_a_write(client, headers):
+    from app.kpi.cache import kpi_cache
+    from app.kpi.service import cache_key, cache_scope
+
+    today = datetime.utcnow()
+    key, scope = cache_key("monthly", today.year, today.month), cache_scope("monthly", today.year, today.month)
+    kpi_cache.clear()
+
+    # ロードの開始時に世代を読み、集計中に書き込みが入る
+    generation = kpi_cache.generation()
+    client.post("/tasks/", json={"title": "cache race"}, headers=headers)
+    kpi_cache.set(key, ["stale"], scope, generation)
+    assert kpi_cache.get(key) is None
+
+    generation = kpi_cache.generation()
+    kpi_cache.set(key, ["fresh"], scope, generation)
+    assert kpi_cache.get(key) == ["fresh"]
+
+
+def rollup_counts() -> tuple[Counter, Counter]:
+    """
+    (stored rollup, recount of tasks) as {("YYYY-MM", status, assignee or 0): n}.
+    """
+    from app.db import engine
+
+    with engine.connect() as conn:
+        stored = conn.execute(text("SELECT month, status, assignee_id, count FROM task_month_stats")).all()
+        tasks = conn.execute(text("SELECT created_at, status, assignee_id FROM tasks")).all()
+    return (
+        Counter({(str(m)[:7], s, a): n for m, s, a, n in stored}),
+        Counter((str(c)[:7], s, a or 0) for c, s, a in tasks),
+    )
+
+
+def moved(before: Counter, after: Counter) -> dict:
+    return {key: after[key] - before[key] for key in before.keys() | after.keys() if after[key] != before[key]}
+
+
+def test_rollup_follows_service_writes(client, headers):
+    from app.db import engine
+    from app.kpi import rollup
+
+    with engine.connect() as conn:
+        user_id = conn.execute(text("SELECT id FROM users WHERE username = 'admin'")).scalar()
+    # 他のテストは SQL で直接書いてロールアップをずらすので、差分で比べる
+    stored_before, actual_before = rollup_counts()
+
+    ids = [
+        client.post("/tasks/", json={"title": "rollup", "status": status, "assignee_id": assignee}, headers=headers).json()["id"]
+        for status, assignee in (("todo", None), ("todo", user_id), ("in_progress", user_id), ("done", None))
+    ]
+    stored, actual = rollup_counts()
+    assert moved(stored_before, stored) == moved(actual_before, actual) != {}
+
+    # status 変更・担当替え・削除はバケットを動かす
+    client.put(f"/tasks/{ids[0]}", json={"title": "rollup", "status": "done"}, headers=headers)
+    client.put(f"/tasks/{ids[1]}", json={"title": "rollup", "status": "todo", "assignee_id": None}, headers=headers)
+    client.delete(f"/tasks/{ids[2]}", headers=headers)
+    ops = [
+        {"op": "create", "data": {"title": "rollup bulk", "status": "done", "assignee_id": user_id}},
+        {"op": "update", "id": ids[3], "data": {"status": "in_progress"}},
+        {"op": "delete", "id": ids[1]},
+    ]
+    assert all(r["ok"] for r in client.post("/tasks/bulk", json={"operations": ops}, headers=headers).json()["results"])
+    stored, actual = rollup_counts()
+    assert moved(stored_before, stored) == moved(actual_before, actual)
+
+    # 空のロールアップを tasks から埋め直すと数え直しと一致する
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM task_month_stats"))
+        rollup.backfill(conn)
+    stored, actual = rollup_counts()
+    assert +stored == actual
+
+
+def test_dashboard_sections_match_their_endpoints(client, headers):
+    client.post("/tasks/", json={"title": "dashboard", "status": "done"}, headers=headers)
+    today = datetime.utcnow()
+    params = {"year": today.year, "month": today.month}
+
+    dashboard = client.get("/kpi/dashboard", params=params, headers=headers).json()
+    assert (dashboard["year"], dashboard["month"]) == (today.year, today.month)
+    assert dashboard["completion_rate"]["done"] >= 1
+    for section, path in (("monthly", "/kpi/monthly"), ("by_user", "/kpi/by-user"),
+                          ("monthly_trend", "/kpi/monthly-trend"), ("completion_rate", "/kpi/completion-rate")):
+        assert client.get(path, params=params, headers=headers).json() == dashboard[section], section
+
+
+def test_one_dashboard_query_fills_every_section(client, headers, monkeypatch):
+    from app.kpi import service
+    from app.kpi.cache import kpi_cache
+
+    today = datetime.utcnow()
+    params = {"year": today.year, "month": today.month}
+    calls = []
+
+    def query_dashboard(db, year, month):
+        calls.append((year, month))
+        trend = [{"month": f"{year:04d}-{month:02d}", "count": 4}]
+        return service.build_sections(year, month, trend, {"todo": 1, "in_progress": 0, "done": 3}, [{"user": None, "count": 4}])
+
+    # SQL 版（GROUPING SETS は Postgres のみ）の代わりに呼び出し回数だけ数える
+    monkeypatch.setattr(service, "KPI_ENGINE", "sql")
+    monkeypatch.setattr(service, "query_dashboard", query_dashboard)
+    kpi_cache.clear()
+    try:
+        dashboard = client.get("/kpi/dashboard", params=params, headers=headers).json()
+        assert dashboard["completion_rate"]["completion_rate"] == 0.75
+        assert dashboard["monthly"] == [{"status": "todo", "count": 1}, {"status": "done", "count": 3}]
+
+        # 各エンドポイントは同じ 1 回のクエリの結果をキャッシュから返す
+        for section, path in (("monthly", "/kpi/monthly"), ("by_user", "/kpi/by-user"),
+                              ("monthly_trend", "/kpi/monthly-trend"), ("completion_rate", "/kpi/completion-rate")):
+            assert client.get(path, params=params, headers=headers).json() == dashboard[section]
+        assert len(calls) == 1
+
+        # 1 つのセクションの取りこぼしで全セクションを詰め直す
+        kpi_cache.clear()
+        client.get("/kpi/by-user", params=params, headers=headers)
+        client.get("/kpi/dashboard", params=params, headers=headers)
+        assert calls == [(today.year, today.month)] * 2
+    finally:
+        kpi_cache.clear()
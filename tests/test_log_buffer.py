@@ -0,0 +1,135 @@
+"""
+The activity log buffer: a NUL is rejected at the API, an unknown task_id
+is stored as NULL, an event the database will not take is dropped after
+LOG_BUFFER_MAX_ATTEMPTS without holding up the rest of its batch, and a
+failure that is not about the rows is retried with backoff, never dropped.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+
+def test_nul_rejected(client, headers):
+    for event in ({"action_type": "poison\x00"}, {"action_type": "ok", "detail": "a\x00b"}):
+        r = client.post("/logs/batch", json={"events": [event]}, headers=headers)
+        assert r.status_code == 422, r.text
+
+
+def test_poison_event_dropped(client, headers):
+    from app.db import engine
+    from app.logs.buffer import log_buffer
+    from app.models import ActivityLog
+
+    task_id = client.post("/tasks/", json={"title": "log target"}, headers=headers).json()["id"]
+    before = log_buffer.stats()
+
+    def event(task_id, action_type):
+        return {"user_id": None, "task_id": task_id, "action_type": action_type, "detail": "",
+                "created_at": datetime.utcnow()}
+
+    # 2**70 は INTEGER に入らない：どのバッチに入っても書けない
+    assert log_buffer.offer([
+        event(task_id, "buffer good"),
+        event(2**70, "buffer poison"),
+        event(999_999, "buffer unknown task"),
+        event(task_id, "buffer good"),
+    ])
+
+    deadline = time.monotonic() + 10
+    while log_buffer.stats()["dropped"] == before["dropped"] or log_buffer.stats()["queued"]:
+        assert time.monotonic() < deadline, log_buffer.stats()
+        time.sleep(0.05)
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(ActivityLog.action_type, ActivityLog.task_id)
+            .where(ActivityLog.action_type.like("buffer %"))
+            .order_by(ActivityLog.id)
+        ).all()
+    # 外部キーを検査しない SQLite ではそのまま、Postgres では NULL になる
+    unknown = None if engine.dialect.name == "postgresql" else 999_999
+    assert sorted(rows, key=str) == sorted(
+        [("buffer good", task_id), ("buffer unknown task", unknown), ("buffer good", task_id)], key=str
+    )
+    assert log_buffer.stats()["dropped"] == before["dropped"] + 1
+
+
+def test_systemic_error_requeued_with_backoff():
+    from sqlalchemy.exc import ProgrammingError
+
+    from app.logs.buffer import LogBuffer
+
+    class FailingBuffer(LogBuffer):
+        # 移行中などで表が無い：行の中身とは関係なく失敗する
+        def __init__(self, failures: int, **kw):
+            super().__init__(**kw)
+            self.failures = failures
+            self.calls = []
+
+        def _insert(self, batch):
+            self.calls.append(len(batch))
+            if len(self.calls) <= self.failures:
+                raise ProgrammingError("INSERT INTO activity_logs ...", {}, Exception("no such table"))
+            return []
+
+    buffer = FailingBuffer(failures=4, flush_interval=0.001, max_attempts=1, max_backoff=0.004)
+    events = [{"user_id": None, "task_id": None, "action_type": "x", "detail": "", "created_at": datetime.utcnow()}
+              for _ in range(3)]
+    assert buffer.offer(events)
+
+    started = time.monotonic()
+    while buffer.stats()["queued"]:
+        assert time.monotonic() - started < 5
+        with buffer._cond:
+            batch = buffer._drain()
+        buffer._write(batch)
+
+    # 二分も破棄もせず、同じバッチをそのまま書き直す
+    assert buffer.calls == [3] * 5
+    stats = buffer.stats()
+    assert (stats["errors"], stats["dropped"], stats["flushed"]) == (4, 0, 3)
+
+
+def test_failed_batch_requeued_past_max_size():
+    from sqlalchemy.exc import OperationalError
+
+    from app.logs.buffer import LogBuffer
+
+    class DownBuffer(LogBuffer):
+        # 最初のフラッシュだけ DB に繋がらない
+        def __init__(self, **kw):
+            super().__init__(**kw)
+            self.down = True
+            self.written = []
+
+        def _insert(self, batch):
+            if self.down:
+                self.down = False
+                raise OperationalError("INSERT INTO activity_logs ...", {}, Exception("connection refused"))
+            self.written.extend(e["detail"] for e in batch)
+            return []
+
+    def events(*details):
+        return [{"user_id": None, "task_id": None, "action_type": "x", "detail": d, "created_at": datetime.utcnow()}
+                for d in details]
+
+    buffer = DownBuffer(max_size=4, flush_size=4, flush_interval=0.001, max_backoff=0.001)
+    assert buffer.offer(events("a", "b", "c"))
+    with buffer._cond:
+        batch = buffer._drain()
+
+    # フラッシュ中にキューが埋まる
+    assert buffer.offer(events("d", "e", "f", "g"))
+    buffer._write(batch)
+    assert buffer.stats()["queued"] == 7
+    assert not buffer.offer(events("h"))
+
+    while buffer.stats()["queued"]:
+        with buffer._cond:
+            batch = buffer._drain()
+        buffer._write(batch)
+
+    assert buffer.written == list("abcdefg")
+    stats = buffer.stats()
+    assert (stats["accepted"], stats["rejected"], stats["flushed"]) == (7, 1, 7)
@@ -0,0 +1,59 @@
+"""
+Per-request metrics (app/metrics.py): latency, query count and DB time
+by route template, the slow-query log, and the Prometheus text at
+GET /metrics.
+"""
+import re
+
+
+def sample(text: str, name: str, **labels) -> float | None:
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(name + "{") and want in line:
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_requests_are_counted_by_route_template(client, headers):
+    from app.metrics import route_metrics
+
+    task_id = client.post("/tasks/", json={"title": "metrics"}, headers=headers).json()["id"]
+    key = ("GET", "/tasks/{task_id}")
+    before = route_metrics.queries[key].snapshot() if key in route_metrics.queries else {"count": 0, "sum": 0}
+
+    for _ in range(3):
+        assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 200
+    client.get("/no/such/route")
+
+    after = route_metrics.queries[key].snapshot()
+    assert after["count"] == before["count"] + 3
+    # 各リクエストのクエリ（スレッドプールで実行）もそのリクエストに数えられる
+    assert after["sum"] >= before["sum"] + 3
+
+    text = client.get("/metrics").text
+    assert sample(text, "http_requests_total", method="GET", route="/tasks/{task_id}", status="200") >= 3
+    assert sample(text, "http_request_duration_seconds_count", method="GET", route="/tasks/{task_id}") >= 3
+    assert sample(text, "http_request_db_seconds_sum", method="GET", route="/tasks/{task_id}") > 0
+    assert sample(text, "http_requests_total", route="<unmatched>", status="404") >= 1
+    # 個々の id はラベルにならない
+    assert not re.search(rf'route="/tasks/{task_id}"', text)
+    assert sample(text, "db_pool_size", engine="sync") is not None
+
+
+def test_slow_queries_are_grouped_by_route_and_template(client, headers):
+    from app.metrics import RequestStats, current_request, slow_query_log
+
+    route = type("Route", (), {"path": "/bench/slow", "path_regex": None})()
+    token = current_request.set(RequestStats({"route": route, "path": "/bench/slow"}))
+    try:
+        for ms in (250.0, 400.0):
+            slow_query_log.record("SELECT *\n   FROM tasks WHERE id = ?", ms)
+    finally:
+        current_request.reset(token)
+
+    body = client.get("/admin/db/slow-queries", headers=headers).json()
+    entry = next(e for e in body["by_statement"] if e["route"] == "/bench/slow")
+    assert entry == {"route": "/bench/slow", "statement": "SELECT * FROM tasks WHERE id = ?",
+                     "count": 2, "total_ms": 650.0, "max_ms": 400.0}
+    assert body["recent"][0]["route"] == "/bench/slow"
+    assert sample(client.get("/metrics").text, "db_slow_queries_total", route="/bench/slow") == 2
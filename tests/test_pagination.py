@@ -0,0 +1,82 @@
+"""
+Keyset pagination of the task and log listings: every row exactly once,
+in (created_at DESC, id DESC) order, across ties in created_at, and 400
+for a cursor that does not decode.
+"""
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+# 他のテストが書かない月
+YEAR, MONTH = 2030, 5
+
+
+def pages(client, headers, path: str, **params) -> list[list[dict]]:
+    result, cursor = [], None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        r = client.get(path, params=query, headers=headers)
+        assert r.status_code == 200, r.text
+        result.append(r.json()["items"])
+        cursor = r.json()["next_cursor"]
+        if cursor is None:
+            return result
+
+
+def insert_rows() -> tuple[list[int], list[int], int]:
+    """
+    Five tasks and five logs on one task, three of each sharing a created_at.
+    """
+    from app.db import engine
+    from app.models import ActivityLog, Task, User
+
+    # SQLAlchemy 経由で書く：SQLite では日時の文字列表現がアプリと揃う
+    times = [datetime(YEAR, MONTH, 3, 9)] * 3 + [datetime(YEAR, MONTH, 7), datetime(YEAR, MONTH, 1)]
+    with engine.begin() as conn:
+        user_id = conn.execute(select(User.id).where(User.username == "admin")).scalar()
+        task_ids = [
+            conn.execute(
+                insert(Task).values(title="page", status="todo", creator_id=user_id, created_at=created, updated_at=created)
+            ).inserted_primary_key[0]
+            for created in times
+        ]
+        log_ids = [
+            conn.execute(
+                insert(ActivityLog).values(user_id=user_id, task_id=task_ids[0], action_type="note", detail="page", created_at=created)
+            ).inserted_primary_key[0]
+            for created in times
+        ]
+    return task_ids, log_ids, task_ids[0]
+
+
+def expected_order(ids: list[int]) -> list[int]:
+    # created_at 降順、同時刻は id 降順（insert_rows の時刻の並び）
+    times = [3, 3, 3, 7, 1]
+    return [id for _, id in sorted(zip(times, ids), reverse=True)]
+
+
+def test_pages_cover_every_row_once(client, headers):
+    task_ids, log_ids, task_id = insert_rows()
+
+    for limit in (1, 2, 5):
+        result = pages(client, headers, "/tasks/", year=YEAR, month=MONTH, limit=limit)
+        assert all(len(page) <= limit for page in result)
+        assert [t["id"] for page in result for t in page] == expected_order(task_ids)
+
+        result = pages(client, headers, f"/logs/by-task/{task_id}", limit=limit)
+        assert [log["id"] for page in result for log in page] == expected_order(log_ids)
+
+    result = pages(client, headers, "/logs/", year=YEAR, month=MONTH, limit=2)
+    assert [log["id"] for page in result for log in page] == expected_order(log_ids)
+
+
+def test_bad_cursor_and_limit(client, headers):
+    from app.pagination import _encode
+
+    for cursor in ("not a cursor", _encode(["yesterday", 1]), _encode({"a": 1}), _encode([1])):
+        for path in ("/tasks/", "/logs/", "/logs/by-task/1"):
+            r = client.get(path, params={"cursor": cursor}, headers=headers)
+            assert r.status_code == 400, (path, cursor, r.text)
+
+    for limit in (0, 1001):
+        assert client.get("/tasks/", params={"limit": limit}, headers=headers).status_code == 422
@@ -0,0 +1,88 @@
+"""
+The connection pool layer (app/config.py, app/db_instrumentation.py):
+pool metrics from checkouts, waits and timeouts, statement logging by
+DB_LOG_MODE in place of echo=True, and GET /admin/db/pool.
+"""
+import logging
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from conftest import DB_DIR
+
+
+def small_engine(**kwargs):
+    from app.db_instrumentation import InstrumentedQueuePool, instrument_pool
+
+    engine = create_engine(
+        f"sqlite:///{os.path.join(DB_DIR, 'pool.db')}",
+        poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, **kwargs,
+    )
+    instrument_pool(engine)
+    return engine
+
+
+def test_pool_metrics_count_checkouts_and_timeouts():
+    from app.db_instrumentation import pool_status
+
+    engine = small_engine(pool_timeout=0.1)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        status = pool_status(engine)
+        assert (status["size"], status["checked_out"], status["max_overflow"]) == (1, 1, 0)
+
+        # 1 本しかないプールで 2 本目は pool_timeout 後に失敗する
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    status = pool_status(engine)
+    assert status["connects"] == 1
+    assert status["checkouts"] == status["checkins"] == 1
+    assert status["timeouts"] == 1
+    assert status["max_checked_out"] == 1
+    assert status["checkout_wait_seconds"]["count"] == 1
+
+    # dispose() で作り直したプールにもメトリクスが引き継がれる
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert pool_status(engine)["checkouts"] == 2
+
+
+@pytest.mark.parametrize("mode, slow_ms, logged", [
+    ("all", 10_000, True),
+    ("off", 0, False),
+    ("slow", 0, True),
+    ("slow", 10_000, False),
+])
+def test_statement_log_modes(caplog, mode, slow_ms, logged):
+    from app.db_instrumentation import install_statement_hooks
+
+    engine = small_engine()
+    install_statement_hooks(engine, mode, 0.0, slow_ms)
+    with caplog.at_level(logging.INFO, logger="app.sql"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 42"))
+
+    records = [r for r in caplog.records if r.name == "app.sql" and "SELECT 42" in r.getMessage()]
+    assert bool(records) == logged
+    if mode == "slow" and logged:
+        assert records[0].levelno == logging.WARNING
+
+
+def test_settings_are_validated_and_hide_urls(client, headers, monkeypatch):
+    from app.config import DatabaseSettings
+
+    monkeypatch.setenv("DB_POOL_SIZE", "7")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "no")
+    settings = DatabaseSettings.from_env()
+    assert settings.pool_kwargs()["pool_size"] == 7 and settings.pool_kwargs()["pool_pre_ping"] is False
+    monkeypatch.setenv("DB_LOG_MODE", "verbose")
+    with pytest.raises(RuntimeError, match="DB_LOG_MODE"):
+        DatabaseSettings.from_env()
+
+    body = client.get("/admin/db/pool", headers=headers).json()
+    assert "url" not in body["settings"] and "async_url" not in body["settings"]
+    assert body["pools"]["sync"]["checkouts"] > 0
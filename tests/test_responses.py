@@ -0,0 +1,70 @@
+"""
+The fast list path (app/responses.py): bodies built from column rows must
+be what the declared response_model would have produced.
+"""
+from datetime import date, datetime
+
+from app import responses
+from app.responses import dumps
+from app.schemas import ActivityLogOut, TaskChangeOut, TaskExpandedOut, TaskOut
+
+
+def test_column_lists_follow_the_models():
+    from app.logs.router import LOG_KEYS
+    from app.tasks.router import TASK_CHANGE_KEYS, TASK_OUT_KEYS
+
+    assert TASK_OUT_KEYS == tuple(TaskOut.model_fields)
+    assert TASK_CHANGE_KEYS == tuple(TaskChangeOut.model_fields)
+    assert LOG_KEYS == tuple(ActivityLogOut.model_fields)
+
+
+def same_as_model(model, item: dict, **dump):
+    # response_model を通した場合と同じ値・同じキー
+    assert model.model_validate(item).model_dump(mode="json", **dump) == item
+
+
+def test_task_pages_match_response_model(client, headers):
+    first = client.post("/tasks/", json={"title": "直列化 ✓", "description": "d"}, headers=headers).json()
+    client.put(f"/tasks/{first['id']}", json={
+        "title": "直列化 ✓", "description": "d", "status": "in_progress",
+        "assignee_id": first["creator_id"], "due_date": "2030-01-02",
+    }, headers=headers)
+    second = client.post("/tasks/", json={"title": "plain"}, headers=headers).json()
+
+    month = datetime.fromisoformat(first["created_at"])
+    query = f"/tasks/?year={month.year}&month={month.month}&limit=1000"
+    items = {t["id"]: t for t in client.get(query, headers=headers).json()["items"]}
+    assert {first["id"], second["id"]} <= items.keys()
+
+    for task_id in (first["id"], second["id"]):
+        same_as_model(TaskOut, items[task_id])
+    assert items[first["id"]]["title"] == "直列化 ✓"
+    assert items[first["id"]]["due_date"] == "2030-01-02T00:00:00"
+    assert items[first["id"]]["created_at"] == first["created_at"]
+
+    expanded = {t["id"]: t for t in client.get(query + "&expand=assignee", headers=headers).json()["items"]}
+    same_as_model(TaskExpandedOut, expanded[first["id"]], exclude_unset=True)
+    assert expanded[first["id"]]["assignee"]["id"] == first["creator_id"]
+    assert expanded[second["id"]]["assignee"] is None
+
+
+def test_log_pages_match_response_model(client, headers):
+    task = client.post("/tasks/", json={"title": "log rows"}, headers=headers).json()
+    items = client.get(f"/logs/by-task/{task['id']}", headers=headers).json()["items"]
+
+    assert items
+    for item in items:
+        same_as_model(ActivityLogOut, item)
+
+
+def test_dumps_writes_datetimes_like_pydantic(monkeypatch):
+    content = {"at": datetime(2025, 1, 2, 3, 4, 5, 6000), "on": date(2025, 1, 2), "s": "é"}
+    expected = b'{"at":"2025-01-02T03:04:05.006000","on":"2025-01-02","s":"\xc3\xa9"}'
+    assert dumps(content) == expected
+
+    # orjson が無い環境の json モジュール版も同じバイト列
+    import json
+
+    monkeypatch.setattr(responses, "orjson", None)
+    monkeypatch.setattr(responses, "json", json, raising=False)
+    assert dumps(content) == expected
@@ -0,0 +1,122 @@
+"""
+Full-text search on a non-Postgres database: the in-process inverted
+index (app/search.py), its rank cursor and its invalidation by the task
+hooks.
+"""
+import time
+
+
+def search(client, headers, path: str, q: str, **params) -> list[dict]:
+    """
+    Follow next_cursor to the end. Returns every hit in page order.
+    """
+    hits, cursor = [], None
+    while True:
+        query = {"q": q, **params}
+        if cursor:
+            query["cursor"] = cursor
+        page = client.get(path, params=query, headers=headers).json()
+        hits.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return hits
+
+
+def create(client, headers, title: str, description: str = "") -> int:
+    body = {"title": title, "description": description}
+    return client.post("/tasks/", json=body, headers=headers).json()["id"]
+
+
+def test_rank_cursor_round_trip(client, headers):
+    ids = [
+        create(client, headers, "quince quince", "quince"),
+        create(client, headers, "quince", "quince"),
+        create(client, headers, "quince"),
+        create(client, headers, "quince"),
+    ]
+    create(client, headers, "unrelated")
+
+    hits = search(client, headers, "/tasks/search", "quince", limit=1)
+
+    assert sorted(hit["id"] for hit in hits) == sorted(ids)
+    keys = [(hit["rank"], hit["id"]) for hit in hits]
+    assert keys == sorted(keys, reverse=True)
+    assert hits[0]["id"] == ids[0]
+    # 同じ rank は id 降順：カーソルの境界で飛ばしも重複もしない
+    assert [hit["id"] for hit in hits[2:]] == [ids[3], ids[2]]
+
+
+def test_every_word_must_match(client, headers):
+    both = create(client, headers, "walnut pecan")
+    create(client, headers, "walnut")
+
+    assert [hit["id"] for hit in search(client, headers, "/tasks/search", "pecan walnut")] == [both]
+    assert search(client, headers, "/tasks/search", "walnut hazelnut") == []
+
+
+def test_writes_invalidate_the_index(client, headers):
+    task_id = create(client, headers, "mango report")
+    assert [hit["id"] for hit in search(client, headers, "/tasks/search", "mango")] == [task_id]
+
+    # PUT：古い語は外れ、新しい語で見つかる
+    client.put(f"/tasks/{task_id}", json={"title": "papaya report", "status": "todo"}, headers=headers)
+    assert search(client, headers, "/tasks/search", "mango") == []
+    assert [hit["id"] for hit in search(client, headers, "/tasks/search", "papaya")] == [task_id]
+
+    # 一括更新も同じフックを通る
+    ops = [{"op": "update", "id": task_id, "data": {"description": "guava"}}]
+    assert client.post("/tasks/bulk", json={"operations": ops}, headers=headers).json()["results"][0]["ok"]
+    assert [hit["id"] for hit in search(client, headers, "/tasks/search", "papaya guava")] == [task_id]
+
+    client.delete(f"/tasks/{task_id}", headers=headers)
+    assert search(client, headers, "/tasks/search", "papaya") == []
+
+
+def test_log_search_reads_new_rows(client, headers):
+    task_id = create(client, headers, "log target")
+
+    def post(detail: str):
+        events = [{"task_id": task_id, "action_type": "note", "detail": detail}]
+        assert client.post("/logs/batch", json={"events": events}, headers=headers).status_code == 202
+
+    def found(q: str, expected: int) -> list[dict]:
+        deadline = time.monotonic() + 10
+        while True:
+            hits = search(client, headers, "/logs/search", q, task_id=task_id)
+            if len(hits) >= expected or time.monotonic() > deadline:
+                return hits
+            time.sleep(0.05)
+
+    post("kiwi arrived")
+    assert len(found("kiwi", 1)) == 1
+
+    # 索引済みの後に入ったログも読み足される
+    post("kiwi shipped")
+    hits = found("kiwi", 2)
+    assert sorted(hit["detail"] for hit in hits) == ["kiwi arrived", "kiwi shipped"]
+    assert [hit["detail"] for hit in found("shipped kiwi", 1)] == ["kiwi shipped"]
+
+
+def test_truncated_window_continues_with_end(client, headers, monkeypatch):
+    from app import search as search_module
+
+    monkeypatch.setattr(search_module, "MAX_CANDIDATES", 2)
+    ids = [create(client, headers, f"lychee {n}") for n in range(5)]
+
+    found, end, windows = [], None, 0
+    while True:
+        params = {"q": "lychee", "limit": 100}
+        if end:
+            params["end"] = end
+        page = client.get("/tasks/search", params=params, headers=headers).json()
+        found.extend(hit["id"] for hit in page["items"])
+        windows += 1
+        if not page["truncated"]:
+            assert page["searched_from"] is None
+            break
+        # 新しい側の窓だけが順位付けされ、残りは end で続きを引ける
+        assert len(page["items"]) < 5
+        end = page["searched_from"]
+
+    assert sorted(found) == sorted(ids)
+    assert windows > 1
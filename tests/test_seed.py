@@ -0,0 +1,88 @@
+"""
+The bulk seeding engine (app/tasks/seed.py): deterministic NumPy batches,
+and the seed job writing tasks, their task_created logs and the rollup
+one batch per transaction (multi-row INSERT ... RETURNING on SQLite).
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from conftest import wait_job
+
+# 他のテストが書かない期間
+START, END = date(2032, 1, 1), date(2032, 6, 30)
+
+
+def test_batches_are_deterministic_and_in_range():
+    from app.tasks.seed import STATUSES, batch_deltas, generate_batch
+
+    now = datetime(2032, 3, 15)
+    a = generate_batch(np.random.default_rng(7), 500, START, END, [1, 2, 3], now)
+    b = generate_batch(np.random.default_rng(7), 500, START, END, [1, 2, 3], now)
+    c = generate_batch(np.random.default_rng(8), 500, START, END, [1, 2, 3], now)
+    assert all(np.array_equal(a[k], b[k]) for k in a)
+    assert not np.array_equal(a["created_at"], c["created_at"])
+
+    created = a["created_at"].astype(datetime).tolist()
+    due = a["due_date"].astype(datetime).tolist()
+    assert created == sorted(created)
+    assert START <= created[0].date() and created[-1].date() <= END
+    assert all(timedelta(days=1) <= d - c <= timedelta(days=40) for c, d in zip(created, due))
+    assert set(a["assignee_id"].tolist()) <= {1, 2, 3}
+    assert set(a["status"].tolist()) <= set(range(len(STATUSES)))
+
+    deltas = batch_deltas(a)
+    assert sum(deltas.values()) == 500
+    assert {month for month, _, _ in deltas} <= {date(2032, m, 1) for m in range(1, 7)}
+
+
+def seeded_rows(after_id: int) -> list[tuple]:
+    from app.db import engine
+    from app.models import Task
+
+    with engine.connect() as conn:
+        return conn.execute(
+            select(Task.id, Task.title, Task.created_at, Task.status, Task.assignee_id, Task.due_date)
+            .where(Task.id > after_id, Task.title.like("Seed Task %"))
+            .order_by(Task.id)
+        ).all()
+
+
+def test_seed_job_writes_batches(client, headers):
+    from app.db import engine
+    from app.models import ActivityLog, Task, TaskMonthStat
+
+    def seed_once() -> list[tuple]:
+        with engine.connect() as conn:
+            last = conn.execute(select(Task.id).order_by(Task.id.desc()).limit(1)).scalar() or 0
+        params = {"seed": 7, "batch_size": 13, "start": START.isoformat(), "end": END.isoformat()}
+        job = wait_job(client, headers, client.post("/tasks/seed/50", params=params, headers=headers).json())
+        assert job["status"] == "succeeded" and job["result"] == {"created": 50}
+        assert job["done"] == job["total"] == 50
+        return seeded_rows(last)
+
+    with engine.connect() as conn:
+        stats_before = Counter({(m, s, a): n for m, s, a, n in conn.execute(select(TaskMonthStat.month, TaskMonthStat.status, TaskMonthStat.assignee_id, TaskMonthStat.count))})
+
+    first = seed_once()
+    assert len(first) == 50
+    assert [row.title for row in first] == [f"Seed Task {i}" for i in range(50)]
+    assert all(START <= row.created_at.date() <= END for row in first)
+
+    with engine.connect() as conn:
+        logs = conn.execute(
+            select(ActivityLog.task_id, ActivityLog.created_at)
+            .where(ActivityLog.action_type == "task_created", ActivityLog.task_id.in_([row.id for row in first]))
+        ).all()
+        stats_after = Counter({(m, s, a): n for m, s, a, n in conn.execute(select(TaskMonthStat.month, TaskMonthStat.status, TaskMonthStat.assignee_id, TaskMonthStat.count))})
+    assert sorted(logs) == sorted((row.id, row.created_at) for row in first)
+
+    # ロールアップは同じバッチのトランザクションで進む
+    stats_after.subtract(stats_before)
+    assert +stats_after == Counter((row.created_at.date().replace(day=1), row.status, row.assignee_id or 0) for row in first)
+
+    # 同じ seed（同じ月に実行）なら同じ行
+    second = seed_once()
+    assert [row[1:] for row in second] == [row[1:] for row in first]
@@ -0,0 +1,201 @@
+"""
+The schema and the app on SQLite: migrations, startup, and the main
+read / write paths.
+"""
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import create_engine, inspect, text
+
+from conftest import DB_DIR, wait_job
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# create_all() が作っていた移行前のスキーマ（ベースラインのコミット）
+BASELINE_DDL = [
+    """
+    CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR, email VARCHAR, password_hash VARCHAR, role VARCHAR,
+        created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (username), UNIQUE (email)
+    )
+    """,
+    "CREATE INDEX ix_users_id ON users (id)",
+    """
+    CREATE TABLE tasks (
+        id INTEGER NOT NULL, title VARCHAR, description TEXT, status VARCHAR,
+        assignee_id INTEGER, creator_id INTEGER, due_date DATETIME, created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(assignee_id) REFERENCES users (id), FOREIGN KEY(creator_id) REFERENCES users (id)
+    )
+    """,
+    "CREATE INDEX ix_tasks_id ON tasks (id)",
+    """
+    CREATE TABLE activity_logs (
+        id INTEGER NOT NULL, user_id INTEGER, task_id INTEGER, action_type VARCHAR, detail TEXT,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(task_id) REFERENCES tasks (id)
+    )
+    """,
+    "CREATE INDEX ix_activity_logs_id ON activity_logs (id)",
+]
+
+
+def run(args: list[str], url: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "DATABASE_URL": url}
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+
+
+def migrate(command: str, url: str) -> subprocess.CompletedProcess:
+    return run(["-m", "app.migrate", command], url)
+
+
+def test_migrate_upgrade_on_empty_database():
+    url = f"sqlite:///{os.path.join(DB_DIR, 'migrate.db')}"
+
+    assert migrate("check", url).returncode == 1
+    upgraded = migrate("upgrade", url)
+    assert upgraded.returncode == 0, upgraded.stderr
+    assert migrate("check", url).returncode == 0
+    # 2 回目は何もしない
+    assert migrate("upgrade", url).returncode == 0
+
+
+def test_migrate_upgrade_adopts_baseline_database():
+    url = f"sqlite:///{os.path.join(DB_DIR, 'baseline.db')}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, username, role) VALUES (1, 'old', 'admin')"))
+        conn.execute(text("""
+            INSERT INTO tasks (title, status, assignee_id, creator_id, created_at, updated_at) VALUES
+                ('a', 'todo', 1, 1, '2024-01-05 10:00:00.000000', '2024-01-05 10:00:00.000000'),
+                ('b', 'todo', 1, 1, '2024-01-20 10:00:00.000000', '2024-01-20 10:00:00.000000'),
+                ('c', 'done', NULL, 1, '2024-02-01 00:00:00.000000', '2024-02-01 00:00:00.000000')
+        """))
+
+    upgraded = migrate("upgrade", url)
+    assert upgraded.returncode == 0, upgraded.stderr
+    assert migrate("check", url).returncode == 0
+
+    inspector = inspect(engine)
+    assert {"ix_tasks_created_at_status", "ix_tasks_assignee_id_created_at", "ix_tasks_created_at_id"} <= {
+        index["name"] for index in inspector.get_indexes("tasks")
+    }
+    assert {"ix_activity_logs_created_at", "ix_activity_logs_task_id_created_at"} <= {
+        index["name"] for index in inspector.get_indexes("activity_logs")
+    }
+    with engine.connect() as conn:
+        stats = conn.execute(text(
+            "SELECT month, status, assignee_id, count FROM task_month_stats ORDER BY month, status"
+        )).all()
+    assert [tuple(row) for row in stats] == [("2024-01-01", "todo", 1, 2), ("2024-02-01", "done", 0, 1)]
+
+    # 書き込み（ロールアップの upsert を含む）が通る
+    created = run(["-c", (
+        "from app.db import SessionLocal\n"
+        "from app.schemas import TaskCreate\n"
+        "from app.tasks.service import create_task\n"
+        "print(create_task(SessionLocal(), 1, TaskCreate(title='after upgrade', status='todo')).id)\n"
+    )], url)
+    assert created.returncode == 0, created.stderr
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT SUM(count) FROM task_month_stats")).scalar() == 4
+    engine.dispose()
+
+
+def test_migrate_upgrade_adopts_create_all_database():
+    # 移行が入る前の create_all() で、今のモデルのまま作られた DB（0002 / 0003 の中身も全部ある）
+    from app.db import Base
+    import app.models  # noqa: F401
+
+    url = f"sqlite:///{os.path.join(DB_DIR, 'create_all.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    upgraded = migrate("upgrade", url)
+    assert upgraded.returncode == 0, upgraded.stderr
+    assert migrate("check", url).returncode == 0
+
+
+def test_ready_at_head(client):
+    from app.migrate import head_revision
+
+    r = client.get("/health/ready")
+    assert r.status_code == 200
+    assert r.json()["startup"]["schema_revision"] == head_revision()
+
+
+def test_tasks_and_logs(client, headers):
+    task = client.post("/tasks/", json={"title": "sqlite task", "status": "todo"}, headers=headers).json()
+    created = task["created_at"]
+    year, month = int(created[:4]), int(created[5:7])
+
+    page = client.get(f"/tasks/?year={year}&month={month}", headers=headers).json()
+    assert task["id"] in [t["id"] for t in page["items"]]
+
+    r = client.put(f"/tasks/{task['id']}", json={"title": "renamed", "status": "done"}, headers=headers)
+    assert r.status_code == 200 and r.json()["status"] == "done"
+
+    r = client.post("/logs/batch", json={"events": [{"task_id": task["id"], "action_type": "note", "detail": "hi"}]}, headers=headers)
+    assert r.status_code == 202
+
+    # ログは write-behind：フラッシュを待つ
+    deadline = time.monotonic() + 10
+    while True:
+        logs = client.get(f"/logs/?task_id={task['id']}", headers=headers).json()["items"]
+        if any(log["action_type"] == "note" for log in logs) or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert any(log["action_type"] == "note" for log in logs)
+
+    r = client.post("/tasks/bulk", json={"operations": [{"op": "delete", "id": task["id"]}]}, headers=headers)
+    assert r.json()["results"][0]["ok"]
+    assert client.get(f"/tasks/{task['id']}", headers=headers).status_code == 404
+
+
+def test_seed_and_reset_jobs(client, headers):
+    job = client.post("/tasks/seed/50", headers=headers).json()
+    assert wait_job(client, headers, job)["status"] == "succeeded"
+
+    assert client.get("/kpi/range", headers=headers).json()["total"] >= 50
+
+    job = client.delete("/tasks/reset", headers=headers).json()
+    assert wait_job(client, headers, job)["status"] == "succeeded"
+    assert client.get("/kpi/range", headers=headers).json()["total"] == 0
+
+
+def test_log_pages_match_their_schema(client, headers):
+    from app.schemas import ActivityLogPage, ActivityLogSearchPage
+
+    task = client.post("/tasks/", json={"title": "schema task"}, headers=headers).json()
+    r = client.post("/logs/batch", json={"events": [{"task_id": task["id"], "action_type": "note", "detail": "plum"}]}, headers=headers)
+    assert r.status_code == 202
+
+    deadline = time.monotonic() + 10
+    while True:
+        page = client.get(f"/logs/by-task/{task['id']}?expand=user,task", headers=headers).json()
+        if any(log["action_type"] == "note" for log in page["items"]) or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+
+    log = ActivityLogPage.model_validate(page).items[0]
+    assert log.user.username == "admin"
+    assert (log.task.id, log.task.title) == (task["id"], "schema task")
+    ActivityLogPage.model_validate(client.get(f"/logs/?task_id={task['id']}&expand=task", headers=headers).json())
+    hits = client.get("/logs/search", params={"q": "plum"}, headers=headers).json()
+    assert ActivityLogSearchPage.model_validate(hits).items[0].rank > 0
+
+    paths = client.get("/openapi.json").json()["paths"]
+    for path, schema in (("/logs/", "ActivityLogPage"), ("/logs/by-task/{task_id}", "ActivityLogPage"),
+                         ("/logs/search", "ActivityLogSearchPage")):
+        body = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert body["$ref"].endswith(f"/{schema}")
@@ -0,0 +1,141 @@
+"""
+The live feed (/logs/stream, /logs/stream/ws): authentication by the
+Authorization header or a one-time ticket, delivery of log / kpi / resync
+events, the types filter, and what a client that falls behind receives.
+"""
+import asyncio
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.stream import StreamHub, resync_event
+
+
+def ticket(client, headers) -> str:
+    r = client.post("/logs/stream-ticket", headers=headers)
+    assert r.status_code == 200 and r.json()["expires_in"] > 0
+    return r.json()["ticket"]
+
+
+def test_ticket_opens_one_stream(client, headers):
+    t = ticket(client, headers)
+    with client.websocket_connect(f"/logs/stream/ws?types=log&ticket={t}") as ws:
+        assert ws.receive_json() == {"type": "ready", "data": {"types": ["log"]}}
+
+    # 2 回目は使えない
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect(f"/logs/stream/ws?ticket={t}") as ws:
+            ws.receive_json()
+    assert e.value.code == 1008
+    assert client.get(f"/logs/stream?ticket={t}").status_code == 401
+
+
+def test_stream_rejects_tokens_in_the_url(client, headers):
+    token = headers["Authorization"].split()[1]
+    assert client.get(f"/logs/stream?access_token={token}").status_code == 401
+    assert client.get("/logs/stream?ticket=nope").status_code == 401
+    assert client.post("/logs/stream-ticket").status_code in (401, 403)
+
+
+def test_expired_ticket_is_rejected(client, headers, monkeypatch):
+    from app.logs import tickets
+
+    monkeypatch.setattr(tickets, "TTL", -1)
+    t = client.post("/logs/stream-ticket", headers=headers).json()["ticket"]
+    assert client.get(f"/logs/stream?ticket={t}").status_code == 401
+
+
+def receive_until(ws, done, timeout=10):
+    # ping を読み飛ばし、done(受け取ったもの) が真になるまで受け取る
+    seen = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        e = ws.receive_json()
+        if e["type"] == "ping":
+            continue
+        seen.append(e)
+        if done(seen):
+            return seen
+    raise AssertionError(f"events so far: {seen}")
+
+
+def find(seen, type_, match):
+    return next((e["data"] for e in seen if e["type"] == type_ and match(e["data"])), None)
+
+
+@pytest.fixture
+def fast_heartbeat(monkeypatch):
+    from app.stream import stream_hub
+
+    monkeypatch.setattr(stream_hub, "heartbeat", 0.05)
+
+
+def test_ws_delivers_logs_and_kpi_deltas(client, headers, fast_heartbeat):
+    with client.websocket_connect("/logs/stream/ws?types=log,kpi", headers=headers) as ws:
+        assert ws.receive_json()["type"] == "ready"
+        task = client.post("/tasks/", json={"title": "streamed"}, headers=headers).json()
+
+        month = task["created_at"][:7]
+        is_log = lambda d: d["task_id"] == task["id"]
+        is_kpi = lambda d: d["month"] == month
+        seen = receive_until(ws, lambda seen: find(seen, "log", is_log) and find(seen, "kpi", is_kpi))
+
+        log = find(seen, "log", is_log)
+        assert (log["action_type"], log["detail"]) == ("task_created", "streamed")
+        assert {"status": "todo", "assignee_id": None, "delta": 1} in find(seen, "kpi", is_kpi)["deltas"]
+
+
+def test_types_filter_still_gets_resync(client, headers, fast_heartbeat):
+    from app.tasks import hooks
+
+    with client.websocket_connect("/logs/stream/ws?types=kpi", headers=headers) as ws:
+        assert ws.receive_json() == {"type": "ready", "data": {"types": ["kpi"]}}
+        client.post("/tasks/", json={"title": "not a log subscriber"}, headers=headers)
+        hooks.notify_reset()
+
+        seen = receive_until(ws, lambda seen: seen[-1]["type"] == "resync")
+        assert seen[-1]["data"] == {"reason": "reset"}
+        assert all(e["type"] in ("kpi", "resync") for e in seen)
+
+
+def test_unknown_types_are_rejected(client, headers):
+    assert client.get("/logs/stream?types=log,bogus", headers=headers).status_code == 400
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect("/logs/stream/ws?types=bogus", headers=headers) as ws:
+            ws.receive_json()
+    assert e.value.code == 1008
+
+
+def log(n):
+    return {"type": "log", "data": {"id": n}}
+
+
+def test_slow_subscriber_gets_one_resync():
+    async def main():
+        hub = StreamHub("memory", max_queue=3, overflow="resync")
+        sub = hub.subscribe({"log"})
+        hub._dispatch([log(n) for n in range(10)])
+
+        # 溢れた時点で溜まっていた分は捨て、resync を 1 つ
+        events = [await sub.get(1) for _ in range(sub.queue.qsize())]
+        assert events[0] == resync_event("overflow")
+        assert all(e["type"] == "log" for e in events[1:])
+        assert hub.overflows >= 1
+        hub.unsubscribe(sub)
+
+    asyncio.run(main())
+
+
+def test_slow_subscriber_is_told_how_many_were_dropped():
+    async def main():
+        hub = StreamHub("memory", max_queue=3, overflow="drop")
+        sub = hub.subscribe({"log"})
+        hub._dispatch([log(n) for n in range(10)])
+
+        assert await sub.get(1) == {"type": "dropped", "data": {"count": 7}}
+        assert [(await sub.get(1))["data"]["id"] for _ in range(3)] == [0, 1, 2]
+        with pytest.raises(asyncio.TimeoutError):
+            await sub.get(0.01)
+
+    asyncio.run(main())
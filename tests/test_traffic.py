@@ -0,0 +1,184 @@
+"""
+Traffic recording (app/traffic.py) and replay (bench/replay.py): what a
+trace keeps and masks, sampling and the bounded queue, and how replay
+rewrites credentials and scores responses.
+"""
+import json
+import threading
+from argparse import Namespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.traffic import TrafficRecorder, TrafficRecorderMiddleware, sanitize, sanitize_query
+from bench.replay import Results, closed_loop, load_http_file, prepare
+
+
+def test_sanitize_masks_credentials_and_text():
+    body = {
+        "username": "alice",
+        "password": "hunter2",
+        "email": "alice@example.com",
+        "status": "done",
+        "due_date": "2024-03-01",
+        "assignee_id": 3,
+        "archived": False,
+        "tags": ["urgent", "q1"],
+    }
+    assert sanitize(body) == {
+        "username": "xxxxx",
+        "password": "***",
+        "email": "***",
+        "status": "done",
+        "due_date": "2024-03-01",
+        "assignee_id": 3,
+        "archived": False,
+        "tags": ["xxxxxx", "xx"],
+    }
+    assert sanitize({"title": "a" * 1000})["title"] == "x" * 256
+
+
+def test_sanitize_query_keeps_what_replay_needs():
+    query = "year=2024&month=3&limit=50&cursor=abc.12&q=secret+plan&access_token=t&types=log,kpi&done=true"
+    assert dict(p.split("=", 1) for p in sanitize_query(query).split("&")) == {
+        "year": "2024",
+        "month": "3",
+        "limit": "50",
+        "cursor": "abc.12",
+        "q": "xxxxxxxxxxx",
+        "access_token": "%2A%2A%2A",
+        "types": "log%2Ckpi",
+        "done": "true",
+    }
+
+
+def recorded_app(recorder):
+    app = FastAPI()
+
+    @app.post("/items/{item_id}")
+    async def create(item_id: int, payload: dict):
+        return {"id": item_id}
+
+    app.add_middleware(TrafficRecorderMiddleware, recorder=recorder)
+    return app
+
+
+def read_traces(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_middleware_writes_sanitized_traces(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    recorder = TrafficRecorder(str(path), max_body=100)
+    recorder.start()
+    with TestClient(recorded_app(recorder)) as client:
+        client.post("/items/7?q=hello", json={"password": "p", "status": "todo"},
+                    headers={"Authorization": "Bearer abc"})
+        client.post("/items/8", json={"title": "y" * 200})
+    recorder.stop()
+
+    first, second = read_traces(path)
+    assert first["method"] == "POST"
+    assert first["path"] == "/items/7"
+    assert first["route"] == "/items/{item_id}"
+    assert first["query"] == "q=xxxxx"
+    assert first["auth"] is True
+    assert first["body"] == {"password": "***", "status": "todo"}
+    assert first["status"] == 200
+    assert "abc" not in path.read_text()
+
+    # max_body を超えた本文は大きさだけ
+    assert second["auth"] is False
+    assert second["body"]["_truncated"] > 100
+    assert recorder.stats()["recorded"] == 2
+
+
+def test_sampling_and_full_queue_drop(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    recorder = TrafficRecorder(str(path), sample_rate=0.0)
+    recorder.start()
+    with TestClient(recorded_app(recorder)) as client:
+        for i in range(20):
+            client.post(f"/items/{i}", json={})
+    recorder.stop()
+    assert read_traces(path) == []
+
+    # 書き込みスレッドを起こさずに積む：上限を超えた分は捨てて数える
+    recorder = TrafficRecorder(str(path), max_queue=2)
+    for i in range(5):
+        recorder.offer({"n": i})
+    assert recorder.stats()["queued"] == 2
+    assert recorder.stats()["dropped"] == 3
+
+
+def test_prepare_substitutes_credentials():
+    args = Namespace(url="http://server", username="bench", password="pw")
+    trace = {"method": "POST", "path": "/auth/login", "query": "",
+             "body": {"username": "xxxxx", "password": "***"}}
+    assert prepare(trace, args) == ("POST", "http://server/auth/login", {"username": "bench", "password": "pw"})
+
+    # 大きさしか残っていない本文は送らない
+    trace = {"method": "POST", "path": "/tasks/", "query": "limit=5", "body": {"_truncated": 99999}}
+    assert prepare(trace, args) == ("POST", "http://server/tasks/?limit=5", None)
+
+
+def test_load_http_file(tmp_path):
+    path = tmp_path / "requests.http"
+    path.write_text(
+        "@BASE = http://localhost:8000\n"
+        "@ID = 12\n"
+        "### login\n"
+        "POST {{BASE}}/auth/login\n"
+        "Content-Type: application/json\n"
+        "\n"
+        '{"username": "u", "password": "p"}\n'
+        "### task\n"
+        "GET {{BASE}}/tasks/{{ID}}?expand=logs\n"
+        "Authorization: Bearer {{TOKEN}}\n",
+        encoding="utf-8",
+    )
+    login, task = load_http_file(str(path))
+
+    assert (login["method"], login["path"], login["auth"]) == ("POST", "/auth/login", False)
+    assert login["body"] == {"username": "u", "password": "p"}
+    assert (task["method"], task["path"], task["query"], task["auth"]) == ("GET", "/tasks/12", "expand=logs", True)
+    assert task["body"] is None
+
+
+def test_replay_scores_errors_and_mismatches():
+    # /ok は 200、/missing は 404、それ以外は 500
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = {"/ok": 200, "/missing": 404}.get(self.path, 500)
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        args = Namespace(url=f"http://127.0.0.1:{server.server_address[1]}", username="u", password="p",
+                         concurrency=3, timeout=5)
+        traces = (
+            [{"method": "GET", "path": "/ok", "route": "/ok", "status": 200}] * 6
+            + [{"method": "GET", "path": "/missing", "route": "/missing", "status": 200}] * 2
+            + [{"method": "GET", "path": "/boom", "route": "/boom", "status": 200}] * 2
+        )
+        results = Results()
+        closed_loop(traces, args, "token", results)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    report = results.report(1.0)
+    assert report["overall"]["requests"] == 10
+    assert report["overall"]["error_rate"] == 0.2
+    assert report["overall"]["non_2xx_rate"] == 0.4
+    assert report["routes"]["GET /ok"]["mismatch_rate"] == 0.0
+    assert report["routes"]["GET /missing"]["mismatch_rate"] == 1.0
+    assert report["routes"]["GET /boom"]["error_rate"] == 1.0